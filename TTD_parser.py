@@ -1,12 +1,99 @@
 import asyncio
+import json
 import os.path
 import re
 from collections import defaultdict
-
-import aiohttp
-import aiohttp.client_exceptions
-import biothings_client
-from biothings.utils.dataload import tabfile_feeder
+from functools import cached_property
+
+from ttd_cache import CACHE_ENABLED, JobCheckpoint, MappingCache, get_cache_path
+from ttd_columnar import (
+    DRUG_TARGET_COLUMNS,
+    extract_activities,
+    extract_biomarker_names,
+    read_tab_columns,
+    read_xlsx_columns,
+)
+from ttd_dedup import FingerprintSet
+from ttd_disease import resolve_icd9_mondo
+from ttd_http import AsyncHttpClient, HttpRequestError
+from ttd_incremental import INCREMENTAL
+from ttd_metrics import Progress, metrics
+from ttd_reader import BlockRecordReader, get_data_size, get_source_file, iter_tab_rows, read_shard
+from ttd_sort import external_sort
+from ttd_staging import STAGING
+
+# base url of the uniprot REST API, e.g. a local stand-in of ttd_benchmark
+UNIPROT_URL = os.environ.get("TTD_UNIPROT_URL", "https://rest.uniprot.org").rstrip("/")
+# number of uniprot ac packed into one idmapping job, 0 falls back to one job per ac
+UNIPROT_BATCH_SIZE = int(os.environ.get("TTD_UNIPROT_BATCH_SIZE", 1000))
+# new rounds of the uniprot ac of failed idmapping jobs before the build fails
+UNIPROT_RETRY_ROUNDS = int(os.environ.get("TTD_UNIPROT_RETRY_ROUNDS", 2))
+# uniprot ac still missing after the retry rounds, written to the data folder
+UNIPROT_FAILURE_REPORT = "ttd_uniprot_failures.json"
+# number of worker processes of load_data, 1 runs the loaders sequentially in the uploader process
+WORKERS = int(os.environ.get("TTD_WORKERS", 1))
+
+
+# key tables of the BlockRecordReader of the TTD text files, {key: field name}
+UNIPROT_AC_FIELDS = {"TARGETID": "ttd_target_id", "UNIPROID": "uniprot_ac"}
+TARGET_INFO_FIELDS = {
+    "TARGETID": "ttd_target_id",
+    "TARGTYPE": "target_type",
+    "BIOCLASS": "bioclass",
+    "TARGNAME": "name",
+}
+DRUG_MAPPING_FIELDS = {
+    "TTDDRUID": "ttd_drug_id",
+    "DRUGNAME": "name",
+    "PUBCHCID": "pubchem_compound",
+    "ChEBI_ID": "chebi",
+}
+DRUG_DISEASE_FIELDS = {"TTDDRUID": "drug_id", "DRUGNAME": "drug_name", "INDICATI": "indication"}
+TARGET_DISEASE_FIELDS = {"TARGETID": "targ_id", "TARGNAME": "targ_name", "INDICATI": "indication"}
+# INDICATI value of P1-06, e.g. "Lung cancer [ICD-11: 2C25]", split by one match of its named groups.
+# Every group takes the same part as the str.split() calls of the former parser, independently of the others,
+# so the disease is matched in a lookahead: a ":" in the disease name moves the icd11, not the disease
+INDICATION_PATTERN = re.compile(
+    r"""
+    (?=(?P<disease>[^[]*))  # disease: the text before the first "["
+    [^:]*:                  # everything up to the first ":", e.g. "Lung cancer [ICD-11:"
+    (?P<icd11>[^:\]]*)      # icd11: the text after the first ":" up to the next ":" or "]"
+    """,
+    re.VERBOSE,
+)
+# INDICATI value of P1-05, e.g. "Lung cancer [ICD-11: 2C25] Phase 3", the trial status comes after the "]"
+DRUG_INDICATION_PATTERN = re.compile(
+    r"""
+    (?=[^\]]*\](?P<status>[^\]]*))  # status: the text after the first "]" up to the next "]"
+    """ + INDICATION_PATTERN.pattern,
+    re.VERBOSE,
+)
+
+
+# errors of one idmapping job, the job is recorded as failed and the other jobs go on
+JOB_ERRORS = (HttpRequestError, RuntimeError, ValueError, KeyError)
+
+
+class UniprotMappingError(Exception):
+    """raised when uniprot ac are still not mapped after all retry rounds"""
+
+
+def split_uniprot_ac(uniprot_id):
+    """uniprot ac of a UNIPROID value of P1-01-TTD_target_download.txt
+
+    :param uniprot_id: UNIPROID value, e.g. "VDR_HUMAN" or "P11473; Q12345"
+    :return: uniprot ac str or list of uniprot ac
+    """
+    delimiter_pattern = r"[;/-]"
+    if ";" in uniprot_id or "/" in uniprot_id or "-" in uniprot_id and "(" not in uniprot_id:
+        uniprot_ac = re.split(delimiter_pattern, uniprot_id)
+        return [item.strip() for item in uniprot_ac]
+    elif "(" in uniprot_id:
+        uniprot_ac = ""
+        for ac in uniprot_id.split("(")[0]:
+            uniprot_ac = ac.strip()
+        return uniprot_ac
+    return uniprot_id
 
 
 class UniprotJobIDs:
@@ -21,7 +108,8 @@ class UniprotJobIDs:
     def __init__(self, file_path):
         self.file_path = file_path
         self.job_ids = []
-        self.api_url = "https://rest.uniprot.org"
+        self.failed = []
+        self.api_url = UNIPROT_URL
 
     def get_uniprot_ac(self):
         """obtain uniprot ac information from "P1-01-TTD_target_download.txt"
@@ -29,64 +117,73 @@ class UniprotJobIDs:
 
         :return: dictionary object
         """
-        uniprot_info_file = os.path.join(self.file_path, "P1-01-TTD_target_download.txt")
-        assert os.path.exists(uniprot_info_file)
-
-        ac_dict = None
-        for line in tabfile_feeder(uniprot_info_file, header=40):
-            if line[1].startswith("TARGETID"):
-                ac_dict = {"ttd_target_id": line[2]}
-            elif "UNIPROID" in line[1]:
-                delimiter_pattern = r"[;/-]"
-                if ";" in line[2] or "/" in line[2] or "-" in line[2] and "(" not in line[2]:
-                    uniprot_ac = re.split(delimiter_pattern, line[2])
-                    uniprot_ac = [item.strip() for item in uniprot_ac]
-                    ac_dict["uniprot_ac"] = uniprot_ac
-                elif "(" in line[2]:
-                    for ac in line[2].split("(")[0]:
-                        uniprot_ac = ac.strip()
-                        ac_dict["uniprot_ac"] = uniprot_ac
-                else:
-                    ac_dict["uniprot_ac"] = line[2]
+        uniprot_info_file = get_source_file(self.file_path, "P1-01-TTD_target_download.txt")
 
-                if ac_dict:
-                    yield ac_dict
+        reader = BlockRecordReader(uniprot_info_file, "TARGETID", UNIPROT_AC_FIELDS)
+        for record in reader:
+            targ_id = record[0][1]
+            for _, uniprot_id in record[1:]:
+                yield {"ttd_target_id": targ_id, "uniprot_ac": split_uniprot_ac(uniprot_id)}
 
-    def get_tasks(self, session):
-        """generate asyncio co-routine tasks
-        to request jobIDs from "https://rest.uniprot.org/idmapping/run"
+    def get_accessions(self):
+        """collect the unique uniprot ac from "P1-01-TTD_target_download.txt"
 
-        :param session: aiohttp.ClientSession used in get_jobIDs() function
-        :return: asyncio co-routine tasks
+        :return: sorted list of unique uniprot ac
         """
-        tasks = []
         ac_l = []
-        ac_info = self.get_uniprot_ac()
-        for ac_d in ac_info:
+        for ac_d in self.get_uniprot_ac():
             if isinstance(ac_d["uniprot_ac"], list):
-                for ac in ac_d["uniprot_ac"]:
-                    ac_l.append(ac)
+                ac_l.extend(ac_d["uniprot_ac"])
             else:
                 ac_l.append(ac_d["uniprot_ac"])
+        return sorted(set(ac_l))
+
+    async def submit_job(self, client, ac):
+        """submit the idmapping job of one uniprot ac
+
+        :param client: ttd_http.AsyncHttpClient
+        :param ac: uniprot ac
+        :return: jobID json output {"jobId": "id"}
+        """
+        data = {"from": "UniProtKB_AC-ID", "to": "UniProtKB", "ids": ac}
+        response = await client.post(f"{self.api_url}/idmapping/run", data=data)
+        return response.json()
 
-        ac_l = set(ac_l)
-        for ac in ac_l:
-            data = {"from": "UniProtKB_AC-ID", "to": "UniProtKB", "ids": ac}
-            tasks.append(asyncio.create_task(session.post(f"{self.api_url}/idmapping/run", data=data)))
+    def get_tasks(self, client, accessions=None):
+        """generate asyncio co-routine tasks
+        to request jobIDs from "https://rest.uniprot.org/idmapping/run"
+
+        :param client: ttd_http.AsyncHttpClient used in get_jobIDs() function
+        :param accessions: uniprot ac to submit, defaults to all uniprot ac of the source file
+        :return: asyncio co-routine tasks
+        """
+        tasks = []
+        for ac in accessions if accessions is not None else self.get_accessions():
+            tasks.append(asyncio.create_task(self.submit_job(client, ac)))
         return tasks
 
-    async def get_jobIds(self):
+    async def get_jobIds(self, client=None, accessions=None):
         """obtain uniprot jobIDs
         from "https://rest.uniprot.org/idmapping/run"
+        the uniprot ac whose submission failed after all retries are collected in failed with their error
+
+        :param client: shared ttd_http.AsyncHttpClient, a new one is opened if not given
+        :param accessions: uniprot ac to submit, defaults to all uniprot ac of the source file
         """
-        connector = aiohttp.TCPConnector(verify_ssl=False)
-        # semaphore = asyncio.Semaphore(100)  # limit co-current tasks to 100
-        # async with semaphore:
-        async with aiohttp.ClientSession(connector=connector) as session:
-            tasks = self.get_tasks(session)
-            responses = await asyncio.gather(*tasks)
-            for response in responses:
-                self.job_ids.append(await response.json())
+        if client is None:
+            async with AsyncHttpClient(verify_ssl=False) as client:
+                return await self.get_jobIds(client, accessions)
+
+        if accessions is None:
+            accessions = self.get_accessions()
+        results = await asyncio.gather(*self.get_tasks(client, accessions), return_exceptions=True)
+        for ac, result in zip(accessions, results):
+            if isinstance(result, JOB_ERRORS):
+                self.failed.append((ac, result))
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                self.job_ids.append(result)
 
     def run_async_task_job_ids(self):
         """execute get_jobIDs() when called and obtain jobID json output
@@ -108,60 +205,366 @@ class MappedUniprotKbs:
     def __init__(self, job_ids):
         self.job_ids = job_ids
         self.uniprot_ac_kb = []
-        self.api_url = "https://rest.uniprot.org"
+        self.no_match = []
+        self.failed = []
+        self.api_url = UNIPROT_URL
 
-    def get_jobId_mapping_link(self, session):
+    def get_jobId_mapping_link(self, client):
         """get uniprot json output url using jobIDs for each request
 
-        :param session: asyncio task sessions for next get_mapped_uniprot_kbs function
+        :param client: ttd_http.AsyncHttpClient for next get_mapped_uniprot_kbs function
         :return: asyncio tasks for later use
         """
         tasks = []
         for d in self.job_ids:
             for job_id in d.values():
-                get_response = session.get(f"{self.api_url}/idmapping/uniprotkb/results/{job_id}", ssl=False)
+                get_response = client.get(
+                    f"{self.api_url}/idmapping/uniprotkb/results/{job_id}", raise_for_status=False
+                )
                 tasks.append(asyncio.create_task(get_response))
         return tasks
 
-    async def get_mapped_uniprot_kbs(self):
+    async def get_mapped_uniprot_kbs(self, client=None):
         """obtain mapped uniprot ac and kb IDs
+        the client bounds the concurrent requests and retries failed ones,
+        the jobIDs whose results still cannot be fetched are collected in failed with their error
+        instead of dropping the record
 
+        :param client: shared ttd_http.AsyncHttpClient, a new one is opened if not given
         :return: asyncio object contains list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
         """
-        connector = aiohttp.TCPConnector(verify_ssl=False)
-        no_match = []
-        # semaphore = asyncio.Semaphore(100)  # limit co-current tasks to 100
-        # async with semaphore:
-        async with aiohttp.ClientSession(
-            trust_env=True, timeout=aiohttp.ClientTimeout(total=300), connector=connector
-        ) as session:
-            tasks = self.get_jobId_mapping_link(session)
-            batch_size = 10
-            task_batches = [tasks[i : i + batch_size] for i in range(0, len(tasks), batch_size)]
-
-            for batch in task_batches:
-                batch_result = await asyncio.gather(*batch)
-                for response in batch_result:
-                    try:
-                        results = await response.json()
-                        if "messages" in results:
-                            no_match.append(results["url"])
-                            # print(f"{results['url']} results cannot be found on uniprot.")
-                        else:
-                            try:
-                                if results["results"]:
-                                    ac = results.get("results")[0]["from"]
-                                    kb = results.get("results")[0]["to"]["primaryAccession"]
-                                    mapped_dict = {"uniprot_kb": kb, "uniprot_ac": ac}
-                                    self.uniprot_ac_kb.append(mapped_dict)
-                            except IndexError:
-                                no_match.append(results.get("failedIds"))
-                                # print(f"{results.get('failedIds')} cannot be found on uniprot.")
-                    except (
-                        aiohttp.client_exceptions.ClientOSError,
-                        aiohttp.client_exceptions.ServerDisconnectedError,
-                    ):
-                        await asyncio.sleep(5)  # To avoid ClientConnectorError: 443 [Operation timed out]
+        if client is None:
+            async with AsyncHttpClient(verify_ssl=False) as client:
+                return await self.get_mapped_uniprot_kbs(client)
+
+        job_ids = [job_id for d in self.job_ids for job_id in d.values()]
+        responses = await asyncio.gather(*self.get_jobId_mapping_link(client), return_exceptions=True)
+        for job_id, response in zip(job_ids, responses):
+            if isinstance(response, JOB_ERRORS):
+                self.failed.append((job_id, response))
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                self.uniprot_ac_kb.extend(self.parse_results(response.json()))
+
+    async def get_job_results(self, client, job_id):
+        """obtain the mapped uniprot ac and kb ID of one jobID
+
+        :param client: ttd_http.AsyncHttpClient
+        :param job_id: uniprot jobID
+        :return: list with zero or one {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        response = await client.get(f"{self.api_url}/idmapping/uniprotkb/results/{job_id}", raise_for_status=False)
+        return self.parse_results(response.json())
+
+    def parse_results(self, results):
+        """parse the json output of one single ac idmapping job
+        jobs without a mapped kb ID are collected in no_match
+
+        :param results: uniprot json output
+        :return: list with zero or one {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        if "messages" in results:
+            metrics.count("uniprot.no_match")
+            self.no_match.append(results["url"])
+            return []
+        if not results.get("results"):
+            metrics.count("uniprot.no_match")
+            self.no_match.append(results.get("failedIds"))
+            return []
+        ac = results["results"][0]["from"]
+        kb = results["results"][0]["to"]["primaryAccession"]
+        return [{"uniprot_kb": kb, "uniprot_ac": ac}]
+
+
+class UniprotMappingPipeline:
+    """
+    The UniprotMappingPipeline object overlaps idmapping job submission with result retrieval
+    on one event loop: submitters put jobIDs on a bounded queue as soon as they arrive,
+    fetchers take them off and put the parsed mappings on a bounded result queue,
+    which is consumed as an async iterator
+
+    :param submit: coroutine function submit(item) returning the submitted job
+    :param fetch: async generator function fetch(job) yielding lists of mapped dicts
+    :param submitters: number of concurrent job submissions
+    :type submitters: int
+    :param fetchers: number of concurrent result fetchers
+    :type fetchers: int
+    :param queue_size: maximum number of queued jobIDs and result lists
+    :type queue_size: int
+    :param label: name of the pipeline in the progress lines
+    :type label: str
+
+    A job failing with one of JOB_ERRORS, after the retries of the http client, does not stop the other jobs:
+    its item is collected in failures with the error
+    """
+
+    _done = object()
+
+    def __init__(self, submit, fetch, submitters=4, fetchers=10, queue_size=100, label="uniprot idmapping"):
+        self.submit = submit
+        self.fetch = fetch
+        self.submitters = submitters
+        self.fetchers = fetchers
+        self.queue_size = queue_size
+        self.label = label
+        self.failures = []
+
+    async def iter_results(self, items):
+        """submit every item and yield the mapped dicts as soon as a job finished
+
+        :param items: list of idmapping job inputs (uniprot ac or batches of uniprot ac)
+        :return: async iterator of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        progress = Progress(self.label, len(items), "jobs")
+        items = iter(items)
+        job_queue = asyncio.Queue(self.queue_size)
+        result_queue = asyncio.Queue(self.queue_size)
+
+        def fail(item, error):
+            metrics.count("uniprot.failed_jobs")
+            self.failures.append((item, error))
+            progress.update()
+
+        async def submitter():
+            # all submitters share the same item iterator
+            for item in items:
+                try:
+                    job = await self.submit(item)
+                except JOB_ERRORS as e:
+                    fail(item, e)
+                else:
+                    await job_queue.put((item, job))
+
+        async def fetcher():
+            while (queued := await job_queue.get()) is not self._done:
+                item, job = queued
+                try:
+                    async for mapped_dicts in self.fetch(job):
+                        await result_queue.put(mapped_dicts)
+                except JOB_ERRORS as e:
+                    fail(item, e)
+                else:
+                    metrics.count("uniprot.jobs")
+                    progress.update()
+
+        async def run():
+            try:
+                fetcher_tasks = [asyncio.create_task(fetcher()) for _ in range(self.fetchers)]
+                try:
+                    await asyncio.gather(*(submitter() for _ in range(self.submitters)))
+                    for _ in fetcher_tasks:
+                        await job_queue.put(self._done)
+                    await asyncio.gather(*fetcher_tasks)
+                finally:
+                    for task in fetcher_tasks:
+                        task.cancel()
+            finally:
+                # wakes up the consumer also when a submitter or fetcher failed
+                await result_queue.put(self._done)
+
+        runner = asyncio.create_task(run())
+        try:
+            while (mapped_dicts := await result_queue.get()) is not self._done:
+                for mapped_dict in mapped_dicts:
+                    yield mapped_dict
+            await runner
+            progress.close()
+        finally:
+            runner.cancel()
+
+
+class UniprotBatchMapping:
+    """
+    The UniprotBatchMapping object packs many uniprot ac into one idmapping job
+    instead of submitting one job per ac (UniprotJobIDs + MappedUniprotKbs)
+    Each job is polled until it finishes and its paginated results are followed
+
+    :param api_url: base url of the uniprot REST API, can point at a local stand-in
+    :type api_url: str
+    :param batch_size: number of uniprot ac submitted in one idmapping job
+    :type batch_size: int
+    :param page_size: number of results requested per result page
+    :type page_size: int
+    :param poll_interval: seconds to wait between two job status requests
+    :type poll_interval: float
+    """
+
+    def __init__(self, api_url=UNIPROT_URL, batch_size=1000, page_size=500, poll_interval=3):
+        self.api_url = api_url.rstrip("/")
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+
+    def get_batches(self, accessions):
+        """split the uniprot ac into batches of batch_size
+
+        :param accessions: list of uniprot ac
+        :return: list of uniprot ac lists
+        """
+        return [accessions[i : i + self.batch_size] for i in range(0, len(accessions), self.batch_size)]
+
+    async def submit_job(self, client, accessions):
+        """submit one idmapping job for a batch of uniprot ac
+
+        :param client: ttd_http.AsyncHttpClient
+        :param accessions: list of uniprot ac
+        :return: uniprot jobID
+        """
+        data = {"from": "UniProtKB_AC-ID", "to": "UniProtKB", "ids": ",".join(accessions)}
+        response = await client.post(f"{self.api_url}/idmapping/run", data=data)
+        return response.json()["jobId"]
+
+    async def wait_for_job(self, client, job_id):
+        """poll the job status until uniprot finished the idmapping job
+        uniprot redirects the status url to the result url once the job is finished
+
+        :param client: ttd_http.AsyncHttpClient
+        :param job_id: uniprot jobID
+        """
+        while True:
+            response = await client.get(f"{self.api_url}/idmapping/status/{job_id}", allow_redirects=False)
+            if response.status in (302, 303):
+                return
+
+            status = response.json()
+            job_status = status.get("jobStatus")
+            if job_status in ("NEW", "RUNNING"):
+                await asyncio.sleep(self.poll_interval)
+            elif job_status == "FINISHED" or "results" in status or "failedIds" in status:
+                return
+            else:
+                raise RuntimeError(f"Uniprot idmapping job {job_id} failed: {status}")
+
+    async def iter_results(self, client, job_id):
+        """wait for an idmapping job and follow its paginated results
+        only the first mapped kb of each uniprot ac is kept like in MappedUniprotKbs
+
+        :param client: ttd_http.AsyncHttpClient
+        :param job_id: uniprot jobID
+        :return: async iterator of one list of {"uniprot_kb": "kb", "uniprot_ac": "ac"} per result page
+        """
+        await self.wait_for_job(client, job_id)
+
+        seen_acs = set()
+        url = f"{self.api_url}/idmapping/uniprotkb/results/{job_id}"
+        params = {"format": "json", "fields": "accession", "size": self.page_size}
+        while url:
+            response = await client.get(url, params=params)
+            results = response.json()
+            if "messages" in results:
+                raise RuntimeError(f"Uniprot idmapping job {job_id} results cannot be found: {results['messages']}")
+
+            mapped_dicts = []
+            for result in results.get("results", []):
+                if result["from"] not in seen_acs:
+                    seen_acs.add(result["from"])
+                    mapped_dicts.append({"uniprot_kb": result["to"]["primaryAccession"], "uniprot_ac": result["from"]})
+            yield mapped_dicts
+
+            # the next page url already carries the query parameters
+            url = response.next_url()
+            params = None
+
+    async def iter_mapped_uniprot_kbs(self, accessions, client):
+        """map all uniprot ac to kb IDs with one idmapping job per batch,
+        results of a finished job are streamed while the other jobs are still running
+
+        :param accessions: list of uniprot ac
+        :param client: shared ttd_http.AsyncHttpClient
+        :return: async iterator of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        pipeline = UniprotMappingPipeline(
+            submit=lambda batch: self.submit_job(client, batch),
+            fetch=lambda job_id: self.iter_results(client, job_id),
+        )
+        async for mapped_dict in pipeline.iter_results(self.get_batches(list(accessions))):
+            yield mapped_dict
+        if pipeline.failures:
+            raise pipeline.failures[0][1]
+
+    async def get_mapped_uniprot_kbs(self, accessions, client=None):
+        """map all uniprot ac to kb IDs
+
+        :param accessions: list of uniprot ac
+        :param client: shared ttd_http.AsyncHttpClient, a new one is opened if not given
+        :return: list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        if client is None:
+            async with AsyncHttpClient() as client:
+                return await self.get_mapped_uniprot_kbs(accessions, client)
+        return [mapped_dict async for mapped_dict in self.iter_mapped_uniprot_kbs(accessions, client)]
+
+    def run(self, accessions):
+        """execute get_mapped_uniprot_kbs() when called
+
+        :param accessions: list of uniprot ac
+        :return: list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        return asyncio.run(self.get_mapped_uniprot_kbs(accessions))
+
+
+class UniprotCrosswalk:
+    """
+    The UniprotCrosswalk object indexes the uniprot ac of "P1-01-TTD_target_download.txt"
+    in both directions so ttd_target_id and uniprot ac can be looked up in O(1)
+    One uniprot ac can be listed by several targets and one target can list several uniprot ac
+    """
+
+    def __init__(self):
+        self.target_acs = {}
+        self.ac_targets = defaultdict(list)
+
+    @classmethod
+    def from_file(cls, file_path):
+        """build the crosswalk from a single parse of the target file
+
+        :param file_path: directory stores P1-01-TTD_target_download.txt file
+        :return: UniprotCrosswalk object
+        """
+        crosswalk = cls()
+        for ac_d in UniprotJobIDs(file_path).get_uniprot_ac():
+            uniprot_ac = ac_d["uniprot_ac"]
+            crosswalk.add(ac_d["ttd_target_id"], uniprot_ac if isinstance(uniprot_ac, list) else [uniprot_ac])
+        return crosswalk
+
+    def add(self, targ_id, uniprot_acs):
+        """link a ttd_target_id with its uniprot ac, empty and repeated ac are skipped
+
+        :param targ_id: ttd_target_id
+        :param uniprot_acs: list of uniprot ac
+        """
+        target_acs = self.target_acs.setdefault(targ_id, [])
+        for ac in uniprot_acs:
+            if ac and ac not in target_acs:
+                target_acs.append(ac)
+                self.ac_targets[ac].append(targ_id)
+
+    def get_accessions(self):
+        """
+        :return: sorted list of the unique uniprot ac
+        """
+        return sorted(self.ac_targets)
+
+    def get_target_ids(self):
+        """
+        :return: list of ttd_target_id with uniprot ac in source file order
+        """
+        return list(self.target_acs)
+
+    def get_uniprot_acs(self, targ_id):
+        """
+        :param targ_id: ttd_target_id
+        :return: list of uniprot ac of the target in source file order
+        """
+        return self.target_acs.get(targ_id, [])
+
+    def get_target_ids_for(self, ac):
+        """
+        :param ac: uniprot ac
+        :return: list of ttd_target_id listing the exact uniprot ac
+        """
+        return self.ac_targets.get(ac, [])
 
 
 class UniprotMapping:
@@ -175,48 +578,220 @@ class UniprotMapping:
 
     :param file_path: location of the uniprot source file "P1-01-TTD_target_download.txt"
     :type file_path: str
+    :param batch_size: number of uniprot ac per idmapping job, None submits one job per ac
+    :type batch_size: int
+    :param use_cache: look up the uniprot ac in the persistent mapping cache before requesting uniprot
+    :type use_cache: bool
+    :param retry_rounds: number of extra rounds submitting the uniprot ac of the failed jobs again
+    :type retry_rounds: int
+
+    With the cache enabled the submitted jobs are checkpointed and every finished job is written to the cache
+    right away, so a restarted build only requests the outstanding or failed uniprot ac
+    and fetches the jobs submitted before the interruption instead of submitting them again
+    The uniprot ac still failing after the retry rounds are written to UNIPROT_FAILURE_REPORT
+    and the build stops with UniprotMappingError instead of dropping their targets
     """
 
-    def __init__(self, file_path):
+    def __init__(
+        self, file_path, batch_size=UNIPROT_BATCH_SIZE, use_cache=CACHE_ENABLED, retry_rounds=UNIPROT_RETRY_ROUNDS
+    ):
         self.file_path = file_path
+        self.batch_size = batch_size
+        self.use_cache = use_cache
+        self.retry_rounds = retry_rounds
+        self.crosswalk = UniprotCrosswalk.from_file(file_path)
+
+    def get_batches(self, accessions):
+        """split the uniprot ac into the inputs of the idmapping jobs
+
+        :param accessions: list of uniprot ac
+        :return: list of uniprot ac lists, a single ac per list without batch_size
+        """
+        if not self.batch_size:
+            return [[ac] for ac in accessions]
+        return [accessions[i : i + self.batch_size] for i in range(0, len(accessions), self.batch_size)]
+
+    def get_jobs(self, accessions, checkpoint=None):
+        """idmapping jobs of the uniprot ac, the checkpointed jobs covering only requested ac are resumed
+
+        :param accessions: list of uniprot ac
+        :param checkpoint: ttd_cache.JobCheckpoint or None
+        :return: list of (list of uniprot ac, jobID of a resumed job or None)
+        """
+        jobs = []
+        pending = set(accessions)
+        if checkpoint is not None:
+            for acs, job_id in checkpoint.get_jobs():
+                if pending.issuperset(acs):
+                    jobs.append((acs, job_id))
+                    pending.difference_update(acs)
+        jobs.extend((acs, None) for acs in self.get_batches([ac for ac in accessions if ac in pending]))
+        return jobs
+
+    async def map_jobs(self, jobs, client, cache=None, checkpoint=None):
+        """run the idmapping jobs either batched or one job per ac,
+        in both modes job submission and result retrieval run as one pipeline
+        the results of a job are only passed on once all its pages are fetched,
+        then they are written to the cache and the job is removed from the checkpoint
+
+        :param jobs: list of (list of uniprot ac, jobID or None) from get_jobs()
+        :param client: shared ttd_http.AsyncHttpClient
+        :param cache: ttd_cache.MappingCache or None
+        :param checkpoint: ttd_cache.JobCheckpoint or None
+        :return: (list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}, list of ((list of uniprot ac, jobID), error))
+        """
+        job_ids_obj = UniprotJobIDs(self.file_path)
+        if self.batch_size:
+            batch_mapping = UniprotBatchMapping(api_url=job_ids_obj.api_url, batch_size=self.batch_size)
+            submitters = 4
+
+            async def submit_job(acs):
+                return await batch_mapping.submit_job(client, acs)
+
+            def iter_results(job_id):
+                return batch_mapping.iter_results(client, job_id)
+
+        else:
+            mapped_uniprot_obj = MappedUniprotKbs(job_ids_obj.job_ids)
+            submitters = client.limit_per_host
+
+            async def submit_job(acs):
+                return (await job_ids_obj.submit_job(client, acs[0]))["jobId"]
+
+            async def iter_results(job_id):
+                yield await mapped_uniprot_obj.get_job_results(client, job_id)
+
+        async def submit(job):
+            acs, job_id = job
+            if job_id is not None:
+                metrics.count("uniprot.resumed_jobs")
+                return job
+            job_id = await submit_job(acs)
+            if checkpoint is not None:
+                checkpoint.add_job(acs, job_id)
+            return acs, job_id
+
+        async def fetch(job):
+            acs, job_id = job
+            try:
+                pages = [mapped_dicts async for mapped_dicts in iter_results(job_id)]
+            except JOB_ERRORS:
+                # a failed or expired job is submitted again instead of being resumed
+                if checkpoint is not None:
+                    checkpoint.remove_job(acs)
+                raise
+
+            if cache is not None:
+                fetched_kbs = dict.fromkeys(acs)
+                for mapped_dicts in pages:
+                    for d in mapped_dicts:
+                        if fetched_kbs.get(d["uniprot_ac"]) is None:
+                            fetched_kbs[d["uniprot_ac"]] = d["uniprot_kb"]
+                cache.set_many(fetched_kbs)
+            if checkpoint is not None:
+                checkpoint.remove_job(acs)
+            for mapped_dicts in pages:
+                yield mapped_dicts
+
+        pipeline = UniprotMappingPipeline(submit=submit, fetch=fetch, submitters=submitters)
+        mapped_uniprot_kbs = [mapped_dict async for mapped_dict in pipeline.iter_results(jobs)]
+        return mapped_uniprot_kbs, pipeline.failures
+
+    async def map_uniprot_kbs(self, accessions, cache=None, checkpoint=None):
+        """map the uniprot ac to kb IDs through one shared ttd_http.AsyncHttpClient
+        every requested ac is written to the cache, unmapped ac as "not found"
+        the uniprot ac of the failed jobs are submitted again for up to retry_rounds rounds
+
+        :param accessions: list of uniprot ac
+        :param cache: ttd_cache.MappingCache or None
+        :param checkpoint: ttd_cache.JobCheckpoint or None
+        :return: (list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}, list of (list of uniprot ac, error) still failing)
+        """
+        mapped_uniprot_kbs = []
+        pending = accessions
+        async with AsyncHttpClient(verify_ssl=False) as client:
+            for round_n in range(self.retry_rounds + 1):
+                if round_n:
+                    print(f"Retrying {len(pending)} uniprot ac of failed jobs, round {round_n}/{self.retry_rounds}")
+                    metrics.count("uniprot.retry_rounds")
+                mapped, failures = await self.map_jobs(self.get_jobs(pending, checkpoint), client, cache, checkpoint)
+                mapped_uniprot_kbs.extend(mapped)
+                pending = sorted(ac for (acs, _), _ in failures for ac in acs)
+                if not pending:
+                    break
+        return mapped_uniprot_kbs, [(acs, error) for (acs, _), error in failures]
+
+    def report_failures(self, failures):
+        """write the uniprot ac still failing to UNIPROT_FAILURE_REPORT in the data folder
+        and stop the build, the report of an earlier failed build is removed once all ac are mapped
+
+        :param failures: list of (list of uniprot ac, error) from map_uniprot_kbs()
+        """
+        report_file = os.path.join(self.file_path, UNIPROT_FAILURE_REPORT)
+        if not failures:
+            if os.path.exists(report_file):
+                os.remove(report_file)
+            return
+
+        missing = sorted({ac for acs, _ in failures for ac in acs})
+        metrics.count("uniprot.missing", len(missing))
+        report = {
+            "missing": missing,
+            "jobs": [{"accessions": acs, "error": repr(error)} for acs, error in failures],
+        }
+        with open(report_file, "w") as out_f:
+            json.dump(report, out_f, indent=2)
+        raise UniprotMappingError(
+            f"{len(missing)} uniprot ac are not mapped after {self.retry_rounds} retry rounds, see {report_file}"
+        )
+
+    def get_mapped_uniprot_kbs(self, accessions):
+        """map the uniprot ac to kb IDs
+        cached results are used first, only the missing or expired uniprot ac are requested
+
+        :param accessions: list of uniprot ac
+        :return: list of {"uniprot_kb": "kb", "uniprot_ac": "ac"}
+        """
+        metrics.count("uniprot.accessions", len(accessions))
+        if not self.use_cache:
+            mapped_uniprot_kbs, failures = asyncio.run(self.map_uniprot_kbs(accessions))
+            self.report_failures(failures)
+            return mapped_uniprot_kbs
+
+        cache_path = get_cache_path(self.file_path)
+        with MappingCache(cache_path, "uniprot_kb") as cache, JobCheckpoint(cache_path, "uniprot_jobs") as checkpoint:
+            cached = cache.get_many(accessions)
+            mapped_uniprot_kbs = [{"uniprot_kb": kb, "uniprot_ac": ac} for ac, kb in cached.items() if kb]
+
+            failures = []
+            misses = [ac for ac in accessions if ac not in cached]
+            if misses:
+                fetched, failures = asyncio.run(self.map_uniprot_kbs(misses, cache, checkpoint))
+                mapped_uniprot_kbs.extend(fetched)
+
+        self.report_failures(failures)
+        return mapped_uniprot_kbs
 
     def run_async_tasks(self):
         """execute both jobIDs asyncio tasks
         and mapping uniprot ac_kb asyncio tasks
+        the mapped kb IDs are assigned to every ttd_target_id listing the uniprot ac,
+        in the order the uniprot ac are listed in the source file
 
         :return: list of dicts {"ttd_target_id":"id", "uniprot": "kb"}
         """
-        job_ids_obj = UniprotJobIDs(self.file_path)
-        job_ids_obj.run_async_task_job_ids()
-
-        mapped_uniprot_obj = MappedUniprotKbs(job_ids_obj.job_ids)
-        asyncio.run(mapped_uniprot_obj.get_mapped_uniprot_kbs())
-
-        mapped_uniprot_kbs = mapped_uniprot_obj.uniprot_ac_kb
-        unique_mapped_kbs = set()
-        filtered_mapped_kbs = []
-        for item in mapped_uniprot_kbs:
-            item_tuple = tuple(item.items())
-            if item_tuple not in unique_mapped_kbs:
-                unique_mapped_kbs.add(item_tuple)
-                filtered_mapped_kbs.append(item)
-
-        ac_info = UniprotJobIDs(self.file_path).get_uniprot_ac()
-        ac_dict = {d["ttd_target_id"]: d["uniprot_ac"] for d in ac_info}
-        final_list = []
-        for d in filtered_mapped_kbs:
-            for key, value in ac_dict.items():
-                if d["uniprot_ac"] in value:
-                    d["ttd_target_id"] = key
-
-        merged_uniprot_dict = defaultdict(list)
-        for d in filtered_mapped_kbs:
-            merged_uniprot_dict[d.get("ttd_target_id")].append(d["uniprot_kb"])
-
-        for key, value in merged_uniprot_dict.items():
-            output_dict = {"ttd_target_id": key, "uniprot": value}
-            output_dict["uniprot"] = list(set(output_dict["uniprot"]))
-            final_list.append(output_dict)
+        with metrics.stage("uniprot_mapping"):
+            ac_kb = {}
+            for d in self.get_mapped_uniprot_kbs(self.crosswalk.get_accessions()):
+                ac_kb.setdefault(d["uniprot_ac"], d["uniprot_kb"])
+
+            final_list = []
+            for targ_id in self.crosswalk.get_target_ids():
+                kbs = [ac_kb[ac] for ac in self.crosswalk.get_uniprot_acs(targ_id) if ac in ac_kb]
+                if kbs:
+                    final_list.append({"ttd_target_id": targ_id, "uniprot": list(dict.fromkeys(kbs))})
+            metrics.count("uniprot.mapped", len(ac_kb))
+            metrics.count("uniprot.mapped_targets", len(final_list))
         yield final_list
 
 
@@ -227,33 +802,22 @@ def get_target_info(file_path):
     Keyword arguments:
     file_path: directory stores P1-01-TTD_target_download.txt file
     """
-    target_info_file = os.path.join(file_path, "P1-01-TTD_target_download.txt")
-    assert os.path.exists(target_info_file)
+    target_info_file = get_source_file(file_path, "P1-01-TTD_target_download.txt")
 
-    target_info = None
     uniprot_class = UniprotMapping(file_path)
     uniprot_info = uniprot_class.run_async_tasks()
 
     for data in uniprot_info:
         uniprot_dict = {d["ttd_target_id"]: d for d in data}
-        for line in tabfile_feeder(target_info_file, header=40):
-            if line != ["", "", "", "", ""]:
-                if line[1].startswith("TARGETID"):
-                    if target_info:
-                        yield target_info
-                    if line[2] in uniprot_dict:
-                        target_info = {"ttd_target_id": line[2], "uniprotkb": uniprot_dict[line[2]]["uniprot"]}
-                    else:
-                        target_info = {"ttd_target_id": line[2]}
-                elif "TARGTYPE" in line[1]:
-                    target_info["target_type"] = line[2].lower()
-                elif "BIOCLASS" in line[1]:
-                    target_info["bioclass"] = line[2]
-                elif "TARGNAME" in line[1]:
-                    target_info["name"] = line[2]
-
-    if target_info:
-        yield target_info
+        for record in BlockRecordReader(target_info_file, "TARGETID", TARGET_INFO_FIELDS):
+            targ_id = record[0][1]
+            target_info = {"ttd_target_id": targ_id}
+            if targ_id in uniprot_dict:
+                target_info["uniprotkb"] = uniprot_dict[targ_id]["uniprot"]
+            target_info.update(record[1:])
+            if "target_type" in target_info:
+                target_info["target_type"] = target_info["target_type"].lower()
+            yield target_info
 
 
 def mapping_drug_id(file_path):
@@ -265,29 +829,16 @@ def mapping_drug_id(file_path):
     file_path: directory stores P1-03-TTD_crossmatching.txt file
     :return: dictionary {"ttd_drug_id": "id", "pubchem_cid": "", "chembi_id": ""}
     """
-    drug_mapping_file = os.path.join(file_path, "P1-03-TTD_crossmatching.txt")
-    assert os.path.exists(drug_mapping_file)
-
-    drug_mapping_info = None
-
-    for line in tabfile_feeder(drug_mapping_file, header=28):
-        if line != ["", "", ""]:  # empty lines in the txt file need to be removed
-            if line[1].startswith("TTDDRUID"):
-                if drug_mapping_info:
-                    yield drug_mapping_info
-                current_drug_id = line[2]
-                drug_mapping_info = {"ttd_drug_id": current_drug_id}
-            elif line[1].startswith("DRUGNAME"):
-                drug_mapping_info.update({"name": line[2]})
-            elif line[1].startswith("PUBCHCID"):
-                if ";" in line[2]:
-                    drug_mapping_info["pubchem_compound"] = [cid.strip() for cid in line[2].split(";")]
-                else:
-                    drug_mapping_info["pubchem_compound"] = line[2]
-            elif line[1].startswith("ChEBI_ID"):
-                drug_mapping_info["chebi"] = line[2].split(":")[1]
+    drug_mapping_file = get_source_file(file_path, "P1-03-TTD_crossmatching.txt")
 
-    if drug_mapping_info:
+    for record in BlockRecordReader(drug_mapping_file, "TTDDRUID", DRUG_MAPPING_FIELDS):
+        drug_mapping_info = dict(record)
+        if "pubchem_compound" in drug_mapping_info and ";" in drug_mapping_info["pubchem_compound"]:
+            drug_mapping_info["pubchem_compound"] = [
+                cid.strip() for cid in drug_mapping_info["pubchem_compound"].split(";")
+            ]
+        if "chebi" in drug_mapping_info:
+            drug_mapping_info["chebi"] = drug_mapping_info["chebi"].split(":")[1]
         yield drug_mapping_info
 
 
@@ -311,599 +862,1065 @@ def cleanup_icds(line, icd_prefix):
 def get_icd9_11_mondo_mapping(file_path):
     """map the icd9 to icd11 and mondo disease id
     using the input source file P1-08-Biomarker_disease.txt
+    icd9 codes are resolved through ttd_disease (cache, BioThings disease API or local MONDO snapshot)
 
     Keyword arguments:
     :param file_path: directory stores P1-08-Biomarker_disease.txt
     :return: dictionary with entire {icd11:mondo} ~ 43 key-value pairs
     """
-    biomarker_file = os.path.join(file_path, "P1-08-Biomarker_disease.txt")
-    assert os.path.exists(biomarker_file)
+    biomarker_file = get_source_file(file_path, "P1-08-Biomarker_disease.txt")
 
     icd9_11 = []
-    mondo_icd9_dis = biothings_client.get_client("disease")
-
-    for line in tabfile_feeder(biomarker_file, header=16):
-        if line:
-            icd9 = cleanup_icds(line[5], "ICD-9:")
-            icd11 = cleanup_icds(line[3], "ICD-11:")
-            if icd9 and icd11:
-                if isinstance(icd9, list):
-                    for item in icd9:
-                        icd9_11.append((icd11, item))
-                else:
-                    icd9_11.append((icd11, icd9))
 
-    icd9_11 = list(set(icd9_11))
-    icd9s = [icd9[1] for icd9 in icd9_11]
+    with metrics.stage("icd9_mondo_mapping"):
+        for line in iter_tab_rows(biomarker_file, header=16):
+            if line:
+                icd9 = cleanup_icds(line[5], "ICD-9:")
+                icd11 = cleanup_icds(line[3], "ICD-11:")
+                if icd9 and icd11:
+                    if isinstance(icd9, list):
+                        for item in icd9:
+                            icd9_11.append((icd11, item))
+                    else:
+                        icd9_11.append((icd11, icd9))
 
-    icd9_mondo = mondo_icd9_dis.querymany(icd9s, scopes="mondo.xrefs.icd9", fields="mondo.mondo")
-    icd9_mondo = {mondo_d["query"]: mondo_d["_id"] for mondo_d in icd9_mondo if "notfound" not in mondo_d}
+        # unique pairs in file order, the first icd9 of an icd11 wins independently of the hash seed,
+        # so the lookup fingerprinted by an incremental build is the same for the same file
+        icd9_11 = list(dict.fromkeys(icd9_11))
+        icd9s = [icd9[1] for icd9 in icd9_11]
 
-    icd11_mondo = {}
-    for icd11, icd9 in icd9_11:
-        if icd11 not in icd11_mondo and icd9 in icd9_mondo:
-            icd11_mondo[icd11] = icd9_mondo[icd9]
+        icd9_mondo = resolve_icd9_mondo(file_path, icd9s)
 
-    yield icd11_mondo
+        icd11_mondo = {}
+        for icd11, icd9 in icd9_11:
+            if icd11 not in icd11_mondo and icd9 in icd9_mondo:
+                icd11_mondo[icd11] = icd9_mondo[icd9]
+        metrics.count("icd11_mondo.mapped", len(icd11_mondo))
 
+    yield icd11_mondo
 
-def load_drug_dis_data(file_path):
-    """load data from P1-05-Drug_disease.txt file
-        and clean up the data
 
-    Keyword arguments:
-    file_path: directory stores 1-05-Drug_disease.txt file
+class Node:
+    """
+    The Node object is the canonical form of one target, drug, disease or biomarker node,
+    built once by the NodeRegistry and shared by all the edges referencing it
+
+    :param node_id: prefixed node id, e.g. "UniProtKB:P11473"
+    :type node_id: str
+    :param fields: (key, value) pairs following the id
+    :type fields: tuple
+    :param node_type: biolink type set last, after the per-edge fields, or None if it is one of the fields
+    :type node_type: str
     """
-    drug_dis_file = os.path.join(file_path, "P1-05-Drug_disease.txt")
-    assert os.path.exists(drug_dis_file)
 
-    # dictionary contains drug chembi_id and pubchem_cid info
-    drug_mapping_info = {d["ttd_drug_id"]: d for d in mapping_drug_id(file_path)}
+    __slots__ = ("id", "fields", "type")
 
-    # To make use of the icd11 and mondo mapping must put the obj dictionary into a list
-    # Or it will only iterate once not all dictionary keys
-    icd11_mondo = [d for d in get_icd9_11_mondo_mapping(file_path)]
+    def __init__(self, node_id, fields=(), node_type=None):
+        self.id = node_id
+        self.fields = tuple(fields)
+        self.type = node_type
 
-    drug_dis_list = []
-    all_output_l = []
+    @property
+    def id_suffix(self):
+        """node id without prefix used in the edge _id"""
+        return self.id.split(":")[1]
 
-    drug_id = None
-    drug_name = None
+    def to_dict(self, extras=()):
+        """plain node dictionary
 
-    for line in tabfile_feeder(drug_dis_file, header=22):
-        # skip the empty lines in input data file
-        if line != ["", "", "", "", ""]:
-            if line[0] == "TTDDRUID":
-                drug_id = line[1]
-            elif line[0] == "DRUGNAME":
-                drug_name = line[1]
-            elif line[0] == "INDICATI":
-                icd11 = line[1].split(":")[1].split("]")[0].strip()
-                disease_name = line[1].split("[")[0].strip()
-                trial_status = line[1].split("]")[1].strip().lower()
+        :param extras: per-edge (key, value) pairs, e.g. the name of the disease in this edge
+        :return: dictionary {"id": id, **fields, **extras, "type": type}
+        """
+        node = {"id": self.id}
+        node.update(self.fields)
+        node.update(extras)
+        if self.type:
+            node["type"] = self.type
+        return node
 
-                if drug_id and drug_name:
-                    _id = f"{drug_id}__{drug_name}__{icd11}"
-                    dict1 = {
-                        "_id": _id,
-                        "status": trial_status,
-                        "disease": disease_name,
-                    }
-                    drug_dis_list.append(dict1)
-                else:
-                    print("Both TTDDRUID and DRUGNAME need to be provided.")
 
-    merged_dicts = defaultdict(list)
+def node_ref(kind, key, **extras):
+    """handle of a NodeRegistry node, the documents keep it until NodeRegistry.materialize()
 
-    # Merge the dict1 status and disease values with the same _id key
-    for d in drug_dis_list:
-        merged_dicts[d["_id"]].append({"status": d["status"], "disease": d["disease"]})
+    :param kind: "target", "drug", "activity_drug", "biomarker", "disease" or "biomarker_disease"
+    :param key: key of the node within its kind
+    :param extras: per-edge fields of the node
+    :return: tuple (kind, key, ((field, value), ...))
+    """
+    return kind, key, tuple(extras.items())
 
-    for _id, trial_list in merged_dicts.items():
-        drug_id = _id.split("__")[0]
-        drug_name = _id.split("__")[1]
-        icd11 = _id.split("__")[2]
 
-        association = {"predicate": "biolink:treats", "clinical_trial": trial_list}
+class NodeRegistry:
+    """
+    The NodeRegistry object canonicalizes the subject/object nodes of all loaders
+    Every target, drug, disease and biomarker node is built once per key,
+    the edges only hold a node_ref() handle, a small tuple of str,
+    so documents stay small while they are sorted, pickled and sent between processes.
+    The node dictionaries are materialized when load_data emits a document
+
+    :param target_info: dictionary {ttd_target_id: target info}, or the ttd_staging.StagedLookup of a staged build
+    :type target_info: Mapping
+    :param drug_mapping_info: dictionary {ttd_drug_id: drug info}, or the ttd_staging.StagedLookup of a staged build
+    :type drug_mapping_info: Mapping
+    :param icd11_mondo: dictionary {icd11: "MONDO:id"} from get_icd9_11_mondo_mapping()
+    :type icd11_mondo: dict
+    """
 
-        object_node = {
-            "id": None,
-            "icd11": icd11,
-            "name": association["clinical_trial"][0]["disease"],
-            "type": "biolink:Disease",
+    def __init__(self, target_info, drug_mapping_info, icd11_mondo):
+        self.target_info = target_info
+        self.drug_mapping_info = drug_mapping_info
+        self.icd11_mondo = icd11_mondo
+        self.nodes = {}
+        self.builders = {
+            "target": self.build_target,
+            "drug": self.build_drug,
+            "activity_drug": self.build_activity_drug,
+            "biomarker": self.build_biomarker,
+            "disease": self.build_disease,
+            "biomarker_disease": self.build_biomarker_disease,
         }
 
-        for d in icd11_mondo:
-            if icd11 in d:
-                object_node["id"] = d[icd11]
-                object_node["mondo"] = d[icd11].split(":")[1]
+    def __getstate__(self):
+        # the nodes are rebuilt on demand in worker processes
+        state = self.__dict__.copy()
+        del state["builders"]
+        state["nodes"] = {}
+        return state
 
-        if object_node["id"] is None:
-            object_node["id"] = f"ICD11:{icd11}"
+    def __setstate__(self, state):
+        self.__init__(state["target_info"], state["drug_mapping_info"], state["icd11_mondo"])
 
-        if drug_id in drug_mapping_info:
-            if "chebi" in drug_mapping_info[drug_id]:
-                subject_node = {"id": f"CHEBI:{drug_mapping_info[drug_id]['chebi']}"}
-            elif "pubchem_compound" in drug_mapping_info[drug_id] and "chebi" not in drug_mapping_info[drug_id]:
-                if isinstance(drug_mapping_info[drug_id]["pubchem_compound"], list):
-                    subject_node = {"id": f"PUBCHEM.COMPOUND:{drug_mapping_info[drug_id]['pubchem_compound'][0]}"}
+    def get(self, kind, key):
+        """
+        :param kind: node kind, see node_ref()
+        :param key: key of the node within its kind
+        :return: Node
+        """
+        node = self.nodes.get((kind, key))
+        if node is None:
+            node = self.nodes[(kind, key)] = self.builders[kind](key)
+        return node
+
+    def materialize(self, doc):
+        """replace the node_ref() handles of a document by plain node dictionaries
+
+        :param doc: document with node_ref() subject and object
+        :return: the document
+        """
+        for role in ("subject", "object"):
+            kind, key, extras = doc[role]
+            doc[role] = self.get(kind, key).to_dict(extras)
+        return doc
+
+    def build_target(self, targ_id):
+        # one lookup per node, target_info can be a ttd_staging.StagedLookup
+        target_info = self.target_info.get(targ_id)
+        if target_info is not None:
+            if "uniprotkb" in target_info:
+                node_id = f"UniProtKB:{target_info.get('uniprotkb')[0]}"
+            else:
+                node_id = f"ttd_target_id:{targ_id}"
+            return Node(node_id, target_info.items(), "biolink:Protein")
+        return Node(f"ttd_target_id:{targ_id}", [("ttd_target_id", targ_id)], "biolink:Protein")
+
+    def build_drug(self, drug_id):
+        """drug node of the P1-05 and P1-07 edges, CHEBI id first, then PUBCHEM.COMPOUND, then ttd_drug_id"""
+        drug_info = self.drug_mapping_info.get(drug_id)
+        if drug_info is not None:
+            if "chebi" in drug_info:
+                node_id = f"CHEBI:{drug_info['chebi']}"
+            elif "pubchem_compound" in drug_info:
+                if isinstance(drug_info["pubchem_compound"], list):
+                    node_id = f"PUBCHEM.COMPOUND:{drug_info['pubchem_compound'][0]}"
                 else:
-                    subject_node = {"id": f"PUBCHEM.COMPOUND:{drug_mapping_info[drug_id]['pubchem_compound']}"}
+                    node_id = f"PUBCHEM.COMPOUND:{drug_info['pubchem_compound']}"
             else:
-                subject_node = {"id": f"ttd_drug_id:{drug_id}"}
-            subject_node.update(drug_mapping_info[drug_id])
-            subject_node["name"] = drug_name
-            subject_node["type"] = "biolink:SmallMolecule"
-        else:
-            subject_node = {
-                "id": f"ttd_drug_id:{drug_id}",
-                "ttd_drug_id": drug_id,
-                "name": drug_name,
-                "type": "biolink:SmallMolecule",
-            }
-
-        output_dict = {
-            "_id": f"{subject_node['id'].split(':')[1]}_treats_{object_node['id'].split(':')[1]}",
-            "association": association,
-            "object": object_node,
-            "subject": subject_node,
-        }
+                node_id = f"ttd_drug_id:{drug_id}"
+            return Node(node_id, drug_info.items(), "biolink:SmallMolecule")
+        return Node(f"ttd_drug_id:{drug_id}", [("ttd_drug_id", drug_id)], "biolink:SmallMolecule")
 
-        all_output_l.append(output_dict)
+    def build_activity_drug(self, key):
+        """drug node of the P1-09 edges, always identified by the pubchem cid of the activity row
 
-    """
-    Remove duplicates with same _id (same pubchem_cid/chembi_id but different ttd_drug_id)
-    For example:
-    {'_id': '143117_treats_2C25.Y', 'subject':{'ttd_drug_id': 'D04DYC', 'chembi_id': '143117'}}
-    {'_id': '143117_treats_2C25.Y' 'subject':{'ttd_drug_id': 'D04DYC', 'chembi_id': '143117'}}
-    Only keep the first one
-    """
+        :param key: (ttd_drug_id, pubchem_cid)
+        """
+        drug_id, pubchem_cid = key
+        drug_info = self.drug_mapping_info.get(drug_id)
+        if drug_info is not None:
+            fields = {"pubchem_compound": pubchem_cid, "type": "biolink:SmallMolecule"}
+            fields.update(drug_info)
+        else:
+            fields = {"pubchem_compound": pubchem_cid, "ttd_drug_id": drug_id, "type": "biolink:SmallMolecule"}
+        return Node(f"PUBCHEM.COMPOUND:{pubchem_cid}", fields.items())
 
-    unique_ids = {}
-    filtered_data = []
-    for output in all_output_l:
-        _id = output["_id"]
-        if _id not in unique_ids:
-            unique_ids[_id] = True
-            filtered_data.append(output)
+    def build_biomarker(self, biomarker_id):
+        return Node(
+            f"ttd_biomarker_id:{biomarker_id}", [("ttd_biomarker_id", biomarker_id), ("type", "biolink:Biomarker")]
+        )
 
-    for item in filtered_data:
-        yield item
+    def get_disease_id(self, icd11):
+        """
+        :param icd11: icd11 code
+        :return: ("MONDO:id" or "ICD11:icd11", mondo without prefix or None)
+        """
+        if icd11 in self.icd11_mondo:
+            return self.icd11_mondo[icd11], self.icd11_mondo[icd11].split(":")[1]
+        return f"ICD11:{icd11}", None
+
+    def build_disease(self, icd11):
+        """disease node of the drug-disease and target-disease edges, the name is set per edge"""
+        node_id, mondo = self.get_disease_id(icd11)
+        fields = [("icd11", icd11), ("name", None), ("type", "biolink:Disease")]
+        if mondo:
+            fields.append(("mondo", mondo))
+        return Node(node_id, fields)
+
+    def build_biomarker_disease(self, icd_lines):
+        """disease node of the biomarker-disease edges with the cleaned up icd11/icd10/icd9 codes
+
+        :param icd_lines: ("ICD-11: code", "ICD-10: code", "ICD-9: code") columns of P1-08-Biomarker_disease.txt
+        """
+        node_id, mondo = self.get_disease_id(icd_lines[0].split(":")[1].strip())
+        fields = {"name": None, "type": "biolink:Disease"}
+        if mondo:
+            fields["mondo"] = mondo
+        for icd_line, icd_prefix in zip(icd_lines, ("ICD-11:", "ICD-10:", "ICD-9:")):
+            icd_value = cleanup_icds(icd_line, icd_prefix)
+            icd_key = icd_line.split(":")[0].replace("-", "").strip().lower()
+            fields[icd_key] = icd_value
+        return Node(node_id, [(k, v) for k, v in fields.items() if k == "name" or v is not None])
 
 
-def load_target_dis_data(file_path):
-    """load data from P1-06-Target_disease.txt file
-        and clean up the data
+def get_drug_target_data(file_path):
+    """get the drug-target pairs from the P1-07-Drug-TargetMapping.xlsx file
+    the workbook is converted once into a columnar cache next to it, later reads skip openpyxl
 
     Keyword arguments:
-    file_path: directory stores P1-06-Target_disease.txt file
+    file_path: directory stores P1-07-Drug-TargetMapping.xlsx file
+    :return: dictionary {"TargetID": [ids], "DrugID": [ids], "Highest_status": [status], "MOA": [moa]}
     """
-    target_dis_file = os.path.join(file_path, "P1-06-Target_disease.txt")
-    assert os.path.exists(target_dis_file)
+    drug_targ_file = get_source_file(file_path, "P1-07-Drug-TargetMapping.xlsx")
 
-    target_info_d = {d["ttd_target_id"]: d for d in get_target_info(file_path)}
-    icd11_mondo = [d for d in get_icd9_11_mondo_mapping(file_path)]
+    return read_xlsx_columns(drug_targ_file, DRUG_TARGET_COLUMNS)
 
-    targ_dis_list = []
-    all_output_l = []
 
-    targ_id = None
-    targ_name = None
+def get_edge_id(subject_node, object_node):
+    """_id of a drug-target edge from the Node ids without their prefixes"""
+    return f"{subject_node.id_suffix}_interacts_with_{object_node.id_suffix}"
 
-    for line in tabfile_feeder(target_dis_file, header=22):
-        if line != [""]:
-            if line[1] == "TARGETID":
-                targ_id = line[2]
-            elif line[1] == "TARGNAME":
-                targ_name = line[2]
-            elif line[1] == "INDICATI":
-                icd11 = line[3].split(":")[1].split("]")[0].strip()
-                disease_name = line[3].split("[")[0].strip()
 
-                if targ_id and targ_name:
-                    dict1 = {
-                        "_id": f"{targ_id}__{targ_name}__{icd11}",
-                        "status": line[2].split("\t")[0],
-                        "disease": disease_name,
-                    }
-                    targ_dis_list.append(dict1)
-                else:
-                    print("Both target id and target name need to be provided.")
+class DrugTargetJoin:
+    """
+    The DrugTargetJoin object joins the P1-07-Drug-TargetMapping.xlsx pairs with the P1-09 activity rows
+    The xlsx pair table is built once, P1-09 is streamed once:
+    every activity row is an edge, left joined with the trial status/moa of its xlsx pair,
+    the xlsx rows whose pair has no activity row (anti-join) are edges of their own
+
+    :param drug_target_data: P1-07-Drug-TargetMapping.xlsx columns from get_drug_target_data()
+    :type drug_target_data: dict
+    :param node_registry: NodeRegistry of the build
+    :type node_registry: NodeRegistry
+    """
 
-    merged_dict = defaultdict(list)
-    for d in targ_dis_list:
-        merged_dict[d["_id"]].append({"status": d["status"], "disease": d["disease"]})
+    def __init__(self, drug_target_data, node_registry):
+        self.rows = list(zip(*(drug_target_data[column] for column in DRUG_TARGET_COLUMNS)))
+        self.node_registry = node_registry
+        # the last xlsx row of a pair wins
+        self.pairs = {
+            (targ_id, drug_id): {"trial_status": highest_status.lower(), "moa": moa.lower()}
+            for targ_id, drug_id, highest_status, moa in self.rows
+        }
 
-    for _id, trial_list in merged_dict.items():
-        targ_id = _id.split("__")[0]
-        targ_name = _id.split("__")[1]
-        icd11 = _id.split("__")[2]
+    @cached_property
+    def mapping_ids(self):
+        """_id of the edge of every xlsx row, activity edges with these _ids may lose against an anti-join edge"""
+        get_node = self.node_registry.get
+        return {
+            get_edge_id(get_node("drug", drug_id), get_node("target", targ_id)) for targ_id, drug_id, _, _ in self.rows
+        }
 
-        if targ_id in target_info_d:
-            if "uniprotkb" in target_info_d[targ_id]:
-                subject_node = {"id": f"UniProtKB:{target_info_d[targ_id].get('uniprotkb')[0]}"}
-            else:
-                subject_node = {"id": f"ttd_target_id:{targ_id}"}
-            subject_node.update(target_info_d[targ_id])
-            subject_node["name"] = targ_name
-            subject_node["type"] = "biolink:Protein"
-        else:
-            subject_node = {
-                "id": f"ttd_target_id:{targ_id}",
-                "ttd_target_id": targ_id,
-                "name": targ_name,
-                "type": "biolink:Protein",
-            }
+    def join_pairs(self, activity_rows, activity_pairs):
+        """left join of the activity rows with the xlsx pair table
 
-        association = {
-            "predicate": "biolink:target_for",
-            "clinical_trial": trial_list,
+        :param activity_rows: rows of P1-09-Target_compound_activity.txt from read_activity_rows()
+        :param activity_pairs: set collecting the (TargetID, DrugID) pairs of the rows for the anti-join
+        :return: generator of (activity row, {"trial_status": status, "moa": moa} of its pair or None)
+        """
+        pairs = self.pairs
+        for row in activity_rows:
+            # dt_pair is drug-target pair
+            dt_pair = row[:2]
+            activity_pairs.add(dt_pair)
+            yield row, pairs.get(dt_pair)
+
+    def get_activity_doc(self, targ_id, drug_id, pubchem_cid, activity_type, activity_value, pair=None):
+        """edge of one P1-09-Target_compound_activity.txt row, with the xlsx fields of its pair if any
+
+        :param activity_type: "ic50", "ki", "ec50" or None from read_activity_rows()
+        :param activity_value: activity value without spaces or None
+        :param pair: xlsx fields of the pair from join_pairs()
+        :return: document dictionary with node_ref() subject and object
+        """
+        association = {"predicate": "biolink:interacts_with"}
+        if activity_type:
+            association[activity_type] = activity_value
+        if pair:
+            association.update(pair)
+
+        get_node = self.node_registry.get
+        return {
+            "_id": get_edge_id(get_node("activity_drug", (drug_id, pubchem_cid)), get_node("target", targ_id)),
+            "association": association,
+            "object": node_ref("target", targ_id),
+            "subject": node_ref("activity_drug", (drug_id, pubchem_cid)),
         }
 
-        object_node = {
-            "id": None,
-            "icd11": icd11,
-            "name": association["clinical_trial"][0]["disease"],
-            "type": "biolink:Disease",
+    def get_mapping_doc(self, targ_id, drug_id, highest_status, moa):
+        """edge of one P1-07-Drug-TargetMapping.xlsx row
+
+        :return: document dictionary with node_ref() subject and object
+        """
+        association = {"predicate": "biolink:interacts_with"}
+        if moa != ".":
+            association["moa"] = moa.lower()
+        association["trial_status"] = highest_status.lower()
+
+        get_node = self.node_registry.get
+        return {
+            "_id": get_edge_id(get_node("drug", drug_id), get_node("target", targ_id)),
+            "association": association,
+            "object": node_ref("target", targ_id),
+            "subject": node_ref("drug", drug_id),
         }
 
-        for d in icd11_mondo:
-            if icd11 in d:
-                object_node["id"] = d[icd11]
-                object_node["mondo"] = d[icd11].split(":")[1]
+    def iter_mapping_docs(self, activity_pairs):
+        """edges of the xlsx rows whose pair is not in P1-09 (anti-join), in xlsx row order
+
+        :param activity_pairs: set of the (TargetID, DrugID) pairs of P1-09
+        """
+        for targ_id, drug_id, highest_status, moa in self.rows:
+            if (targ_id, drug_id) not in activity_pairs:
+                yield self.get_mapping_doc(targ_id, drug_id, highest_status, moa)
+
+    def iter_docs(self, activity_rows):
+        """one pass over P1-09 emitting the left/inner join and anti-join edges with unique _ids
+        The first document of an _id wins, where the anti-join edges come before the activity edges
+        like in merge_drug_target. Activity edges are yielded as they stream in,
+        except the few whose _id is also the _id of an xlsx row: they wait until the anti-join is known
+
+        :param activity_rows: rows of P1-09-Target_compound_activity.txt from read_activity_rows()
+        :return: generator of documents
+        """
+        from itertools import chain
+
+        mapping_ids = self.mapping_ids
+        activity_pairs = set()
+        deferred = []
+        unique_ids = FingerprintSet()
+
+        rows = duplicates = 0
+        for rows, (row, pair) in enumerate(self.join_pairs(activity_rows, activity_pairs), 1):
+            doc = self.get_activity_doc(*row, pair)
+            if doc["_id"] in mapping_ids:
+                deferred.append(doc)
+            elif unique_ids.add(doc["_id"]):
+                yield doc
+            else:
+                duplicates += 1
+        metrics.count("drug_target.activity_rows", rows)
+        metrics.count("drug_target.deferred", len(deferred))
+
+        for doc in chain(self.iter_mapping_docs(activity_pairs), deferred):
+            if unique_ids.add(doc["_id"]):
+                yield doc
             else:
-                object_node["id"] = f"ICD11:{icd11}"
+                duplicates += 1
+        metrics.count("drug_target.duplicates", duplicates)
 
-        _id = f"{subject_node['id'].split(':')[1]}_target_for_{object_node['id'].split(':')[1]}"
 
-        output_dict = {
-            "_id": _id,
-            "association": association,
-            "object": object_node,
-            "subject": subject_node,
-        }
+class StagedDrugTargetJoin(DrugTargetJoin):
+    """
+    The StagedDrugTargetJoin object is the DrugTargetJoin of a staged build (TTD_STAGING=1):
+    the xlsx rows stay in the ttd_staging.StagingStore, the left join of the activity rows
+    with their pair and the anti-join are sql queries streamed through cursors
+
+    :param staging: ttd_staging.StagingStore with the "drug_targets" and "activities" tables
+    :type staging: StagingStore
+    :param node_registry: NodeRegistry of the build
+    :type node_registry: NodeRegistry
+    """
 
-        all_output_l.append(output_dict)
+    def __init__(self, staging, node_registry):
+        self.staging = staging
+        self.node_registry = node_registry
+
+    @cached_property
+    def mapping_ids(self):
+        """_id of the edge of every xlsx pair"""
+        get_node = self.node_registry.get
+        return {
+            get_edge_id(get_node("drug", drug_id), get_node("target", targ_id))
+            for targ_id, drug_id in self.staging.iter_drug_target_pairs()
+        }
 
-    unique_ids = {}
-    filtered_data = []
-    for output in all_output_l:
-        _id = output["_id"]
-        if _id not in unique_ids:
-            unique_ids[_id] = True
-            filtered_data.append(output)
+    def join_pairs(self, activity_rows, activity_pairs):
+        """the staged activity rows from StagingStore.iter_activity_rows() are already joined in sql"""
+        return activity_rows
 
-    for item in filtered_data:
-        yield item
+    def iter_mapping_docs(self, activity_pairs=None):
+        """edges of the xlsx rows whose pair is not in P1-09 (anti-join), in xlsx row order
 
+        :param activity_pairs: not used, the anti-join is a query of the staged tables
+        """
+        for targ_id, drug_id, highest_status, moa in self.staging.iter_unpaired_drug_targets():
+            yield self.get_mapping_doc(targ_id, drug_id, highest_status, moa)
 
-def load_biomarker_dis_data(file_path):
-    """load data from P1-08-Biomarker_disease.txt file
 
-    Keyword arguments:
-    file_path: directory stores P1-08-Biomarker_disease.txt file
+class BuildContext:
     """
-    biomarker_file = os.path.join(file_path, "P1-08-Biomarker_disease.txt")
-    assert os.path.exists(biomarker_file)
+    The BuildContext object is shared by all loaders of one build
+    Every lookup is computed on first use and memoized,
+    so the source files are parsed and the remote mappings are requested only once per build
+    With TTD_STAGING=1 the parsed source files are bulk loaded into a ttd_staging.StagingStore,
+    the lookups read the staged tables and the loaders stream their rows from it
 
-    icd11_mondo = [d for d in get_icd9_11_mondo_mapping(file_path)]
+    :param file_path: directory stores all downloaded data files
+    :type file_path: str
+    """
 
-    for line in tabfile_feeder(biomarker_file, header=16):
-        if line:
-            subject_node = {
-                "id": None,
-                "name": line[2],
-                "type": "biolink:Disease",
-            }
+    def __init__(self, file_path):
+        self.file_path = file_path
 
-            icd11 = line[3].split(":")[1].strip()
-            for d in icd11_mondo:
-                if icd11 in d:
-                    subject_node["id"] = d[icd11]
-                    subject_node["mondo"] = d[icd11].split(":")[1]
+    def load_all(self):
+        """compute every shared lookup up front, e.g. before the context is handed to worker processes
 
-                if subject_node["id"] is None:
-                    subject_node["id"] = f"ICD11:{icd11}"
+        :return: the BuildContext itself
+        """
+        for lookup in ("target_info", "drug_mapping_info", "node_registry", "drug_target_join"):
+            getattr(self, lookup)
+        return self
+
+    @cached_property
+    def staging(self):
+        """ttd_staging.StagingStore with the staged source files, None unless TTD_STAGING=1"""
+        if not STAGING:
+            return None
+        with metrics.stage("staging"):
+            return stage_sources(self.file_path)
+
+    @cached_property
+    def target_info(self):
+        """dictionary {ttd_target_id: target info} from get_target_info()"""
+        if self.staging is not None:
+            from ttd_staging import StagedLookup
+
+            return StagedLookup(self.staging, "targets")
+        with metrics.stage("target_info"):
+            return {d["ttd_target_id"]: d for d in get_target_info(self.file_path)}
+
+    @cached_property
+    def drug_mapping_info(self):
+        """dictionary {ttd_drug_id: drug info} from mapping_drug_id()"""
+        if self.staging is not None:
+            from ttd_staging import StagedLookup
+
+            return StagedLookup(self.staging, "drugs")
+        with metrics.stage("drug_mapping_info"):
+            return {d["ttd_drug_id"]: d for d in mapping_drug_id(self.file_path)}
+
+    @cached_property
+    def icd11_mondo(self):
+        """dictionary {icd11: mondo} from get_icd9_11_mondo_mapping()"""
+        return next(get_icd9_11_mondo_mapping(self.file_path))
+
+    @cached_property
+    def node_registry(self):
+        """NodeRegistry shared by all loaders"""
+        return NodeRegistry(self.target_info, self.drug_mapping_info, self.icd11_mondo)
+
+    @cached_property
+    def drug_target_data(self):
+        """P1-07-Drug-TargetMapping.xlsx columns from get_drug_target_data()"""
+        with metrics.stage("drug_target_data"):
+            return get_drug_target_data(self.file_path)
+
+    @cached_property
+    def drug_target_join(self):
+        """DrugTargetJoin with the xlsx pair table shared by the drug-target loaders"""
+        if self.staging is not None:
+            return StagedDrugTargetJoin(self.staging, self.node_registry)
+        return DrugTargetJoin(self.drug_target_data, self.node_registry)
+
+
+def parse_indication(indication, pattern=INDICATION_PATTERN):
+    """split an INDICATI value with one match of a precompiled pattern
+
+    :param indication: INDICATI value, e.g. "Lung cancer [ICD-11: 2C25] Phase 3"
+    :param pattern: INDICATION_PATTERN or DRUG_INDICATION_PATTERN
+    :return: dictionary of the named groups with the spaces stripped,
+             e.g. {"status": "Phase 3", "disease": "Lung cancer", "icd11": "2C25"}
+    """
+    match = pattern.match(indication)
+    if match is None:
+        raise ValueError(f"Unexpected indication {indication!r}")
+    return {name: group.strip() for name, group in match.groupdict().items()}
 
-            icd_group = [
-                (line[3], "ICD-11:"),
-                (line[4], "ICD-10:"),
-                (line[5], "ICD-9:"),
-            ]
 
-            for icd_line, icd_prefix in icd_group:
-                icd_value = cleanup_icds(icd_line, icd_prefix)
-                icd_key = icd_line.split(":")[0].replace("-", "").strip().lower()
-                subject_node[icd_key] = icd_value
+def read_drug_indications(file_path):
+    """read the indications of the P1-05-Drug_disease.txt file
 
-            new_subject_node = {k: v for k, v in subject_node.items() if v is not None}
+    Keyword arguments:
+    file_path: directory stores P1-05-Drug_disease.txt file
+    :return: generator of (ttd_drug_id, drug name, icd11, trial status, disease name) in file order
+    """
+    drug_dis_file = get_source_file(file_path, "P1-05-Drug_disease.txt")
 
-            object_node = {
-                "id": f"ttd_biomarker_id:{line[0]}",
-                "ttd_biomarker_id": line[0],
-                "type": "biolink:Biomarker",
-            }
+    drug_id = None
+    drug_name = None
 
-            biomarker_name = line[1]
-            _id = f"{line[0]}_biomarker_for_{subject_node['id'].split(':')[1]}"
+    for record in BlockRecordReader(drug_dis_file, "TTDDRUID", DRUG_DISEASE_FIELDS, key_column=0):
+        for field, value in record:
+            if field == "drug_id":
+                drug_id = value
+            elif field == "drug_name":
+                drug_name = value
+            else:
+                indication = parse_indication(value, DRUG_INDICATION_PATTERN)
 
-            pattern = r"^(.*\(.*?)(.*)$"
-            if "," not in biomarker_name:
-                match = re.match(pattern, biomarker_name)
-                if match:
-                    symbol = match.groups()[1].rstrip(")")
-                    object_node["name"] = match.groups()[0].rstrip("(").strip()
-                    object_node["symbol"] = symbol
+                if drug_id and drug_name:
+                    yield drug_id, drug_name, indication["icd11"], indication["status"].lower(), indication["disease"]
                 else:
-                    object_node["name"] = biomarker_name.replace(" ", "_")
+                    metrics.count("load_drug_dis_data.incomplete")
+                    print("Both TTDDRUID and DRUGNAME need to be provided.")
+
+
+def read_target_indications(file_path):
+    """read the indications of the P1-06-Target_disease.txt file
+
+    Keyword arguments:
+    file_path: directory stores P1-06-Target_disease.txt file
+    :return: generator of (ttd_target_id, target name, icd11, clinical status, disease name) in file order
+    """
+    target_dis_file = get_source_file(file_path, "P1-06-Target_disease.txt")
+
+    targ_id = None
+    targ_name = None
+
+    for record in BlockRecordReader(target_dis_file, "TARGETID", TARGET_DISEASE_FIELDS, value_columns=2):
+        for field, value in record:
+            if field == "targ_id":
+                targ_id = value[0]
+            elif field == "targ_name":
+                targ_name = value[0]
             else:
-                biomarkers = [item.strip() for item in biomarker_name.split(",")]
-                object_node["name"] = []
-                symbol = []
-                for biomarker in biomarkers:
-                    match = re.match(pattern, biomarker)
-                    if match:
-                        symbol.append(match.groups()[1].rstrip(")").strip())
-                        object_node["symbol"] = symbol
-                        object_node["name"].append(match.groups()[0].rstrip("(").strip())
-                    else:
-                        object_node["name"].append(biomarker)
+                status, indication = value
+                parsed = parse_indication(indication)
+
+                if targ_id and targ_name:
+                    yield targ_id, targ_name, parsed["icd11"], status, parsed["disease"]
+                else:
+                    metrics.count("load_target_dis_data.incomplete")
+                    print("Both target id and target name need to be provided.")
 
-            association = {"predicate": "biolink:biomarker_for"}
 
-            output_dict = {
-                "_id": _id,
-                "association": association,
-                "object": object_node,
-                "subject": new_subject_node,
-            }
+def iter_trial_groups(indications, loader_name):
+    """group the indications on (id, name, icd11) in one streaming pass
+    P1-05 and P1-06 list all indications of an entity in one block, so the groups of an entity
+    are complete and emitted as soon as its block ends, in the order of their first row.
+    A second block of an entity would need trials of groups that were already emitted, it fails the build
 
+    :param indications: rows from read_drug_indications() or read_target_indications()
+    :param loader_name: loader name of the counters and errors
+    :return: generator of ((id, name, icd11), list of {"status": status, "disease": name})
+    :raise ValueError: the indications of an entity are split in several blocks
+    """
+    block_id = None
+    groups = {}
+    # ids of the finished blocks, verified against the ids themselves since a hit fails the build
+    finished_ids = FingerprintSet(exact=True)
+    for entity_id, name, icd11, status, disease_name in indications:
+        if entity_id != block_id:
+            yield from groups.items()
+            if block_id is not None:
+                finished_ids.add(block_id)
+            if entity_id in finished_ids:
+                raise ValueError(f"{loader_name}: the indications of {entity_id} are split in several blocks")
+            block_id = entity_id
+            groups = {}
+        trial_list = groups.get((entity_id, name, icd11))
+        if trial_list is None:
+            trial_list = groups[entity_id, name, icd11] = []
+        trial_list.append({"status": status, "disease": disease_name})
+    yield from groups.items()
+
+
+def iter_trial_docs(trials, node_registry, subject_kind, predicate, loader_name):
+    """edges of the grouped indications of load_drug_dis_data and load_target_dis_data
+    the disease node is named after the first trial, the first edge of an _id is kept
+
+    :param trials: ((id, name, icd11), trial list) from iter_trial_groups() or StagingStore.iter_trials()
+    :param node_registry: NodeRegistry of the build
+    :param subject_kind: "drug" or "target"
+    :param predicate: "biolink:treats" or "biolink:target_for"
+    :param loader_name: loader name of the counters
+    :return: generator of documents with node_ref() subject and object
+    """
+    edge_label = predicate.split(":")[1]
+    unique_ids = FingerprintSet()
+
+    indications = 0
+    for (entity_id, name, icd11), trial_list in trials:
+        indications += len(trial_list)
+
+        subject_id = node_registry.get(subject_kind, entity_id).id_suffix
+        object_id = node_registry.get("disease", icd11).id_suffix
+
+        output_dict = {
+            "_id": f"{subject_id}_{edge_label}_{object_id}",
+            "association": {"predicate": predicate, "clinical_trial": trial_list},
+            "object": node_ref("disease", icd11, name=trial_list[0]["disease"]),
+            "subject": node_ref(subject_kind, entity_id, name=name),
+        }
+
+        if unique_ids.add(output_dict["_id"]):
             yield output_dict
+        else:
+            metrics.count(f"{loader_name}.duplicates")
+    metrics.count(f"{loader_name}.indications", indications)
 
 
-def load_drug_target_act(file_path):
-    """load data from P1-09-Target_compound_activity.txt file
-    and from P1-07-Drug-TargetMapping.xlsx file
-    There are 13460 drug-target pairs overlapped in both files
-    Merge the association fields of the 13460 paris in this function
+def load_drug_dis_data(file_path, context=None):
+    """load data from P1-05-Drug_disease.txt file
+        and clean up the data
 
     Keyword arguments:
-    file_path: directory stores P1-09-Target_compound_activity.txt file
-    file_path: directory stores P1-07-Drug-TargetMapping.xlsx file
+    file_path: directory stores 1-05-Drug_disease.txt file
+    context: BuildContext shared with the other loaders, a new one is created if not given
     """
-    import pandas as pd
+    context = context or BuildContext(file_path)
 
-    activity_file = os.path.join(file_path, "P1-09-Target_compound_activity.txt")
-    assert os.path.exists(activity_file)
+    if context.staging is not None:
+        trials = context.staging.iter_trials("drug_indications")
+    else:
+        trials = iter_trial_groups(read_drug_indications(file_path), "load_drug_dis_data")
 
-    drug_targ_file = os.path.join(file_path, "P1-07-Drug-TargetMapping.xlsx")
-    assert os.path.exists(drug_targ_file)
-    drug_target_data = pd.read_excel(drug_targ_file, engine="openpyxl").to_dict(orient="records")
+    # Remove duplicates with same _id (same pubchem_cid/chembi_id but different ttd_drug_id)
+    # For example:
+    # {'_id': '143117_treats_2C25.Y', 'subject':{'ttd_drug_id': 'D04DYC', 'chembi_id': '143117'}}
+    # {'_id': '143117_treats_2C25.Y' 'subject':{'ttd_drug_id': 'D04DYC', 'chembi_id': '143117'}}
+    # Only keep the first one
+    yield from iter_trial_docs(trials, context.node_registry, "drug", "biolink:treats", "load_drug_dis_data")
 
-    target_info_d = {d["ttd_target_id"]: d for d in get_target_info(file_path)}
-    drug_mapping_info = {d["ttd_drug_id"]: d for d in mapping_drug_id(file_path)}
 
-    drug_target_dict = {
-        (dicts["TargetID"], dicts["DrugID"]): {
-            "trial_status": dicts["Highest_status"].lower(),
-            "moa": dicts["MOA"].lower(),
-        }
-        for dicts in drug_target_data
-    }
+def load_target_dis_data(file_path, context=None):
+    """load data from P1-06-Target_disease.txt file
+        and clean up the data
 
-    pattern_not_matched = []
+    Keyword arguments:
+    file_path: directory stores P1-06-Target_disease.txt file
+    context: BuildContext shared with the other loaders, a new one is created if not given
+    """
+    context = context or BuildContext(file_path)
 
-    for line in tabfile_feeder(activity_file, header=1):
-        if line[1] in drug_mapping_info:
-            subject_node = {
-                "id": f"PUBCHEM.COMPOUND:{line[2]}",
-                "pubchem_compound": line[2],
-                "type": "biolink:SmallMolecule",
-            }
-            subject_node.update(drug_mapping_info[line[1]])
-        else:
-            subject_node = {
-                "id": f"PUBCHEM.COMPOUND:{line[2]}",
-                "pubchem_compound": line[2],
-                "ttd_drug_id": line[1],
-                "type": "biolink:SmallMolecule",
-            }
+    if context.staging is not None:
+        trials = context.staging.iter_trials("target_indications")
+    else:
+        trials = iter_trial_groups(read_target_indications(file_path), "load_target_dis_data")
 
-        if line[0] in target_info_d:
-            if "uniprotkb" in target_info_d[line[0]]:
-                object_node = {"id": f"UniProtKB:{target_info_d[line[0]].get('uniprotkb')[0]}"}
+    yield from iter_trial_docs(trials, context.node_registry, "target", "biolink:target_for", "load_target_dis_data")
 
-            else:
-                object_node = {"id": f"ttd_target_id:{line[0]}"}
-            object_node.update(target_info_d[line[0]])
-            object_node["type"] = "biolink:Protein"
-        else:
-            object_node = {"id": f"ttd_target_id:{line[0]}", "ttd_target_id": line[0], "type": "biolink:Protein"}
 
-        _id = f"{subject_node['id'].split(':')[1]}_interacts_with_{object_node['id'].split(':')[1]}"
-        association = {"predicate": "biolink:interacts_with"}
-        pattern = re.match(r"(IC50|Ki|EC50)\s+(.+)", line[3])
-        if pattern:
-            association[pattern.groups()[0].lower()] = pattern.groups()[1].replace(" ", "")
+def read_biomarker_rows(file_path):
+    """read P1-08-Biomarker_disease.txt column-wise and split the biomarker names vectorized
+
+    :param file_path: directory stores P1-08-Biomarker_disease.txt file
+    :return: iterator of (ttd_biomarker_id, disease name, icd11 line, icd10 line, icd9 line,
+             biomarker name(s), symbol(s) or None)
+    """
+    biomarker_file = get_source_file(file_path, "P1-08-Biomarker_disease.txt")
+
+    data = read_tab_columns(biomarker_file, 6, header=16)
+    names, symbols = extract_biomarker_names(data[1])
+
+    return zip(data[0], data[2], data[3], data[4], data[5], names, symbols)
+
+
+def load_biomarker_dis_data(file_path, context=None):
+    """load data from P1-08-Biomarker_disease.txt file
+
+    Keyword arguments:
+    file_path: directory stores P1-08-Biomarker_disease.txt file
+    context: BuildContext shared with the other loaders, a new one is created if not given
+    The file is read column-wise and the biomarker names are split with vectorized string operations
+    """
+    context = context or BuildContext(file_path)
+    node_registry = context.node_registry
+
+    if context.staging is not None:
+        biomarker_rows = context.staging.iter_biomarkers()
+    else:
+        biomarker_rows = read_biomarker_rows(file_path)
+
+    for biomarker_id, disease_name, icd11_line, icd10_line, icd9_line, name, symbol in biomarker_rows:
+        icd_lines = (icd11_line, icd10_line, icd9_line)
+        subject_id = node_registry.get("biomarker_disease", icd_lines).id_suffix
+
+        if symbol is not None:
+            object_ref = node_ref("biomarker", biomarker_id, name=name, symbol=symbol)
         else:
-            pattern_not_matched.append(line[3])
-            print("Regex pattern not matched:", pattern_not_matched)
-
-        # dt_pair is drug-target pair
-        dt_pair = (line[0], line[1])
-        if dt_pair in drug_target_dict.keys():
-            if drug_target_dict[dt_pair]["moa"] != ".":
-                association.update(drug_target_dict[dt_pair])
-            else:
-                association.update(drug_target_dict[dt_pair])
+            object_ref = node_ref("biomarker", biomarker_id, name=name)
 
         output_dict = {
-            "_id": _id,
-            "association": association,
-            "object": object_node,
-            "subject": subject_node,
+            "_id": f"{biomarker_id}_biomarker_for_{subject_id}",
+            "association": {"predicate": "biolink:biomarker_for"},
+            "object": object_ref,
+            "subject": node_ref("biomarker_disease", icd_lines, name=disease_name),
         }
+
         yield output_dict
 
 
-def load_drug_target(file_path):
-    """load data from P1-07-Drug-TargetMapping.xlsx file
-    and P1-09-Target_compound_activity.txt file
-    The rest of 31203 out of 44663 drug-target pairs
-    are parsed
+def read_activity_rows(file_path, shard=None):
+    """read P1-09-Target_compound_activity.txt column-wise and extract the activity type/value vectorized
+    the rows that do not match the activity pattern are reported in one summary
 
-    Keyword arguments:
-    file_path: directory stores P1-07-Drug-TargetMapping.xlsx file
-    file_path: directory stores P1-09-Target_compound_activity.txt file
+    :param file_path: directory stores P1-09-Target_compound_activity.txt file
+    :param shard: (index, count) to read only one of count equal byte ranges of the file
+    :return: iterator of (TargetID, DrugID, Pubchem_CID, activity type or None, activity value or None)
     """
-    import pandas as pd
+    activity_file = get_source_file(file_path, "P1-09-Target_compound_activity.txt")
 
-    drug_targ_file = os.path.join(file_path, "P1-07-Drug-TargetMapping.xlsx")
-    assert os.path.exists(drug_targ_file)
+    if shard:
+        data = read_tab_columns(read_shard(activity_file, *shard, header=1), 4, header=0)
+    else:
+        data = read_tab_columns(activity_file, 4, header=1)
+    activity_types, activity_values = extract_activities(data[3])
 
-    activity_file = os.path.join(file_path, "P1-09-Target_compound_activity.txt")
-    assert os.path.exists(activity_file)
+    return zip(data[0].tolist(), data[1].tolist(), data[2].tolist(), activity_types, activity_values)
 
-    drug_target_data = pd.read_excel(drug_targ_file, engine="openpyxl").to_dict(orient="records")
 
-    target_info_d = {d["ttd_target_id"]: d for d in get_target_info(file_path)}
-    drug_mapping_info = {d["ttd_drug_id"]: d for d in mapping_drug_id(file_path)}
+def load_drug_target_act(file_path, context=None, shard=None):
+    """load data from P1-09-Target_compound_activity.txt file
+    and from P1-07-Drug-TargetMapping.xlsx file
+    There are 13460 drug-target pairs overlapped in both files
+    Merge the association fields of the 13460 paris in this function
+
+    Keyword arguments:
+    file_path: directory stores P1-09-Target_compound_activity.txt file
+    file_path: directory stores P1-07-Drug-TargetMapping.xlsx file
+    context: BuildContext shared with the other loaders, a new one is created if not given
+    shard: (index, count) to load only one of count equal byte ranges of the P1-09 file
+    """
+    context = context or BuildContext(file_path)
+    drug_target_join = context.drug_target_join
 
-    all_output_l = []
-    dt_dict = {}
+    if context.staging is not None:
+        activity_rows = context.staging.iter_activity_rows(shard)
+    else:
+        activity_rows = read_activity_rows(file_path, shard)
 
-    for line in tabfile_feeder(activity_file, header=1):
-        dt_pair = {(line[0], line[1]): "drug-target pair"}
-        dt_dict.update(dt_pair)
+    rows = 0
+    for rows, (row, pair) in enumerate(drug_target_join.join_pairs(activity_rows, set()), 1):
+        yield drug_target_join.get_activity_doc(*row, pair)
+    metrics.count("drug_target.activity_rows", rows)
 
-    for dicts in drug_target_data:
-        if (dicts["TargetID"], dicts["DrugID"]) not in dt_dict.keys():
-            if dicts["TargetID"] in target_info_d:
-                if "uniprotkb" in target_info_d[dicts["TargetID"]]:
-                    object_node = {"id": f"UniProtKB:{target_info_d[dicts['TargetID']].get('uniprotkb')[0]}"}
-                else:
-                    object_node = {"id": f"ttd_target_id:{dicts['TargetID']}"}
-                object_node.update(target_info_d[dicts["TargetID"]])
-                object_node["type"] = "biolink:Protein"
-            else:
-                object_node = {
-                    "id": f"ttd_target_id:{dicts['TargetID']}",
-                    "ttd_target_id": dicts["TargetID"],
-                    "type": "biolink:Protein",
-                }
-
-            if dicts["DrugID"] in drug_mapping_info:
-                if "chebi" in drug_mapping_info[dicts["DrugID"]]:
-                    subject_node = {"id": f"CHEBI:{drug_mapping_info[dicts['DrugID']]['chebi']}"}
-                elif (
-                    "pubchem_compound" in drug_mapping_info[dicts["DrugID"]]
-                    and "chebi" not in drug_mapping_info[dicts["DrugID"]]
-                ):
-                    if isinstance(drug_mapping_info[dicts["DrugID"]]["pubchem_compound"], list):
-                        subject_node = {
-                            "id": f"PUBCHEM.COMPOUND:{drug_mapping_info[dicts['DrugID']]['pubchem_compound'][0]}"
-                        }
-                    else:
-                        subject_node = {
-                            "id": f"PUBCHEM.COMPOUND:{drug_mapping_info[dicts['DrugID']]['pubchem_compound']}"
-                        }
 
-                else:
-                    subject_node = {"id": f"ttd_drug_id:{dicts['DrugID']}"}
+def load_drug_target(file_path, context=None):
+    """load data from P1-07-Drug-TargetMapping.xlsx file
+    and P1-09-Target_compound_activity.txt file
+    The rest of 31203 out of 44663 drug-target pairs
+    are parsed
 
-                subject_node.update(drug_mapping_info[dicts["DrugID"]])
-                subject_node["type"] = "biolink:SmallMolecule"
+    Keyword arguments:
+    file_path: directory stores P1-07-Drug-TargetMapping.xlsx file
+    file_path: directory stores P1-09-Target_compound_activity.txt file
+    context: BuildContext shared with the other loaders, a new one is created if not given
+    """
+    context = context or BuildContext(file_path)
+    if context.staging is not None:
+        # the staged anti-join does not need the pairs
+        activity_pairs = None
+    else:
+        activity_file = get_source_file(file_path, "P1-09-Target_compound_activity.txt")
+
+        data = read_tab_columns(activity_file, 2, header=1)
+        activity_pairs = set(zip(data[0], data[1]))
+
+    # Remove duplicates with same _id (same pubchem_cid/chembi_id but different ttd_drug_id)
+    # For example:
+    # {'_id': '445455_interacts_with_P13631', 'subject':{'ttd_drug_id': 'D0M3LK', 'pubchem_cid': '445455'}}
+    # {'_id': '445455_interacts_with_P13631' 'subject':{'ttd_drug_id': 'D0MC3J', 'pubchem_cid': '445455'}}
+    # Only keep the first one
+    unique_ids = FingerprintSet()
+
+    for doc in context.drug_target_join.iter_mapping_docs(activity_pairs):
+        if unique_ids.add(doc["_id"]):
+            yield doc
+        else:
+            metrics.count("drug_target.duplicates")
 
-            else:
-                subject_node = {
-                    "id": f"ttd_drug_id:{dicts['DrugID']}",
-                    "ttd_drug_id": dicts["DrugID"],
-                    "type": "biolink:SmallMolecule",
-                }
-
-            _id = f"{subject_node['id'].split(':')[1]}_interacts_with_{object_node['id'].split(':')[1]}"
-            association = {"predicate": "biolink:interacts_with"}
-            if dicts["MOA"] != ".":
-                association["moa"] = dicts["MOA"].lower()
-                association["trial_status"] = dicts["Highest_status"].lower()
-            else:
-                association["trial_status"] = dicts["Highest_status"].lower()
 
-            output_dict = {"_id": _id, "association": association, "object": object_node, "subject": subject_node}
-            all_output_l.append(output_dict)
+def merge_drug_target(file_path, context=None):
+    """remove the 138 duplicates from P1-07 and P1-09 files
+    P1-09 is read once, the documents are the ones of load_drug_target and load_drug_target_act
+    chained and deduplicated by _id
 
-        else:
-            pass
+    :param file_path: directory stores the P1-07 and P1-09 source files
+    :param context: BuildContext shared with the other loaders
+    :return: individual dictionary of the drug-target edges
+    """
+    context = context or BuildContext(file_path)
+    if context.staging is not None:
+        activity_rows = context.staging.iter_activity_rows()
+    else:
+        activity_rows = read_activity_rows(file_path)
+    yield from context.drug_target_join.iter_docs(activity_rows)
+
+
+# source files of the tables of a staged build, see stage_sources()
+STAGED_SOURCES = {
+    "targets": ("P1-01-TTD_target_download.txt",),
+    "drugs": ("P1-03-TTD_crossmatching.txt",),
+    "drug_indications": ("P1-05-Drug_disease.txt",),
+    "target_indications": ("P1-06-Target_disease.txt",),
+    "biomarkers": ("P1-08-Biomarker_disease.txt",),
+    "drug_targets": ("P1-07-Drug-TargetMapping.xlsx",),
+    "activities": ("P1-09-Target_compound_activity.txt",),
+}
+
+
+def iter_staged_rows(file_path, table):
+    """rows of a staged table parsed from its source files, in file order
+
+    :param file_path: directory stores all downloaded data files
+    :param table: name of a ttd_staging.STAGED_TABLES table
+    :return: iterator of tuples with the columns of the table
+    """
+    from itertools import chain
 
+    from ttd_staging import STAGING_CHUNK_MB
+
+    if table == "targets":
+        return ((d["ttd_target_id"], json.dumps(d)) for d in get_target_info(file_path))
+    if table == "drugs":
+        return ((d["ttd_drug_id"], json.dumps(d)) for d in mapping_drug_id(file_path))
+    if table == "drug_indications":
+        return read_drug_indications(file_path)
+    if table == "target_indications":
+        return read_target_indications(file_path)
+    if table == "biomarkers":
+        return ((*row[:5], json.dumps(row[5]), json.dumps(row[6])) for row in read_biomarker_rows(file_path))
+    if table == "drug_targets":
+        drug_target_data = get_drug_target_data(file_path)
+        return zip(*(drug_target_data[column] for column in DRUG_TARGET_COLUMNS))
+    if table == "activities":
+        # parsed in byte range chunks, so the column arrays of the whole file are never held at once
+        activity_file = get_source_file(file_path, "P1-09-Target_compound_activity.txt")
+        chunks = max(1, -(-get_data_size(activity_file) // int(STAGING_CHUNK_MB * (1 << 20))))
+        return chain.from_iterable(read_activity_rows(file_path, (chunk, chunks)) for chunk in range(chunks))
+    raise ValueError(f"Unknown staged table {table}")
+
+
+def stage_sources(file_path):
+    """bulk load the parsed source files into the staging store of the data folder
+    a table is reused while the sha256 of its source files and the parser code are unchanged,
+    the targets hold the uniprot mappings and are staged again by every build
+
+    :param file_path: directory stores all downloaded data files
+    :return: ttd_staging.StagingStore
     """
-    Remove duplicates with same _id (same pubchem_cid/chembi_id but different ttd_drug_id)
-    For example:
-    {'_id': '445455_interacts_with_P13631', 'subject':{'ttd_drug_id': 'D0M3LK', 'pubchem_cid': '445455'}}
-    {'_id': '445455_interacts_with_P13631' 'subject':{'ttd_drug_id': 'D0MC3J', 'pubchem_cid': '445455'}}
-    Only keep the first one
+    from ttd_columnar import get_file_signature
+    from ttd_incremental import get_code_signature, get_digest
+    from ttd_staging import StagingStore, get_staging_path
+
+    store = StagingStore(get_staging_path(file_path))
+    code_signature = get_code_signature()
+    for table, source_files in STAGED_SOURCES.items():
+        signature = None
+        if table != "targets":
+            file_hashes = {
+                name: get_file_signature(get_source_file(file_path, name))["sha256"] for name in source_files
+            }
+            signature = get_digest({"code": code_signature, "files": file_hashes})
+        if store.is_staged(table, signature):
+            metrics.count("staging.reused_tables")
+            continue
+        with metrics.stage(f"staging.{table}"):
+            store.stage(table, iter_staged_rows(file_path, table), signature)
+    return store
+
+
+# loaders chained by load_data, in output order for equal _ids
+LOADERS = {
+    "load_drug_dis_data": load_drug_dis_data,
+    "load_target_dis_data": load_target_dis_data,
+    "load_biomarker_dis_data": load_biomarker_dis_data,
+    "merge_drug_target": merge_drug_target,
+}
+# (source files, BuildContext lookups) the documents of every loader depend on, the inputs of an incremental build
+# drug_mapping_info is a plain parse of P1-03, target_info and icd11_mondo also hold the uniprot and mondo mappings
+LOADER_INPUTS = {
+    "load_drug_dis_data": (("P1-05-Drug_disease.txt", "P1-03-TTD_crossmatching.txt"), ("icd11_mondo",)),
+    "load_target_dis_data": (("P1-06-Target_disease.txt",), ("target_info", "icd11_mondo")),
+    "load_biomarker_dis_data": (("P1-08-Biomarker_disease.txt",), ("icd11_mondo",)),
+    "merge_drug_target": (
+        ("P1-07-Drug-TargetMapping.xlsx", "P1-09-Target_compound_activity.txt", "P1-03-TTD_crossmatching.txt"),
+        ("target_info",),
+    ),
+}
+SOURCE_FILES = (
+    "P1-01-TTD_target_download.txt",
+    "P1-03-TTD_crossmatching.txt",
+    "P1-05-Drug_disease.txt",
+    "P1-06-Target_disease.txt",
+    "P1-07-Drug-TargetMapping.xlsx",
+    "P1-08-Biomarker_disease.txt",
+    "P1-09-Target_compound_activity.txt",
+)
+
+
+def is_output_doc(doc):
+    """some icd11 has N.A. as value, so records with N.A. in _id are removed"""
+    if "N.A." in doc["_id"]:
+        metrics.count("load_data.dropped_na")
+        return False
+    return True
+
+
+def get_input_fingerprints(context, store):
+    """fingerprint of the inputs of every loader and the release of the source files
+
+    :param context: BuildContext of the build
+    :param store: ttd_incremental.BuildStore keeping the sha256 of the source files
+    :return: (dictionary {loader: fingerprint}, release derived from the source file hashes)
     """
+    from ttd_incremental import get_code_signature, get_digest
+
+    file_hashes = {name: store.get_file_hash(get_source_file(context.file_path, name)) for name in SOURCE_FILES}
+    code_signature = get_code_signature()
+    lookup_digests = {}
+    fingerprints = {}
+    for loader_name, (source_files, lookups) in LOADER_INPUTS.items():
+        for lookup in lookups:
+            if lookup not in lookup_digests:
+                # a staged lookup is read into a dictionary
+                lookup_digests[lookup] = get_digest(dict(getattr(context, lookup)))
+        fingerprints[loader_name] = get_digest(
+            {
+                "code": code_signature,
+                "files": {name: file_hashes[name] for name in source_files},
+                "lookups": {lookup: lookup_digests[lookup] for lookup in lookups},
+            }
+        )
+    return fingerprints, f"ttd-{get_digest(file_hashes)[:12]}"
 
-    unique_ids = {}
-    filtered_data = []
-    for output in all_output_l:
-        _id = output["_id"]
-        if _id not in unique_ids:
-            unique_ids[_id] = True
-            filtered_data.append(output)
 
-    for item in filtered_data:
-        yield item
+def iter_rebuilt_docs(file_path, context, loaders):
+    """output documents of the loaders rebuilt by an incremental build
 
+    :param file_path: directory stores all downloaded data files
+    :param context: BuildContext of the build
+    :param loaders: names of the loaders to run
+    :return: generator of (loader, document), the documents of a loader sorted by _id
+    """
+    node_registry = context.node_registry
+    if WORKERS > 1:
+        from ttd_parallel import parallel_load
+
+        loader_docs = parallel_load(context, WORKERS, loaders)
+    else:
+        # one loader after the other, so only one sort holds documents in memory
+        loader_docs = (
+            (loader_name, doc)
+            for loader_name in loaders
+            for doc in external_sort(
+                metrics.iter_stage(loader_name, LOADERS[loader_name](file_path, context)), key="_id"
+            )
+        )
+    for loader_name, doc in loader_docs:
+        if is_output_doc(doc):
+            yield loader_name, node_registry.materialize(doc)
 
-def merge_drug_target(file_path):
-    """remove the 138 duplicates from P1-07 and P1-09 files
 
-    :param file_path: directory stores the P1-07 and P1-09 source files
-    :return: individual dictionary from load_drug_target and load_drug_target_act files
+def load_incremental(file_path, context):
+    """incremental build: only the loaders whose source files, lookups or parser code changed are run
+    the documents of every loader are kept in the build store, the reused ones are read back from it,
+    and the added/removed/changed _ids of the rebuilt loaders are written to the delta report
+
+    :param file_path: directory stores all downloaded data files
+    :param context: BuildContext of the build
+    :return: generator of all output documents sorted by _id
     """
-    drug_target_data = load_drug_target(file_path)
-    drug_target_act_data = load_drug_target_act(file_path)
+    import heapq
 
-    unique_ids = {}
-    filtered_data = []
-    all_l = []
+    from ttd_incremental import BuildStore, get_store_path, write_delta
 
-    for d in drug_target_data:
-        all_l.append(d)
-    for d in drug_target_act_data:
-        all_l.append(d)
+    with BuildStore(get_store_path(file_path)) as store:
+        with metrics.stage("input_fingerprints"):
+            fingerprints, data_release = get_input_fingerprints(context, store)
+        rebuilt = {
+            name: fingerprint
+            for name, fingerprint in fingerprints.items()
+            if store.get_fingerprint(name) != fingerprint
+        }
+        metrics.count("incremental.rebuilt_loaders", len(rebuilt))
+        metrics.count("incremental.reused_loaders", len(fingerprints) - len(rebuilt))
 
-    for d in all_l:
-        _id = d["_id"]
-        if _id not in unique_ids:
-            unique_ids[_id] = True
-            filtered_data.append(d)
+        deltas = {}
+        if rebuilt:
+            with metrics.stage("store_rebuilt_docs"):
+                deltas = store.write_docs(rebuilt, iter_rebuilt_docs(file_path, context, list(rebuilt)))
+        delta_file = write_delta(file_path, data_release, LOADERS, deltas)
+        print(f"Incremental build of {data_release}: rebuilt {', '.join(rebuilt) or 'nothing'}, delta in {delta_file}")
 
-    for item in filtered_data:
-        yield item
+        # the stored outputs are sorted per loader, equal _ids keep the loader order like the full build sort
+        yield from heapq.merge(*(store.iter_docs(name) for name in LOADERS), key=lambda doc: doc["_id"])
 
 
 def load_data(file_path):
     """main data load function
+    the stage timings and counters of the build are written to the TTD_METRICS_REPORT json report
+    with TTD_INCREMENTAL=1 only the loaders whose inputs changed since the last build are run
 
     Keyword arguments:
     file_path: directory stores all downloaded data files
     """
     from itertools import chain
-    from operator import itemgetter
-
-    doc_list = list(
-        chain(
-            load_drug_dis_data(file_path),
-            load_target_dis_data(file_path),
-            load_biomarker_dis_data(file_path),
-            merge_drug_target(file_path),
-        )
-    )
 
-    sorted_docs = sorted(doc_list, key=itemgetter("_id"))
+    metrics.reset()
+    # the lookups shared by the loaders are built once for the whole build
+    context = BuildContext(file_path)
+    # (predicate, subject fields, object fields) of the emitted documents, expanded into the output counters
+    output_shapes = defaultdict(int)
 
-    for doc in sorted_docs:
-        # some icd11 has N.A. as value, so removed records with N.A. in _id
-        if "N.A." not in doc["_id"]:
-            yield doc
+    try:
+        with metrics.stage("load_data"):
+            if INCREMENTAL:
+                docs = load_incremental(file_path, context)
+            else:
+                # the loaders reference the nodes by node_ref() handle until a document is emitted
+                node_registry = context.node_registry
+                if WORKERS > 1:
+                    from ttd_parallel import parallel_load
+
+                    # the loaders run in a process pool and their sorted outputs are merged in _id order
+                    docs = (doc for _, doc in parallel_load(context, WORKERS))
+                else:
+                    docs = chain(
+                        *(metrics.iter_stage(name, loader(file_path, context)) for name, loader in LOADERS.items())
+                    )
+                    # sorted runs larger than TTD_SORT_MEMORY_MB are spilled to disk and merged back in _id order
+                    docs = external_sort(docs, key="_id")
+                docs = (node_registry.materialize(doc) for doc in docs if is_output_doc(doc))
+
+            for doc in docs:
+                output_shapes[doc["association"]["predicate"], tuple(doc["subject"]), tuple(doc["object"])] += 1
+                yield doc
+    finally:
+        metrics.count("load_data.docs", sum(output_shapes.values()))
+        if "node_registry" in context.__dict__:
+            metrics.count("node_registry.nodes", len(context.node_registry.nodes))
+        metrics.count_output(output_shapes)
+        report_file = metrics.write_report(file_path)
+        if report_file:
+            print(f"Build metrics written to {report_file}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the plugin modules are imported from the repository root, like biothings loads them from the plugin folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import pytest
+
+from ttd_benchmark.generate import icd9_mondo
+from ttd_benchmark.standins import DiseaseStandin, StandinServer
+from ttd_cache import MappingCache
+from ttd_disease import IcdMondoCrosswalk
+
+ICD9S = [f"{i:03d}.{j}" for i in range(240, 250) for j in range(3)]
+
+
+def get_expected(icd9s):
+    return {icd9: icd9_mondo(icd9) for icd9 in icd9s if icd9_mondo(icd9)}
+
+
+def write_snapshot(tmp_path, name, icd9_mondo_d):
+    if name.endswith(".obo"):
+        lines = ["format-version: 1.2", ""]
+        for icd9, mondo in icd9_mondo_d.items():
+            lines += ["[Term]", f"id: {mondo}", "name: synthetic disease", f"xref: ICD9CM:{icd9}", ""]
+    else:
+        lines = [f"{icd9}\t{mondo}" for icd9, mondo in icd9_mondo_d.items()]
+    snapshot_file = tmp_path / name
+    snapshot_file.write_text("\n".join(lines) + "\n")
+    return str(snapshot_file)
+
+
+def test_chunked_query():
+    standin = DiseaseStandin()
+
+    with StandinServer({"disease": standin.app()}) as server:
+        crosswalk = IcdMondoCrosswalk(api_url=f"{server.urls['disease']}/v1", chunk_size=4)
+        mapped = crosswalk.resolve(ICD9S + ICD9S[:5])
+
+    expected = get_expected(ICD9S)
+    assert len(expected) < len(ICD9S)
+    assert mapped == expected
+    assert standin.requests == -(-len(ICD9S) // 4)
+
+
+def test_cache(tmp_path):
+    standin = DiseaseStandin()
+    cache_path = str(tmp_path / "ttd_cache.sqlite")
+
+    with StandinServer({"disease": standin.app()}) as server, MappingCache(cache_path, "icd9_mondo") as cache:
+        crosswalk = IcdMondoCrosswalk(api_url=f"{server.urls['disease']}/v1", cache=cache, chunk_size=4)
+        assert crosswalk.resolve(ICD9S[:20]) == get_expected(ICD9S[:20])
+        assert standin.requests == 5
+
+        # the cached codes, unmapped ones included, are not requested again
+        assert crosswalk.resolve(ICD9S) == get_expected(ICD9S)
+        assert standin.requests == 5 + -(-(len(ICD9S) - 20) // 4)
+        assert cache.get_many(ICD9S) == {icd9: icd9_mondo(icd9) for icd9 in ICD9S}
+
+
+@pytest.mark.parametrize("name", ["mondo.obo", "mondo_icd9.tsv"])
+def test_snapshot(tmp_path, name):
+    snapshot = get_expected(ICD9S[:20])
+    snapshot_file = write_snapshot(tmp_path, name, snapshot)
+    # every request to the stand-in fails, the codes are resolved offline from the snapshot
+    standin = DiseaseStandin(failure_rate=1.0)
+    cache_path = str(tmp_path / "ttd_cache.sqlite")
+
+    with StandinServer({"disease": standin.app()}) as server, MappingCache(cache_path, "icd9_mondo") as cache:
+        crosswalk = IcdMondoCrosswalk(api_url=f"{server.urls['disease']}/v1", cache=cache, snapshot_file=snapshot_file)
+        assert crosswalk.resolve(ICD9S) == snapshot
+        assert cache.get_many(ICD9S) == {icd9: snapshot.get(icd9) for icd9 in ICD9S}
+
+    assert standin.requests == 0
@@ -0,0 +1,52 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from aiohttp import web
+
+from ttd_benchmark.standins import StandinServer
+from ttd_download import download_files, read_manifest
+
+FILES = {
+    "P1-05-Drug_disease.txt": b"TTDDRUID\tD00001\nDRUGNAME\tDrug 1\n" * 10000,
+    "P1-06-Target_disease.txt": b"TARGETID\tT00001\nTARGNAME\tTarget 1\n" * 10000,
+}
+
+
+def get_app(source_dir, compress):
+    """static server of source_dir, compress sends the files gzip encoded to the clients accepting it"""
+
+    async def get_file(request):
+        path = os.path.join(source_dir, request.match_info["name"])
+        if not compress:
+            return web.FileResponse(path)
+        stat = os.stat(path)
+        with open(path, "rb") as in_f:
+            response = web.Response(body=in_f.read(), headers={"ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'})
+        response.enable_compression()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/files/{name}", get_file)
+    return app
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_download_from_static_server(tmp_path, compress):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name, content in FILES.items():
+        (source_dir / name).write_bytes(content)
+    folder = str(tmp_path / "release")
+
+    with StandinServer({"files": get_app(str(source_dir), compress)}) as server:
+        urls = [f"{server.urls['files']}/files/{name}" for name in FILES]
+        asyncio.run(download_files(urls, folder, compression=""))
+
+    files = read_manifest(folder)["files"]
+    for name, content in FILES.items():
+        with open(os.path.join(folder, name), "rb") as in_f:
+            assert in_f.read() == content
+        assert files[name]["size"] == len(content)
+        assert files[name]["sha256"] == hashlib.sha256(content).hexdigest()
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+from ttd_benchmark.generate import generate_dataset
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# one incremental build against the local stand-ins, in a fresh interpreter with its own hash seed
+BUILD_SCRIPT = """
+import os, sys
+from ttd_benchmark.standins import DiseaseStandin, StandinServer, UniprotStandin
+
+standins = {"uniprot": UniprotStandin(), "disease": DiseaseStandin()}
+with StandinServer({name: standin.app() for name, standin in standins.items()}) as server:
+    os.environ["TTD_UNIPROT_URL"] = server.urls["uniprot"]
+    os.environ["TTD_BIOTHINGS_DISEASE_URL"] = server.urls["disease"] + "/v1"
+    import TTD_parser
+
+    print(sum(1 for _ in TTD_parser.load_data(sys.argv[1])))
+"""
+
+
+def run_build(data_dir, hash_seed):
+    env = {
+        **os.environ,
+        "PYTHONHASHSEED": str(hash_seed),
+        "TTD_INCREMENTAL": "1",
+        "TTD_WORKERS": "1",
+        "TTD_STAGING": "0",
+        "TTD_CACHE_DIR": data_dir,
+    }
+    env.pop("TTD_MONDO_XREF_SNAPSHOT", None)
+    subprocess.run([sys.executable, "-c", BUILD_SCRIPT, data_dir], cwd=ROOT_DIR, env=env, check=True)
+    with open(os.path.join(data_dir, "ttd_build_delta.json")) as in_f:
+        return json.load(in_f)
+
+
+def test_unchanged_files_give_empty_delta(tmp_path):
+    data_dir = str(tmp_path)
+    generate_dataset(data_dir, scale=0.02, seed=0)
+
+    first = run_build(data_dir, hash_seed=1)
+    assert all(loader["rebuilt"] for loader in first["loaders"].values())
+
+    for hash_seed in (2, 3):
+        delta = run_build(data_dir, hash_seed)
+        assert delta["data_release"] == first["data_release"]
+        assert delta["loaders"] == {loader: {"rebuilt": False} for loader in first["loaders"]}
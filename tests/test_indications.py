@@ -0,0 +1,72 @@
+import pytest
+
+from TTD_parser import iter_trial_groups, read_drug_indications
+from ttd_staging import StagingStore
+
+HEADER = "TTD Drug to disease mapping\n-----------------------------------------------\n"
+
+BLOCKS = """\
+TTDDRUID\tD00001
+DRUGNAME\tDrug 1
+INDICATI\tLung cancer [ICD-11: 2C25] Phase 1/2
+INDICATI\tLung cancer [ICD-11: 2C25] Approved
+\t\t\t\t
+TTDDRUID\tD00002
+DRUGNAME\tDrug 2
+INDICATI\tAsthma [ICD-11: CA23] Approved
+"""
+
+# the block of D00001 is split in two by the block of D00002
+SPLIT_BLOCKS = """\
+TTDDRUID\tD00001
+DRUGNAME\tDrug 1
+INDICATI\tLung cancer [ICD-11: 2C25] Phase 1/2
+\t\t\t\t
+TTDDRUID\tD00002
+DRUGNAME\tDrug 2
+INDICATI\tAsthma [ICD-11: CA23] Approved
+\t\t\t\t
+TTDDRUID\tD00001
+DRUGNAME\tDrug 1
+INDICATI\tLung cancer [ICD-11: 2C25] Approved
+"""
+
+TRIALS = [
+    (
+        ("D00001", "Drug 1", "2C25"),
+        [{"status": "phase 1/2", "disease": "Lung cancer"}, {"status": "approved", "disease": "Lung cancer"}],
+    ),
+    (("D00002", "Drug 2", "CA23"), [{"status": "approved", "disease": "Asthma"}]),
+]
+
+
+def read_rows(tmp_path, blocks):
+    (tmp_path / "P1-05-Drug_disease.txt").write_text(HEADER + blocks)
+    return list(read_drug_indications(str(tmp_path)))
+
+
+def iter_staged_trials(tmp_path, rows):
+    with StagingStore(str(tmp_path / "ttd_staging.sqlite")) as store:
+        store.stage("drug_indications", rows)
+        yield from store.iter_trials("drug_indications")
+
+
+def test_trial_groups(tmp_path):
+    rows = read_rows(tmp_path, BLOCKS)
+
+    assert list(iter_trial_groups(rows, "load_drug_dis_data")) == TRIALS
+    assert list(iter_staged_trials(tmp_path, rows)) == TRIALS
+
+
+def test_split_block_fails(tmp_path):
+    rows = read_rows(tmp_path, SPLIT_BLOCKS)
+
+    with pytest.raises(ValueError, match="D00001"):
+        list(iter_trial_groups(rows, "load_drug_dis_data"))
+
+
+def test_split_block_fails_staged(tmp_path):
+    rows = read_rows(tmp_path, SPLIT_BLOCKS)
+
+    with pytest.raises(ValueError, match="D00001"):
+        list(iter_staged_trials(tmp_path, rows))
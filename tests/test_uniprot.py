@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from aiohttp import web
+
+import TTD_parser
+from TTD_parser import UniprotBatchMapping, UniprotCrosswalk, UniprotMapping, UniprotMappingError
+from ttd_benchmark.generate import DatasetGenerator, uniprot_kb
+from ttd_benchmark.standins import StandinServer, UniprotStandin
+
+
+class FailingUniprotStandin(UniprotStandin):
+    """UniprotStandin answering the results of the jobs listing a failing ac with an error message,
+    each failing ac fails for its first `failures` jobs, None fails every job
+    """
+
+    def __init__(self, failing_acs, failures=None, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_acs = {ac: failures for ac in failing_acs}
+
+    async def results(self, request):
+        job_id = request.match_info["job_id"]
+        for ac in self.jobs.get(job_id, (None, []))[1]:
+            failures = self.failing_acs.get(ac, 0)
+            if failures is None or failures > 0:
+                if failures:
+                    self.failing_acs[ac] = failures - 1
+                await self.delay()
+                return web.json_response({"messages": [f"Job {job_id} failed"]})
+        return await super().results(request)
+
+
+def write_targets(tmp_path):
+    generator = DatasetGenerator(str(tmp_path), scale=0.02, seed=0)
+    generator.write_targets()
+    return str(tmp_path)
+
+
+def get_expected_targets(file_path):
+    crosswalk = UniprotCrosswalk.from_file(file_path)
+    expected = []
+    for targ_id in crosswalk.get_target_ids():
+        kbs = [uniprot_kb(ac) for ac in crosswalk.get_uniprot_acs(targ_id) if uniprot_kb(ac)]
+        if kbs:
+            expected.append({"ttd_target_id": targ_id, "uniprot": list(dict.fromkeys(kbs))})
+    return expected
+
+
+def run_mapping(monkeypatch, standin, file_path, **kwargs):
+    with StandinServer({"uniprot": standin.app()}) as server:
+        monkeypatch.setattr(TTD_parser, "UNIPROT_URL", server.urls["uniprot"])
+        (final_list,) = UniprotMapping(file_path, **kwargs).run_async_tasks()
+    return final_list
+
+
+def test_batch_mapping(tmp_path):
+    accessions = UniprotCrosswalk.from_file(write_targets(tmp_path)).get_accessions()
+    standin = UniprotStandin(job_time=0.1)
+    batch_mapping = UniprotBatchMapping(batch_size=40, page_size=3, poll_interval=0.02)
+
+    with StandinServer({"uniprot": standin.app()}) as server:
+        batch_mapping.api_url = server.urls["uniprot"]
+        mapped = batch_mapping.run(accessions)
+
+    expected = {ac: uniprot_kb(ac) for ac in accessions if uniprot_kb(ac)}
+    assert len(expected) < len(accessions)
+    assert {d["uniprot_ac"]: d["uniprot_kb"] for d in mapped} == expected
+    assert len(mapped) == len(expected)
+
+    # every job is submitted, polled while running and fetched page by page through the Link header
+    batches = batch_mapping.get_batches(accessions)
+    pages = sum(-(-sum(1 for ac in batch if ac in expected) // 3) for batch in batches)
+    assert len(standin.jobs) == len(batches)
+    assert standin.requests >= 3 * len(batches) + pages
+
+
+def test_mapping_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("TTD_CACHE_DIR", raising=False)
+    file_path = write_targets(tmp_path)
+    standin = UniprotStandin()
+
+    expected = get_expected_targets(file_path)
+    assert run_mapping(monkeypatch, standin, file_path, batch_size=40, use_cache=True) == expected
+    requests = standin.requests
+
+    # the second build is answered from the cache, unmapped ac included
+    assert run_mapping(monkeypatch, standin, file_path, batch_size=40, use_cache=True) == expected
+    assert standin.requests == requests
+
+
+def test_retry_round_recovers(tmp_path, monkeypatch):
+    file_path = write_targets(tmp_path)
+    accessions = UniprotCrosswalk.from_file(file_path).get_accessions()
+    standin = FailingUniprotStandin([accessions[0], accessions[-1]], failures=1)
+
+    final_list = run_mapping(monkeypatch, standin, file_path, batch_size=40, use_cache=False, retry_rounds=1)
+
+    assert final_list == get_expected_targets(file_path)
+    assert not (tmp_path / TTD_parser.UNIPROT_FAILURE_REPORT).exists()
+
+
+def test_failure_report(tmp_path, monkeypatch):
+    file_path = write_targets(tmp_path)
+    accessions = UniprotCrosswalk.from_file(file_path).get_accessions()
+    standin = FailingUniprotStandin([accessions[0]])
+    expected = get_expected_targets(file_path)
+
+    with pytest.raises(UniprotMappingError, match="after 1 retry rounds"):
+        run_mapping(monkeypatch, standin, file_path, batch_size=40, use_cache=False, retry_rounds=1)
+
+    # the batch of the failing ac is submitted again in the retry round, then reported
+    with open(tmp_path / TTD_parser.UNIPROT_FAILURE_REPORT) as in_f:
+        report = json.load(in_f)
+    assert report["missing"] == accessions[:40]
+    assert [job["accessions"] for job in report["jobs"]] == [accessions[:40]]
+    assert "failed" in report["jobs"][0]["error"]
+    assert len(standin.jobs) == len(range(0, len(accessions), 40)) + 1
+
+    # the report is removed by the next build mapping every ac
+    standin.failing_acs.clear()
+    assert run_mapping(monkeypatch, standin, file_path, batch_size=40, use_cache=False) == expected
+    assert not (tmp_path / TTD_parser.UNIPROT_FAILURE_REPORT).exists()
@@ -0,0 +1,5 @@
+import sys
+
+from ttd_benchmark.runner import main
+
+sys.exit(main())
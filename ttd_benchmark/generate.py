@@ -0,0 +1,280 @@
+import hashlib
+import os
+import random
+
+# approximate row counts of the 8.1.01 release, scale=1.0
+RELEASE_COUNTS = {
+    "targets": 4221,
+    "drugs": 38000,
+    "drug_disease_drugs": 22597,
+    "target_disease_targets": 2373,
+    "icd11_codes": 2000,
+    "drug_target_rows": 44663,
+    "biomarkers": 2512,
+    "activity_rows": 834616,
+    "compounds": 250000,
+}
+
+SOURCE_FILES = (
+    "P1-01-TTD_target_download.txt",
+    "P1-03-TTD_crossmatching.txt",
+    "P1-05-Drug_disease.txt",
+    "P1-06-Target_disease.txt",
+    "P1-07-Drug-TargetMapping.xlsx",
+    "P1-08-Biomarker_disease.txt",
+    "P1-09-Target_compound_activity.txt",
+)
+
+SEPARATOR = "-" * 94
+TARGET_TYPES = ("Successful target", "Clinical trial target", "Patented-recorded target", "Literature-reported target")
+BIOCLASSES = ("Kinase", "Enzyme", "GPCR rhodopsin", "Transporter", "Nuclear hormone receptor", "Ion channel")
+STATUSES = ("Approved", "Phase 1", "Phase 2", "Phase 3", "Phase 1/2", "Investigative", "Discontinued in Phase 2")
+MOAS = ("Inhibitor", "Agonist", "Antagonist", "Modulator", "Binder", ".")
+ACTIVITIES = ("IC50", "Ki", "EC50", "Kd", "Inhibition")
+UNITS = ("nM", "uM", "%")
+
+
+def get_count(name, scale):
+    return max(1, round(RELEASE_COUNTS[name] * scale))
+
+
+def uniprot_kb(uniprot_id):
+    """deterministic uniprot kb accession of a fake uniprot entry name, shared with the UniProt stand-in
+
+    :param uniprot_id: uniprot entry name, e.g. "ABC12_HUMAN"
+    :return: kb accession or None if the entry name is not mapped
+    """
+    digest = hashlib.blake2b(uniprot_id.encode(), digest_size=4).digest()
+    value = int.from_bytes(digest, "little")
+    if value % 20 == 0:
+        return None
+    return f"{'PQO'[value % 3]}{value % 100000:05d}"
+
+
+def icd9_mondo(icd9):
+    """deterministic MONDO id of a fake icd9 code, shared with the disease stand-in
+
+    :param icd9: icd9 code
+    :return: "MONDO:id" or None if the code is not mapped
+    """
+    value = int.from_bytes(hashlib.blake2b(icd9.encode(), digest_size=4).digest(), "little")
+    if value % 10 < 3:
+        return None
+    return f"MONDO:{value % 10000000:07d}"
+
+
+def write_header(out_f, title, abbreviations, lines=None):
+    """TTD like header: title, separator, abbreviations, separator"""
+    header = ["TTD Download", title, "Synthetic benchmark data", "", SEPARATOR, "Abbreviations:"]
+    header += [f"{key}\t{description}" for key, description in abbreviations]
+    header += [SEPARATOR, ""]
+    if lines:
+        # pad to the fixed header size the P1-08 readers expect
+        header += [""] * (lines - len(header))
+    out_f.write("\n".join(header) + "\n")
+
+
+class DatasetGenerator:
+    """
+    The DatasetGenerator object writes a synthetic TTD release with the layout of the manifest.json source files
+    Entity counts follow the 8.1.01 release times scale, values are random but reproducible for a seed
+
+    :param out_dir: directory the source files are written to
+    :type out_dir: str
+    :param scale: size relative to the 8.1.01 release, e.g. 0.1 or 10
+    :type scale: float
+    :param seed: random seed
+    :type seed: int
+    """
+
+    def __init__(self, out_dir, scale=1.0, seed=0):
+        self.out_dir = out_dir
+        self.scale = scale
+        self.rnd = random.Random(seed)
+        self.targets = [f"T{i:05d}" for i in range(get_count("targets", scale))]
+        self.drugs = [f"D{i:06d}" for i in range(get_count("drugs", scale))]
+        self.icd11_codes = [self.random_icd11() for _ in range(get_count("icd11_codes", scale))]
+
+    def random_icd11(self):
+        rnd = self.rnd
+        code = f"{rnd.choice('123456789ABCDEFGHJKLMN')}{rnd.choice('ABCDEFGHJK')}{rnd.randint(0, 99):02d}"
+        return code + rnd.choice(("", "", ".Z", ".Y", f".{rnd.randint(0, 9)}"))
+
+    def random_uniprot_id(self):
+        rnd = self.rnd
+        name = "".join(rnd.choice("ABCDEFGHIKLMNPRSTVWY") for _ in range(rnd.randint(3, 5)))
+        return f"{name}{rnd.randint(1, 20)}_{rnd.choice(('HUMAN', 'HUMAN', 'HUMAN', 'MOUSE', 'RAT'))}"
+
+    def get_path(self, file_name):
+        return os.path.join(self.out_dir, file_name)
+
+    def write_targets(self):
+        rnd = self.rnd
+        abbreviations = [
+            ("TARGETID", "TTD Target ID"),
+            ("UNIPROID", "UniProt ID"),
+            ("TARGNAME", "Target Name"),
+            ("TARGTYPE", "Target Type"),
+            ("BIOCLASS", "BioChemical Class"),
+        ]
+        with open(self.get_path("P1-01-TTD_target_download.txt"), "w") as out_f:
+            write_header(out_f, "Target information of TTD", abbreviations)
+            for targ_id in self.targets:
+                rows = [("TARGETID", targ_id), ("FORMERID", f"TTDS{rnd.randint(0, 99999):05d}")]
+                if rnd.random() < 0.85:
+                    uniprot_ids = [self.random_uniprot_id() for _ in range(rnd.choice((1, 1, 1, 1, 2, 3)))]
+                    rows.append(("UNIPROID", "; ".join(uniprot_ids)))
+                name = f"Synthetic protein {targ_id[1:]}"
+                rows.append(("TARGNAME", f"{name} ({name.split()[-1]})"))
+                rows.append(("GENENAME", f"GENE{targ_id[1:]}"))
+                if rnd.random() < 0.95:
+                    rows.append(("TARGTYPE", rnd.choice(TARGET_TYPES)))
+                rows.append(("FUNCTION", "Synthetic function text. " * rnd.randint(2, 20)))
+                if rnd.random() < 0.6:
+                    rows.append(("BIOCLASS", rnd.choice(BIOCLASSES)))
+                for _ in range(rnd.randint(0, 8)):
+                    drug_id = rnd.choice(self.drugs)
+                    rows.append(("DRUGINFO", f"{drug_id}\tDrug {drug_id}\t{rnd.choice(STATUSES)}"))
+                for key, value in rows:
+                    out_f.write(f"{targ_id}\t{key}\t{value}\n")
+                out_f.write("\t\t\t\t\n")
+
+    def write_drugs(self):
+        rnd = self.rnd
+        abbreviations = [
+            ("TTDDRUID", "TTD Drug ID"),
+            ("DRUGNAME", "Drug Name"),
+            ("PUBCHCID", "PubChem CID"),
+            ("ChEBI_ID", "ChEBI ID"),
+        ]
+        with open(self.get_path("P1-03-TTD_crossmatching.txt"), "w") as out_f:
+            write_header(out_f, "Cross-matching ID between TTD drugs and public databases", abbreviations)
+            for drug_id in self.drugs:
+                rows = [("TTDDRUID", drug_id), ("DRUGNAME", f"Drug {drug_id}")]
+                if rnd.random() < 0.5:
+                    rows.append(
+                        ("CASNUMBE", f"CAS {rnd.randint(10000, 999999)}-{rnd.randint(10, 99)}-{rnd.randint(0, 9)}")
+                    )
+                if rnd.random() < 0.7:
+                    cids = [str(rnd.randint(1, 160000000)) for _ in range(rnd.choice((1, 1, 1, 2)))]
+                    rows.append(("PUBCHCID", "; ".join(cids)))
+                if rnd.random() < 0.25:
+                    rows.append(("ChEBI_ID", f"ChEBI:{rnd.randint(1, 200000)}"))
+                for key, value in rows:
+                    out_f.write(f"{drug_id}\t{key}\t{value}\n")
+                out_f.write("\t\t\n")
+
+    def write_drug_disease(self):
+        rnd = self.rnd
+        abbreviations = [("TTDDRUID", "TTD Drug ID"), ("DRUGNAME", "Drug Name"), ("INDICATI", "Indication")]
+        with open(self.get_path("P1-05-Drug_disease.txt"), "w") as out_f:
+            write_header(out_f, "Drug to disease mapping with ICD identifiers", abbreviations)
+            for drug_id in rnd.sample(self.drugs, min(len(self.drugs), get_count("drug_disease_drugs", self.scale))):
+                out_f.write(f"TTDDRUID\t{drug_id}\nDRUGNAME\tDrug {drug_id}\n")
+                for _ in range(rnd.choice((1, 1, 1, 2, 3))):
+                    icd11 = rnd.choice(self.icd11_codes) if rnd.random() < 0.995 else "N.A."
+                    out_f.write(f"INDICATI\tDisease {icd11} [ICD-11: {icd11}] {rnd.choice(STATUSES)}\n")
+                out_f.write("\t\t\t\t\n")
+
+    def write_target_disease(self):
+        rnd = self.rnd
+        abbreviations = [("TARGETID", "TTD Target ID"), ("TARGNAME", "Target Name"), ("INDICATI", "Indication")]
+        count = min(len(self.targets), get_count("target_disease_targets", self.scale))
+        with open(self.get_path("P1-06-Target_disease.txt"), "w") as out_f:
+            write_header(out_f, "Target to disease mapping with ICD identifiers", abbreviations)
+            for targ_id in rnd.sample(self.targets, count):
+                out_f.write(f"{targ_id}\tTARGETID\t{targ_id}\n{targ_id}\tTARGNAME\tSynthetic protein {targ_id[1:]}\n")
+                for _ in range(rnd.randint(1, 8)):
+                    icd11 = rnd.choice(self.icd11_codes)
+                    status = rnd.choice(TARGET_TYPES[:2])
+                    out_f.write(f"{targ_id}\tINDICATI\t{status}\tDisease {icd11} [ICD-11: {icd11}]\n")
+                out_f.write("\t\t\t\n")
+
+    def write_drug_target_mapping(self):
+        import pandas as pd
+
+        rnd = self.rnd
+        activity_pairs = self.activity_pairs
+        rows = []
+        for _ in range(get_count("drug_target_rows", self.scale)):
+            if activity_pairs and rnd.random() < 0.3:
+                targ_id, drug_id = rnd.choice(activity_pairs)
+            else:
+                targ_id, drug_id = rnd.choice(self.targets), rnd.choice(self.drugs)
+            rows.append(
+                {
+                    "TargetID": targ_id,
+                    "DrugID": drug_id,
+                    "Highest_status": rnd.choice(STATUSES),
+                    "MOA": rnd.choice(MOAS),
+                }
+            )
+        pd.DataFrame(rows).to_excel(self.get_path("P1-07-Drug-TargetMapping.xlsx"), index=False, engine="openpyxl")
+
+    def write_biomarkers(self):
+        rnd = self.rnd
+        with open(self.get_path("P1-08-Biomarker_disease.txt"), "w") as out_f:
+            # the biomarker readers skip a fixed header of 16 rows
+            write_header(
+                out_f, "Biomarker to disease mapping with ICD identifiers", [("BiomarkerID", "Biomarker ID")], 16
+            )
+            for i in range(get_count("biomarkers", self.scale)):
+                names = [f"Biomarker {i}-{j} (BM{i}{j})" for j in range(rnd.choice((1, 1, 1, 2)))]
+                if rnd.random() < 0.1:
+                    names.append(f"Plain marker {i}")
+                icd11 = rnd.choice(self.icd11_codes)
+                icd10 = f"ICD-10: C{rnd.randint(0, 99):02d}" if rnd.random() < 0.7 else "."
+                icd9s = ", ".join(str(rnd.randint(1, 999)) for _ in range(rnd.choice((1, 1, 2))))
+                icd9 = f"ICD-9: {icd9s}" if rnd.random() < 0.6 else "."
+                row = [f"BM{i:05d}", ", ".join(names), f"Disease {icd11}", f"ICD-11: {icd11}", icd10, icd9]
+                out_f.write("\t".join(row) + "\n")
+
+    def write_activities(self):
+        rnd = self.rnd
+        compounds = get_count("compounds", self.scale)
+        activity_drugs = self.drugs[: len(self.drugs) // 4]
+        self.activity_pairs = []
+        with open(self.get_path("P1-09-Target_compound_activity.txt"), "w") as out_f:
+            out_f.write("TargetID\tDrugID\tPubchem_CID\tActivity\n")
+            for _ in range(get_count("activity_rows", self.scale)):
+                targ_id = rnd.choice(self.targets)
+                if rnd.random() < 0.2:
+                    drug_id = rnd.choice(activity_drugs)
+                else:
+                    drug_id = f"D{rnd.randint(0, compounds) + len(self.drugs):06d}"
+                activity = rnd.choice(ACTIVITIES)
+                relation = rnd.choice(("=", "=", "=", ">", "<"))
+                value = round(rnd.lognormvariate(3, 2), 2)
+                if activity == "Inhibition":
+                    activity_text = f"Inhibition {min(value, 100)}%"
+                else:
+                    activity_text = f"{activity} {relation} {value} {rnd.choice(UNITS[:2])}"
+                out_f.write(f"{targ_id}\t{drug_id}\t{rnd.randint(1, 160000000)}\t{activity_text}\n")
+                if len(self.activity_pairs) < 100000:
+                    self.activity_pairs.append((targ_id, drug_id))
+
+    def run(self):
+        """write all source files
+
+        :return: list of the written file paths
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.write_targets()
+        self.write_drugs()
+        self.write_drug_disease()
+        self.write_target_disease()
+        self.write_biomarkers()
+        self.write_activities()
+        self.write_drug_target_mapping()
+        return [self.get_path(file_name) for file_name in SOURCE_FILES]
+
+
+def generate_dataset(out_dir, scale=1.0, seed=0):
+    """write a synthetic TTD release
+
+    :param out_dir: directory the source files are written to
+    :param scale: size relative to the 8.1.01 release, 0.1 to 10
+    :param seed: random seed
+    :return: list of the written file paths
+    """
+    return DatasetGenerator(out_dir, scale=scale, seed=seed).run()
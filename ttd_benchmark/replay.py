@@ -0,0 +1,178 @@
+import asyncio
+import math
+from collections import deque
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from ttd_benchmark.standins import Standin
+from ttd_cassette import ORIGIN_MARKER, get_entry_body, get_request_key, read_cassettes
+
+# base url variables of the plugin with their default, pointed at the replay server of the recorded origin
+BASE_URL_VARIABLES = {
+    "TTD_UNIPROT_URL": "https://rest.uniprot.org",
+    "TTD_BIOTHINGS_DISEASE_URL": "https://mydisease.info/v1",
+}
+
+
+def parse_latency(spec):
+    """latency distribution of a replay server
+
+    :param spec: "0.05" or "fixed:0.05", "uniform:low:high", "lognormal:median:sigma",
+                 "recorded" or "recorded:factor" for the recorded elapsed time of each response
+    :return: function(rnd, entry) returning seconds
+    """
+    name, _, args = str(spec).partition(":")
+    values = [float(value) for value in args.split(":")] if args else []
+    if name == "fixed":
+        return lambda rnd, entry: values[0]
+    if name == "uniform":
+        return lambda rnd, entry: rnd.uniform(values[0], values[1])
+    if name == "lognormal":
+        return lambda rnd, entry: rnd.lognormvariate(math.log(values[0]), values[1])
+    if name == "recorded":
+        factor = values[0] if values else 1.0
+        return lambda rnd, entry: entry.get("elapsed", 0.0) * factor if entry else 0.0
+    seconds = float(spec)
+    return lambda rnd, entry: seconds
+
+
+class CassetteReplay(Standin):
+    """
+    The CassetteReplay object serves the recorded responses of one origin from ttd_cassette cassettes
+    A request is answered with the next recorded response of the same method, path, query and form data,
+    the last one is repeated once they are used up, e.g. the final status of a polled idmapping job.
+    Unknown requests get a 404. On top of the 503 failures of Standin, a share of the requests can be
+    throttled with a 429, disconnected without a response or left hanging past the client timeout
+
+    :param entries: cassette entries of the origin from ttd_cassette.read_cassettes()
+    :type entries: list
+    :param latency: latency distribution, see parse_latency()
+    :type latency: str
+    :param failure_rate: share of requests answered with 503
+    :type failure_rate: float
+    :param throttle_rate: share of requests answered with 429
+    :type throttle_rate: float
+    :param disconnect_rate: share of requests whose connection is closed without a response
+    :type disconnect_rate: float
+    :param timeout_rate: share of requests answered only after hang seconds
+    :type timeout_rate: float
+    :param hang: seconds a timed out request hangs
+    :type hang: float
+    :param retry_after: Retry-After seconds of the 429/503 responses
+    :type retry_after: float
+    :param collapse: serve the last recorded response of a repeated request right away,
+                     e.g. skip the RUNNING polls of an idmapping job
+    :type collapse: bool
+    :param seed: random seed of the latency and of the injected faults
+    :type seed: int
+    """
+
+    def __init__(
+        self,
+        entries,
+        latency="0",
+        failure_rate=0.0,
+        throttle_rate=0.0,
+        disconnect_rate=0.0,
+        timeout_rate=0.0,
+        hang=60.0,
+        retry_after=0.0,
+        collapse=False,
+        seed=0,
+    ):
+        super().__init__(0.0, failure_rate, seed)
+        self.sample_latency = parse_latency(latency)
+        self.throttle_rate = throttle_rate
+        self.disconnect_rate = disconnect_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.retry_after = retry_after
+        self.responses = {}
+        for entry in entries:
+            key = get_request_key(entry["method"], entry["path"], entry["query"], entry["data"])
+            self.responses.setdefault(key, deque()).append(entry)
+        if collapse:
+            self.responses = {key: deque([queue[-1]]) for key, queue in self.responses.items()}
+        self.misses = 0
+        self.faults = {"throttled": 0, "disconnected": 0, "timed_out": 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.replay)
+        return app
+
+    def next_entry(self, key, consume=True):
+        """next recorded response of a request key, a faulted request peeks it without consuming it"""
+        queue = self.responses.get(key)
+        if not queue:
+            return None
+        return queue.popleft() if consume and len(queue) > 1 else queue[0]
+
+    async def inject_fault(self, request):
+        """raise or delay the injected faults, the 503 failures of Standin come first
+
+        :return: True if the connection was closed
+        """
+        if self.rnd.random() < self.failure_rate:
+            self.failures += 1
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": str(self.retry_after)})
+        draw = self.rnd.random()
+        if draw < self.throttle_rate:
+            self.faults["throttled"] += 1
+            raise web.HTTPTooManyRequests(headers={"Retry-After": str(self.retry_after)})
+        draw -= self.throttle_rate
+        if draw < self.disconnect_rate:
+            self.faults["disconnected"] += 1
+            request.transport.close()
+            return True
+        draw -= self.disconnect_rate
+        if draw < self.timeout_rate:
+            self.faults["timed_out"] += 1
+            await asyncio.sleep(self.hang)
+        return False
+
+    async def replay(self, request):
+        self.requests += 1
+        data = await request.post() if request.method == "POST" else {}
+        key = get_request_key(request.method, request.path, request.query.items(), data.items())
+        await asyncio.sleep(self.sample_latency(self.rnd, self.next_entry(key, consume=False)))
+        if await self.inject_fault(request):
+            return web.Response()
+        entry = self.next_entry(key)
+        if entry is None:
+            self.misses += 1
+            message = f"no recorded response for {request.method} {request.path_qs}"
+            return web.json_response({"messages": [message]}, status=404)
+
+        origin = f"{request.scheme}://{request.host}"
+        headers = {name: value.replace(ORIGIN_MARKER, origin) for name, value in entry["headers"].items()}
+        return web.Response(status=entry["status"], headers=headers, body=get_entry_body(entry, origin))
+
+    def get_stats(self):
+        return {**super().get_stats(), "misses": self.misses, **self.faults}
+
+
+def get_replays(cassette_dir, **kwargs):
+    """one CassetteReplay per recorded origin
+
+    :param cassette_dir: directory of the cassettes of one recording
+    :param kwargs: CassetteReplay parameters
+    :return: dictionary {recorded origin: CassetteReplay}
+    """
+    return {origin: CassetteReplay(entries, **kwargs) for origin, entries in read_cassettes(cassette_dir).items()}
+
+
+def get_base_urls(server_urls):
+    """values of the BASE_URL_VARIABLES pointing the plugin at the replay servers
+
+    :param server_urls: dictionary {recorded origin: url of its replay server}
+    :return: dictionary {variable: base url}, variables without a recorded origin are left out
+    """
+    base_urls = {}
+    for variable, default in BASE_URL_VARIABLES.items():
+        parts = urlsplit(default)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin in server_urls:
+            base_urls[variable] = server_urls[origin] + parts.path.rstrip("/")
+    return base_urls
@@ -0,0 +1,328 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from ttd_benchmark.generate import SOURCE_FILES, generate_dataset
+from ttd_benchmark.replay import get_base_urls, get_replays
+from ttd_benchmark.standins import DiseaseStandin, StandinServer, UniprotStandin
+
+# loaders timed one by one after the shared lookups are built, then load_data end to end
+LOADER_STAGES = ("load_drug_dis_data", "load_target_dis_data", "load_biomarker_dis_data", "merge_drug_target")
+STAGES = ("context",) + LOADER_STAGES + ("load_data",)
+
+
+def get_peak_rss_mb():
+    """peak RSS of this process and of its finished children (e.g. the TTD_WORKERS pool), in MiB"""
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return round(peak_kb / 1024, 1)
+
+
+def run_stage(stage, data_dir):
+    """run one stage in the current process
+
+    :param stage: "context", a loader name of TTD_parser or "load_data"
+    :param data_dir: directory of the source files
+    :return: dictionary {"seconds", "docs", "docs_per_second", "setup_seconds", "peak_rss_mb"}
+    """
+    import TTD_parser
+
+    setup_seconds = 0.0
+    start = time.perf_counter()
+    if stage == "context":
+        TTD_parser.BuildContext(data_dir).load_all()
+        docs = 0
+    elif stage == "load_data":
+        docs = sum(1 for _ in TTD_parser.load_data(data_dir))
+    else:
+        context = TTD_parser.BuildContext(data_dir).load_all()
+        setup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        docs = sum(1 for _ in getattr(TTD_parser, stage)(data_dir, context))
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": round(seconds, 3),
+        "docs": docs,
+        "docs_per_second": round(docs / seconds, 1) if docs and seconds else None,
+        "setup_seconds": round(setup_seconds, 3),
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def stage_process(stage, data_dir, connection):
+    try:
+        connection.send(run_stage(stage, data_dir))
+    except BaseException as exc:
+        connection.send({"error": repr(exc)})
+        raise
+    finally:
+        connection.close()
+
+
+def run_isolated(stage, data_dir):
+    """run one stage in a fresh interpreter, so its peak RSS is not hidden by the previous stages"""
+    context = multiprocessing.get_context("spawn")
+    parent_connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(target=stage_process, args=(stage, data_dir, child_connection))
+    process.start()
+    child_connection.close()
+    try:
+        result = parent_connection.recv()
+    except EOFError:
+        result = {"error": f"stage process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def clear_build_caches(data_dir):
+    """remove the mapping cache, the staging store and the columnar conversions so every stage starts cold"""
+    for cache_file in (
+        glob.glob(os.path.join(data_dir, "*.columns.npz"))
+        + glob.glob(os.path.join(data_dir, "ttd_mapping_cache.sqlite*"))
+        + glob.glob(os.path.join(data_dir, "ttd_staging.sqlite*"))
+    ):
+        os.remove(cache_file)
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_dataset_stats(data_dir):
+    stats = {}
+    for file_name in SOURCE_FILES:
+        path = os.path.join(data_dir, file_name)
+        stats[file_name] = {"bytes": os.path.getsize(path)}
+        if not file_name.endswith(".xlsx"):
+            with open(path, "rb") as in_f:
+                stats[file_name]["rows"] = sum(block.count(b"\n") for block in iter(lambda: in_f.read(1 << 20), b""))
+    return stats
+
+
+def run_benchmark(
+    data_dir=None,
+    scale=0.1,
+    seed=0,
+    stages=STAGES,
+    latency=0.0,
+    failure_rate=0.0,
+    workers=1,
+    warm=False,
+    cassettes=None,
+    latency_dist=None,
+    throttle_rate=0.0,
+    disconnect_rate=0.0,
+    timeout_rate=0.0,
+):
+    """generate (or reuse) a synthetic release, start the API stand-ins and time every stage
+    with cassettes, the recorded API responses are replayed instead, see ttd_benchmark.replay
+
+    :param data_dir: directory of the source files, a synthetic release is generated if it has none
+    :param scale: size of the generated release relative to 8.1.01
+    :param seed: random seed of the generated release and of the injected failures
+    :param stages: names of the stages to run, see STAGES
+    :param latency: seconds added to every stand-in request
+    :param failure_rate: share of the stand-in requests answered with 503
+    :param workers: TTD_WORKERS of the build
+    :param warm: keep the mapping cache and the columnar conversions between stages
+    :param cassettes: directory of cassettes recorded with TTD_HTTP_RECORD, replayed in place of the stand-ins
+    :param latency_dist: latency distribution of the replayed requests, see replay.parse_latency(),
+                         latency seconds if not given
+    :param throttle_rate: share of the replayed requests answered with 429
+    :param disconnect_rate: share of the replayed requests disconnected without a response
+    :param timeout_rate: share of the replayed requests hanging past the client timeout
+    :return: results dictionary
+    """
+    tmp_dir = None
+    if data_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="ttd_benchmark_")
+        data_dir = tmp_dir.name
+
+    try:
+        generate_seconds = None
+        if not all(os.path.exists(os.path.join(data_dir, file_name)) for file_name in SOURCE_FILES):
+            start = time.perf_counter()
+            generate_dataset(data_dir, scale=scale, seed=seed)
+            generate_seconds = round(time.perf_counter() - start, 3)
+
+        if cassettes:
+            # the replayed requests must hang longer than the client waits for them
+            standins = get_replays(
+                cassettes,
+                latency=latency_dist or latency,
+                failure_rate=failure_rate,
+                throttle_rate=throttle_rate,
+                disconnect_rate=disconnect_rate,
+                timeout_rate=timeout_rate,
+                hang=float(os.environ.get("TTD_HTTP_TIMEOUT", 300)) + 1,
+                seed=seed,
+            )
+        else:
+            standins = {
+                "uniprot": UniprotStandin(latency=latency, failure_rate=failure_rate, seed=seed),
+                "disease": DiseaseStandin(latency=latency, failure_rate=failure_rate, seed=seed),
+            }
+        results = {
+            "commit": get_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {
+                "scale": scale,
+                "seed": seed,
+                "latency": latency,
+                "failure_rate": failure_rate,
+                "workers": workers,
+                "warm": warm,
+                "cassettes": cassettes,
+                "latency_dist": latency_dist,
+                "throttle_rate": throttle_rate,
+                "disconnect_rate": disconnect_rate,
+                "timeout_rate": timeout_rate,
+            },
+            "generate_seconds": generate_seconds,
+            "dataset": get_dataset_stats(data_dir),
+            "stages": {},
+        }
+
+        with StandinServer({name: standin.app() for name, standin in standins.items()}) as server:
+            # read by TTD_parser and its modules on import in the stage processes
+            if cassettes:
+                os.environ.update(get_base_urls(server.urls))
+            else:
+                os.environ["TTD_UNIPROT_URL"] = server.urls["uniprot"]
+                os.environ["TTD_BIOTHINGS_DISEASE_URL"] = f"{server.urls['disease']}/v1"
+            os.environ["TTD_WORKERS"] = str(workers)
+            os.environ.pop("TTD_MONDO_XREF_SNAPSHOT", None)
+
+            for stage in stages:
+                if not warm:
+                    clear_build_caches(data_dir)
+                print(f"running {stage} ...", file=sys.stderr)
+                results["stages"][stage] = run_isolated(stage, data_dir)
+                print(f"{stage}: {json.dumps(results['stages'][stage])}", file=sys.stderr)
+
+        results["standins"] = {name: standin.get_stats() for name, standin in standins.items()}
+        return results
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+
+def compare_results(base, new, threshold=0.1):
+    """per stage comparison of two result files
+
+    :param base: results dictionary of the reference commit
+    :param new: results dictionary of the compared commit
+    :param threshold: relative slowdown or memory growth reported as a regression
+    :return: (list of report lines, True if a regression was found)
+    """
+    lines = [f"{'stage':<26}{'seconds':>20}{'peak rss mb':>24}{'docs':>16}"]
+    regression = False
+    for stage, new_stage in new["stages"].items():
+        base_stage = base["stages"].get(stage)
+        if not base_stage or "error" in base_stage or "error" in new_stage:
+            lines.append(f"{stage:<26}{'n/a':>20}")
+            continue
+        cells = []
+        for key in ("seconds", "peak_rss_mb"):
+            ratio = new_stage[key] / base_stage[key] if base_stage[key] else 1.0
+            if ratio > 1 + threshold:
+                regression = True
+            cells.append(f"{base_stage[key]} -> {new_stage[key]} ({ratio:.2f}x)")
+        docs = "" if base_stage["docs"] == new_stage["docs"] else f"{base_stage['docs']} -> {new_stage['docs']}"
+        lines.append(f"{stage:<26}{cells[0]:>20}{cells[1]:>24}{docs:>16}")
+    return lines, regression
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ttd_benchmark", description="TTD plugin benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="write a synthetic TTD release")
+    generate_parser.add_argument("data_dir")
+    generate_parser.add_argument("--scale", type=float, default=1.0)
+    generate_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser("run", help="time the loaders against local API stand-ins")
+    run_parser.add_argument("--data-dir", help="reuse a release, generated into it when missing")
+    run_parser.add_argument("--scale", type=float, default=0.1)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    run_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API request")
+    run_parser.add_argument("--failure-rate", type=float, default=0.0, help="share of API requests failing with 503")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--warm", action="store_true", help="keep the caches between stages")
+    run_parser.add_argument("--cassettes", help="replay the API responses recorded into this TTD_HTTP_RECORD directory")
+    run_parser.add_argument(
+        "--latency-dist",
+        help='latency of the replayed requests, e.g. "uniform:0.01:0.2", "lognormal:0.05:0.5", "recorded"',
+    )
+    run_parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="share of replayed requests failing with 429"
+    )
+    run_parser.add_argument(
+        "--disconnect-rate", type=float, default=0.0, help="share of replayed requests disconnected"
+    )
+    run_parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of replayed requests timing out")
+    run_parser.add_argument("--output", help="results json file, printed to stdout if not given")
+
+    compare_parser = commands.add_parser("compare", help="compare two results json files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        for path in generate_dataset(args.data_dir, scale=args.scale, seed=args.seed):
+            print(path)
+        return 0
+
+    if args.command == "compare":
+        with open(args.base) as base_f, open(args.new) as new_f:
+            lines, regression = compare_results(json.load(base_f), json.load(new_f), args.threshold)
+        print("\n".join(lines))
+        return 1 if regression else 0
+
+    results = run_benchmark(
+        data_dir=args.data_dir,
+        scale=args.scale,
+        seed=args.seed,
+        stages=args.stages,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        workers=args.workers,
+        warm=args.warm,
+        cassettes=args.cassettes,
+        latency_dist=args.latency_dist,
+        throttle_rate=args.throttle_rate,
+        disconnect_rate=args.disconnect_rate,
+        timeout_rate=args.timeout_rate,
+    )
+    if args.output:
+        with open(args.output, "w") as out_f:
+            json.dump(results, out_f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    return 1 if any("error" in stage for stage in results["stages"].values()) else 0
@@ -0,0 +1,175 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+
+from aiohttp import web
+
+from ttd_benchmark.generate import icd9_mondo, uniprot_kb
+
+
+class Standin:
+    """
+    The Standin object is the base of the local API stand-ins
+    Every request waits latency seconds, a failure_rate share of them is answered with
+    a 503 and a Retry-After header like a throttled upstream
+
+    :param latency: seconds added to every request
+    :type latency: float
+    :param failure_rate: share of requests answered with 503, 0 to 1
+    :type failure_rate: float
+    :param seed: random seed of the injected failures
+    :type seed: int
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rnd = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+
+    async def delay(self):
+        """count the request, wait the latency and raise the injected failures"""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rnd.random() < self.failure_rate:
+            self.failures += 1
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "0"})
+
+    def get_stats(self):
+        return {"requests": self.requests, "failures": self.failures}
+
+
+class UniprotStandin(Standin):
+    """
+    The UniprotStandin object answers the uniprot idmapping endpoints used by TTD_parser:
+    job submission, job status (redirected once the job is finished) and paginated results
+
+    :param job_time: seconds a job stays RUNNING after its submission
+    :type job_time: float
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0, job_time=0.0):
+        super().__init__(latency, failure_rate, seed)
+        self.job_time = job_time
+        self.jobs = {}
+        self.job_counter = itertools.count()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/idmapping/run", self.run)
+        app.router.add_get("/idmapping/status/{job_id}", self.status)
+        app.router.add_get("/idmapping/results/{job_id}", self.results)
+        app.router.add_get("/idmapping/uniprotkb/results/{job_id}", self.results)
+        return app
+
+    async def run(self, request):
+        await self.delay()
+        data = await request.post()
+        job_id = f"job{next(self.job_counter)}"
+        self.jobs[job_id] = (time.monotonic(), data["ids"].split(","))
+        return web.json_response({"jobId": job_id})
+
+    async def status(self, request):
+        await self.delay()
+        job_id = request.match_info["job_id"]
+        if job_id not in self.jobs:
+            return web.json_response({"jobStatus": "ERROR"})
+        submitted, _ = self.jobs[job_id]
+        if time.monotonic() - submitted < self.job_time:
+            return web.json_response({"jobStatus": "RUNNING"})
+        raise web.HTTPSeeOther(f"/idmapping/results/{job_id}")
+
+    async def results(self, request):
+        await self.delay()
+        job_id = request.match_info["job_id"]
+        if job_id not in self.jobs:
+            return web.json_response({"url": str(request.url), "messages": [f"Job {job_id} not found"]})
+
+        results, failed_ids = [], []
+        for uniprot_id in self.jobs[job_id][1]:
+            kb = uniprot_kb(uniprot_id)
+            if kb:
+                results.append({"from": uniprot_id, "to": {"primaryAccession": kb}})
+            else:
+                failed_ids.append(uniprot_id)
+
+        size = int(request.query.get("size", 25))
+        cursor = int(request.query.get("cursor", 0))
+        body = {"results": results[cursor : cursor + size]}
+        if failed_ids:
+            body["failedIds"] = failed_ids
+        headers = {}
+        if cursor + size < len(results):
+            next_url = request.url.update_query({"cursor": cursor + size, "size": size})
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return web.json_response(body, headers=headers)
+
+
+class DiseaseStandin(Standin):
+    """
+    The DiseaseStandin object answers the BioThings disease POST /v1/query endpoint used by ttd_disease
+    """
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/query", self.query)
+        return app
+
+    async def query(self, request):
+        await self.delay()
+        data = await request.post()
+        hits = []
+        for icd9 in data["q"].split(","):
+            mondo = icd9_mondo(icd9)
+            if mondo:
+                hits.append({"query": icd9, "_id": mondo, "mondo": {"mondo": mondo}})
+            else:
+                hits.append({"query": icd9, "notfound": True})
+        return web.json_response(hits)
+
+
+class StandinServer:
+    """
+    The StandinServer object serves aiohttp applications on free localhost ports
+    from an event loop running in a background thread
+
+    :param apps: dictionary {name: aiohttp application}
+    :type apps: dict
+    """
+
+    def __init__(self, apps):
+        self.apps = apps
+        self.urls = {}
+        self.loop = asyncio.new_event_loop()
+        self.runners = []
+        self.thread = None
+
+    async def start_apps(self):
+        for name, app in self.apps.items():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            self.runners.append(runner)
+            port = runner.addresses[0][1]
+            self.urls[name] = f"http://127.0.0.1:{port}"
+
+    async def stop_apps(self):
+        for runner in self.runners:
+            await runner.cleanup()
+
+    def __enter__(self):
+        self.loop.run_until_complete(self.start_apps())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.stop_apps(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
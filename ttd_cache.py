@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+import time
+
+from ttd_metrics import metrics
+
+# persistent cache of external id mappings, stored next to the data files unless TTD_CACHE_DIR is set
+CACHE_FILE = "ttd_mapping_cache.sqlite"
+CACHE_ENABLED = os.environ.get("TTD_CACHE", "1") != "0"
+CACHE_TTL = float(os.environ.get("TTD_CACHE_TTL_DAYS", 30)) * 24 * 3600
+# uniprot keeps the results of an idmapping job for 7 days
+JOB_MAX_AGE = 6 * 24 * 3600
+
+# sqlite limits the number of host parameters in one statement
+SQL_CHUNK_SIZE = 500
+
+
+def get_cache_path(file_path):
+    """location of the mapping cache database
+
+    :param file_path: directory stores the downloaded data files
+    :return: path of the sqlite file
+    """
+    return os.path.join(os.environ.get("TTD_CACHE_DIR", file_path), CACHE_FILE)
+
+
+class MappingCache:
+    """
+    The MappingCache object is a persistent key-value store of mapping results in a sqlite table
+    Negative results ("not found") are stored as None so they are not requested again
+    Entries older than ttl seconds are treated as missing
+
+    :param db_path: path of the sqlite file
+    :type db_path: str
+    :param table: table name, one table per mapping (e.g. "uniprot_kb")
+    :type table: str
+    :param ttl: time to live of an entry in seconds, None never expires
+    :type ttl: float
+    """
+
+    def __init__(self, db_path, table, ttl=CACHE_TTL):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, updated REAL NOT NULL)"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys):
+        """bulk lookup of fresh entries
+
+        :param keys: iterable of keys
+        :return: dictionary {key: value} of the cached keys only, value is None for a cached "not found"
+        """
+        keys = list(keys)
+        min_updated = time.time() - self.ttl if self.ttl else 0
+        found = {}
+        for i in range(0, len(keys), SQL_CHUNK_SIZE):
+            chunk = keys[i : i + SQL_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND updated >= ?",
+                (*chunk, min_updated),
+            )
+            for key, value in rows:
+                found[key] = json.loads(value)
+        metrics.count(f"cache.{self.table}.hits", len(found))
+        metrics.count(f"cache.{self.table}.misses", len(keys) - len(found))
+        return found
+
+    def set_many(self, items):
+        """bulk insert or refresh entries in one transaction
+
+        :param items: dictionary {key: value}, None records a "not found"
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated) VALUES (?, ?, ?)",
+                ((key, json.dumps(value), now) for key, value in items.items()),
+            )
+
+
+class JobCheckpoint:
+    """
+    The JobCheckpoint object records the submitted idmapping jobs in a sqlite table next to the mapping cache,
+    so a restarted build fetches the results of its outstanding jobs instead of submitting them again
+    A job is removed once its results are written to the mapping cache,
+    jobs older than max_age seconds are dropped as uniprot expires their results
+
+    :param db_path: path of the sqlite file
+    :type db_path: str
+    :param table: table name, one table per remote job type (e.g. "uniprot_jobs")
+    :type table: str
+    :param max_age: seconds a submitted job can be resumed
+    :type max_age: float
+    """
+
+    def __init__(self, db_path, table, max_age=JOB_MAX_AGE):
+        self.db_path = db_path
+        self.table = table
+        self.max_age = max_age
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}"
+                " (accessions TEXT PRIMARY KEY, job_id TEXT, submitted REAL NOT NULL)"
+            )
+            self.conn.execute(f"DELETE FROM {table} WHERE submitted < ?", (time.time() - max_age,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_jobs(self):
+        """
+        :return: list of (list of accessions, job id) of the outstanding jobs in submission order
+        """
+        rows = self.conn.execute(f"SELECT accessions, job_id FROM {self.table} ORDER BY submitted")
+        return [(accessions.split(","), job_id) for accessions, job_id in rows]
+
+    def add_job(self, accessions, job_id):
+        with self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (accessions, job_id, submitted) VALUES (?, ?, ?)",
+                (",".join(accessions), job_id, time.time()),
+            )
+
+    def remove_job(self, accessions):
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE accessions = ?", (",".join(accessions),))
@@ -0,0 +1,145 @@
+import base64
+import glob
+import gzip
+import json
+import os
+import zlib
+
+from yarl import URL
+
+# directory the responses of the plugin http clients are recorded to, one cassette per host, empty disables it
+HTTP_RECORD = os.environ.get("TTD_HTTP_RECORD", "")
+CASSETTE_SUFFIX = ".jsonl.gz"
+# placeholder of the recorded origin in the bodies and in the Link/Location headers,
+# replaced by the origin of the replay server
+ORIGIN_MARKER = "{{origin}}"
+# response headers kept in a cassette
+RECORDED_HEADERS = ("Content-Type", "Link", "Location", "Retry-After")
+
+
+def get_request_key(method, path, query, data):
+    """key a recorded request is replayed for
+
+    :param method: http method
+    :param path: url path, e.g. "/idmapping/run"
+    :param query: iterable of (name, value) query parameters
+    :param data: iterable of (name, value) form fields
+    :return: tuple
+    """
+    return (
+        method.upper(),
+        path,
+        tuple(sorted((str(k), str(v)) for k, v in query)),
+        tuple(sorted((str(k), str(v)) for k, v in data)),
+    )
+
+
+class CassetteRecorder:
+    """
+    The CassetteRecorder object appends the responses of one AsyncHttpClient session to compact cassettes,
+    one gzip json lines file per host in record_dir. Every session appends its own gzip member,
+    and every entry is flushed, so the cassette of an interrupted build stays readable up to its last entry
+
+    Each entry holds the request (method, origin, path, query, form data) and the response
+    (status, RECORDED_HEADERS, body, elapsed seconds), the recorded origin is replaced by ORIGIN_MARKER
+
+    :param record_dir: directory of the cassettes
+    :type record_dir: str
+    """
+
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+        self.files = {}
+        os.makedirs(record_dir, exist_ok=True)
+
+    def close(self):
+        for cassette in self.files.values():
+            cassette.close()
+        self.files = {}
+
+    def get_file(self, host):
+        if host not in self.files:
+            cassette_file = os.path.join(self.record_dir, f"{host.replace(':', '_')}{CASSETTE_SUFFIX}")
+            self.files[host] = gzip.open(cassette_file, "ab")
+        return self.files[host]
+
+    def record(self, method, url, params, data, response, elapsed):
+        """append one response
+
+        :param method: http method
+        :param url: request url
+        :param params: query parameters of the request or None
+        :param data: form fields of the request or None
+        :param response: ttd_http.HttpResponse
+        :param elapsed: seconds the request took
+        """
+        url = URL(url).extend_query(params) if params else URL(url)
+        origin = str(url.origin())
+        entry = {
+            "method": method.upper(),
+            "origin": origin,
+            "path": url.path,
+            "query": list(url.query.items()),
+            "data": [[str(k), str(v)] for k, v in (data or {}).items()],
+            "status": response.status,
+            "headers": {
+                name: response.headers[name].replace(origin, ORIGIN_MARKER)
+                for name in RECORDED_HEADERS
+                if name in response.headers
+            },
+            "elapsed": round(elapsed, 4),
+        }
+        try:
+            entry["body"] = response.body.decode("utf-8").replace(origin, ORIGIN_MARKER)
+        except UnicodeDecodeError:
+            entry["body_base64"] = base64.b64encode(response.body).decode("ascii")
+
+        cassette = self.get_file(url.host if url.port in (None, 80, 443) else f"{url.host}:{url.port}")
+        cassette.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+        cassette.flush(zlib.Z_SYNC_FLUSH)
+
+
+def get_recorder(record_dir=HTTP_RECORD):
+    """
+    :return: CassetteRecorder of TTD_HTTP_RECORD or None if recording is disabled
+    """
+    return CassetteRecorder(record_dir) if record_dir else None
+
+
+def read_cassette(cassette_file):
+    """entries of a cassette in recorded order, the trailing partial entry of an interrupted build is skipped
+
+    :param cassette_file: path of a cassette
+    :return: list of entry dictionaries
+    """
+    entries = []
+    with gzip.open(cassette_file, "rb") as in_f:
+        try:
+            for line in in_f:
+                entries.append(json.loads(line))
+        except (EOFError, OSError, zlib.error, json.JSONDecodeError):
+            # the last gzip member of an interrupted session has no trailer
+            pass
+    return entries
+
+
+def read_cassettes(cassette_dir):
+    """
+    :param cassette_dir: directory of the cassettes of one recording
+    :return: dictionary {recorded origin: list of entries}
+    """
+    origins = {}
+    for cassette_file in sorted(glob.glob(os.path.join(cassette_dir, f"*{CASSETTE_SUFFIX}"))):
+        for entry in read_cassette(cassette_file):
+            origins.setdefault(entry["origin"], []).append(entry)
+    return origins
+
+
+def get_entry_body(entry, origin):
+    """response body of an entry with the recorded origin replaced by origin
+
+    :return: bytes
+    """
+    if "body_base64" in entry:
+        return base64.b64decode(entry["body_base64"])
+    return entry["body"].replace(ORIGIN_MARKER, origin).encode("utf-8")
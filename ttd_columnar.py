@@ -0,0 +1,194 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+from ttd_metrics import metrics
+from ttd_reader import get_compression, open_source
+
+# columns of P1-07-Drug-TargetMapping.xlsx used by the drug-target loaders
+DRUG_TARGET_COLUMNS = ("TargetID", "DrugID", "Highest_status", "MOA")
+CACHE_SUFFIX = ".columns.npz"
+
+
+def get_file_signature(file_name, with_hash=True):
+    """size, mtime and sha256 of a source file
+
+    :param file_name: path of the file
+    :param with_hash: also compute the sha256 of the content
+    :return: dictionary {"size": int, "mtime_ns": int, "sha256": str}
+    """
+    stat = os.stat(file_name)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(file_name, "rb") as in_f:
+            for block in iter(lambda: in_f.read(1 << 20), b""):
+                sha256.update(block)
+        signature["sha256"] = sha256.hexdigest()
+    return signature
+
+
+def load_cached_columns(cache_file, source_file, columns):
+    """read the columns from the cache if it was converted from the current source file
+    a changed size/mtime falls back to comparing the sha256, so copied or touched files still hit
+
+    :return: dictionary {column: list of str} or None if the cache is missing or stale
+    """
+    if not os.path.exists(cache_file):
+        return None
+    with np.load(cache_file) as cached:
+        signature = json.loads(str(cached["__signature__"]))
+        if not set(columns) <= set(signature["columns"]):
+            return None
+        current = get_file_signature(source_file, with_hash=False)
+        if (current["size"], current["mtime_ns"]) != (signature["size"], signature["mtime_ns"]):
+            if get_file_signature(source_file)["sha256"] != signature["sha256"]:
+                return None
+        return {column: cached[column].tolist() for column in columns}
+
+
+def convert_xlsx(xlsx_file, cache_file, columns):
+    """one-time conversion of the workbook columns into a numpy .npz cache next to it
+
+    :return: dictionary {column: list of str}
+    """
+    import pandas as pd
+
+    if get_compression(xlsx_file) is None:
+        data = pd.read_excel(xlsx_file, engine="openpyxl", usecols=list(columns))
+    else:
+        # openpyxl seeks around in the zip archive, the decompressed workbook is small enough to keep in memory
+        with open_source(xlsx_file, "rb") as in_f:
+            data = pd.read_excel(io.BytesIO(in_f.read()), engine="openpyxl", usecols=list(columns))
+    table = {column: data[column].astype(str).tolist() for column in columns}
+
+    signature = get_file_signature(xlsx_file)
+    signature["columns"] = list(columns)
+    arrays = {column: np.array(values, dtype=str) for column, values in table.items()}
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "wb") as out_f:
+        np.savez(out_f, __signature__=np.array(json.dumps(signature)), **arrays)
+    os.replace(tmp_file, cache_file)
+    return table
+
+
+def read_xlsx_columns(xlsx_file, columns=DRUG_TARGET_COLUMNS):
+    """read columns of an xlsx file through the columnar cache,
+    openpyxl only runs when the cache is missing or the workbook changed
+
+    :param xlsx_file: path of the workbook
+    :param columns: column names to read
+    :return: dictionary {column: list of str}, one list per column in row order
+    """
+    cache_file = xlsx_file + CACHE_SUFFIX
+    table = load_cached_columns(cache_file, xlsx_file, columns)
+    if table is None:
+        metrics.count("cache.columns.misses")
+        table = convert_xlsx(xlsx_file, cache_file, columns)
+    else:
+        metrics.count("cache.columns.hits")
+    return table
+
+
+# activity types kept from the "Activity" column of P1-09-Target_compound_activity.txt, e.g. "IC50 = 10 nM"
+ACTIVITY_PATTERN = r"^(IC50|Ki|EC50)\s+(.+)"
+# "name (symbol)" biomarker names of P1-08-Biomarker_disease.txt
+BIOMARKER_PATTERN = r"^(.*\(.*?)(.*)$"
+
+
+def read_tab_columns(source, columns, header=1):
+    """read the leading columns of a tab separated file with the pandas C parser,
+    rows are split like biothings.utils.dataload.tabfile_feeder and every value is kept as str
+
+    :param source: path, gzip/zstd/xz copies are decompressed while they are read, or binary file object
+    :param columns: number of leading columns to read
+    :param header: number of header rows to skip
+    :return: pandas DataFrame with the str columns 0 .. columns - 1
+    """
+    import pandas as pd
+
+    if isinstance(source, str):
+        with open_source(source, "rb") as in_f:
+            return read_tab_columns(in_f, columns, header)
+    try:
+        return pd.read_csv(
+            source, sep="\t", header=None, skiprows=header, usecols=range(columns), dtype=str, na_filter=False
+        )
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame({column: pd.Series(dtype=str) for column in range(columns)})
+
+
+def report_unparsed(source, values, counts, pattern):
+    """print one summary of the values a pattern did not match instead of one line per row
+
+    :param source: name of the source file
+    :param values: distinct unmatched values
+    :param counts: number of rows of each value
+    :param pattern: the pattern that did not match
+    """
+    metrics.count(f"{source}.unparsed", sum(counts))
+    if len(values):
+        ranked = sorted(zip(counts, values), key=lambda item: -item[0])
+        examples = ", ".join(f"{value!r} x{count}" for count, value in ranked[:5])
+        print(
+            f"Regex pattern not matched: {sum(counts)} rows ({len(values)} distinct values) of {source}"
+            f" by {pattern}, most frequent: {examples}"
+        )
+
+
+def to_list(values):
+    """list of a pandas Series with None instead of the NaN of unmatched rows"""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def extract_activities(activity, source="P1-09-Target_compound_activity.txt"):
+    """vectorized split of the activity column into activity type and value
+    activity strings repeat a lot, so the column is factorized and only the distinct values are parsed
+
+    :param activity: pandas Series of the "Activity" column, e.g. "IC50 = 10 nM"
+    :param source: name of the source file for the unparsed rows summary
+    :return: (list of "ic50"/"ki"/"ec50" or None, list of values without spaces or None)
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(activity)
+    uniques = pd.Series(uniques, dtype=object)
+    parts = uniques.str.extract(ACTIVITY_PATTERN)
+
+    unmatched = parts[0].isna().to_numpy()
+    counts = np.bincount(codes, minlength=len(uniques))
+    report_unparsed(source, uniques[unmatched].tolist(), counts[unmatched].tolist(), ACTIVITY_PATTERN)
+
+    activity_types = np.array(to_list(parts[0].str.lower()), dtype=object)
+    activity_values = np.array(to_list(parts[1].str.replace(" ", "", regex=False)), dtype=object)
+    return activity_types[codes].tolist(), activity_values[codes].tolist()
+
+
+def extract_biomarker_names(biomarker_name):
+    """vectorized split of "name (symbol)" biomarker names
+    a name without "(" is kept with its spaces replaced by "_",
+    a comma separated list of biomarkers gives lists of names and symbols, unmatched items keep the item as name
+
+    :param biomarker_name: pandas Series of the biomarker name column
+    :return: (list of name or list of names, list of symbol, list of symbols or None)
+    """
+    has_list = biomarker_name.str.contains(",", regex=False)
+
+    single = biomarker_name[~has_list]
+    parts = single.str.extract(BIOMARKER_PATTERN)
+    names = parts[0].str.rstrip("(").str.strip().where(parts[0].notna(), single.str.replace(" ", "_", regex=False))
+    symbols = parts[1].str.rstrip(")")
+
+    items = biomarker_name[has_list].str.split(",").explode().str.strip()
+    item_parts = items.str.extract(BIOMARKER_PATTERN)
+    item_names = item_parts[0].str.rstrip("(").str.strip().where(item_parts[0].notna(), items)
+    item_symbols = item_parts[1].str.rstrip(")").str.strip().dropna()
+
+    names = names.astype(object).reindex(biomarker_name.index)
+    symbols = symbols.astype(object).reindex(biomarker_name.index)
+    if len(items):
+        names[has_list] = item_names.groupby(level=0).agg(list)
+        symbols[has_list] = item_symbols.groupby(level=0).agg(list).reindex(biomarker_name.index[has_list])
+    return names.tolist(), to_list(symbols)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+from array import array
+
+# keep the full _id next to each fingerprint to tell 64-bit hash collisions apart
+DEDUP_EXACT = os.environ.get("TTD_DEDUP_EXACT", "0") == "1"
+
+
+def fingerprint(key):
+    """64-bit fingerprint of a key, 0 is reserved for empty table slots"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+class FingerprintSet:
+    """
+    The FingerprintSet object remembers seen keys as 64-bit fingerprints
+    in an open-addressing hash table backed by array("Q"), 8 bytes per slot instead of a str per key
+    In exact mode the first key of each fingerprint is kept as well,
+    so two different keys with the same fingerprint are both reported as new
+
+    :param capacity: initial number of slots, rounded up to a power of two
+    :type capacity: int
+    :param exact: verify fingerprint hits against the stored keys
+    :type exact: bool
+    """
+
+    def __init__(self, capacity=1024, exact=DEDUP_EXACT):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.table = array("Q", bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+        self.exact = exact
+        self.keys = {} if exact else None
+        self.collisions = set()
+
+    def __len__(self):
+        return self.count + len(self.collisions)
+
+    def __contains__(self, key):
+        fp = fingerprint(key)
+        slot = self.find_slot(fp)
+        if not self.table[slot]:
+            return False
+        return not self.exact or self.keys[fp] == key or key in self.collisions
+
+    def find_slot(self, fp):
+        """linear probing: slot holding fp or the first empty slot"""
+        table, mask = self.table, self.mask
+        slot = fp & mask
+        while table[slot] and table[slot] != fp:
+            slot = (slot + 1) & mask
+        return slot
+
+    def add(self, key):
+        """add a key
+
+        :param key: str
+        :return: True if the key was not seen before
+        """
+        fp = fingerprint(key)
+        slot = self.find_slot(fp)
+        if self.table[slot]:
+            if not self.exact or self.keys[fp] == key or key in self.collisions:
+                return False
+            self.collisions.add(key)
+            return True
+
+        self.table[slot] = fp
+        self.count += 1
+        if self.exact:
+            self.keys[fp] = key
+        # keep the load factor below 1/2
+        if self.count * 2 > len(self.table):
+            self.resize()
+        return True
+
+    def resize(self):
+        old_table = self.table
+        self.table = array("Q", bytes(16 * len(old_table)))
+        self.mask = len(self.table) - 1
+        for fp in old_table:
+            if fp:
+                self.table[self.find_slot(fp)] = fp
+
+
+def dedup_by_id(docs, key="_id", exact=DEDUP_EXACT):
+    """streaming deduplication, only the first document of each key is yielded
+
+    :param docs: iterable of documents
+    :param key: document key to deduplicate on
+    :param exact: verify fingerprint hits against the stored keys
+    :return: generator of the unique documents
+    """
+    seen = FingerprintSet(exact=exact)
+    for doc in docs:
+        if seen.add(doc[key]):
+            yield doc
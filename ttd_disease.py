@@ -0,0 +1,144 @@
+import asyncio
+import os
+import re
+
+from ttd_cache import CACHE_ENABLED, MappingCache, get_cache_path
+from ttd_http import AsyncHttpClient
+from ttd_metrics import Progress, metrics
+
+BIOTHINGS_DISEASE_URL = os.environ.get("TTD_BIOTHINGS_DISEASE_URL", "https://mydisease.info/v1")
+# local MONDO xref snapshot (mondo.obo or two-column icd9/mondo tsv), when set no request is sent
+MONDO_XREF_SNAPSHOT = os.environ.get("TTD_MONDO_XREF_SNAPSHOT")
+
+ICD9_XREF_PATTERN = re.compile(r"^xref:\s*ICD9(?:CM)?:(\S+)")
+
+
+def read_mondo_xref_snapshot(snapshot_file):
+    """read the icd9 to mondo xrefs of a local MONDO snapshot
+    mondo.obo files are read term by term, any other file as a tab separated "icd9 mondo" table
+    the first MONDO term listing an icd9 code wins
+
+    :param snapshot_file: path of the snapshot file
+    :return: dictionary {icd9: "MONDO:id"}
+    """
+    icd9_mondo = {}
+    with open(snapshot_file) as in_f:
+        if snapshot_file.endswith(".obo"):
+            mondo_id = None
+            for line in in_f:
+                if line.startswith("[Term]"):
+                    mondo_id = None
+                elif line.startswith("id: MONDO:"):
+                    mondo_id = line[4:].strip()
+                elif mondo_id and (match := ICD9_XREF_PATTERN.match(line)):
+                    icd9_mondo.setdefault(match.group(1), mondo_id)
+        else:
+            for line in in_f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 2 and fields[1].startswith("MONDO:"):
+                    icd9_mondo.setdefault(fields[0].strip(), fields[1].strip())
+    return icd9_mondo
+
+
+class IcdMondoCrosswalk:
+    """
+    The IcdMondoCrosswalk object resolves icd9 codes to MONDO disease ids
+    Answers are read from the persistent mapping cache first (negative results included),
+    the misses are queried concurrently in chunks from the BioThings disease API
+    or read from a local MONDO xref snapshot to run fully offline
+
+    :param api_url: base url of the BioThings disease API, can point at a local stand-in
+    :type api_url: str
+    :param cache: ttd_cache.MappingCache or None to always resolve the codes
+    :param snapshot_file: local MONDO xref snapshot used instead of the API
+    :type snapshot_file: str
+    :param chunk_size: number of icd9 codes per query request
+    :type chunk_size: int
+    """
+
+    def __init__(self, api_url=BIOTHINGS_DISEASE_URL, cache=None, snapshot_file=MONDO_XREF_SNAPSHOT, chunk_size=200):
+        self.api_url = api_url.rstrip("/")
+        self.cache = cache
+        self.snapshot_file = snapshot_file
+        self.chunk_size = chunk_size
+
+    async def query_chunk(self, client, icd9s):
+        """query one chunk of icd9 codes like biothings_client querymany
+
+        :param client: ttd_http.AsyncHttpClient
+        :param icd9s: list of icd9 codes
+        :return: dictionary {icd9: "MONDO:id" or None}
+        """
+        data = {"q": ",".join(icd9s), "scopes": "mondo.xrefs.icd9", "fields": "mondo.mondo"}
+        response = await client.post(f"{self.api_url}/query", data=data)
+        icd9_mondo = dict.fromkeys(icd9s)
+        for hit in response.json():
+            # like the querymany dict comprehension the last hit of a query wins
+            if "notfound" not in hit:
+                icd9_mondo[hit["query"]] = hit["_id"]
+        return icd9_mondo
+
+    async def query(self, icd9s, client=None):
+        """query all icd9 codes concurrently in chunks of chunk_size
+
+        :param icd9s: list of icd9 codes
+        :param client: shared ttd_http.AsyncHttpClient, a new one is opened if not given
+        :return: dictionary {icd9: "MONDO:id" or None}
+        """
+        if client is None:
+            async with AsyncHttpClient() as client:
+                return await self.query(icd9s, client)
+
+        chunks = [icd9s[i : i + self.chunk_size] for i in range(0, len(icd9s), self.chunk_size)]
+        progress = Progress("icd9 mondo query", len(chunks), "chunks")
+
+        async def query_chunk(chunk):
+            chunk_result = await self.query_chunk(client, chunk)
+            progress.update()
+            return chunk_result
+
+        icd9_mondo = {}
+        for chunk_result in await asyncio.gather(*(query_chunk(chunk) for chunk in chunks)):
+            icd9_mondo.update(chunk_result)
+        progress.close()
+        return icd9_mondo
+
+    def resolve(self, icd9s):
+        """resolve icd9 codes to MONDO ids, only the cache misses are requested
+
+        :param icd9s: iterable of icd9 codes
+        :return: dictionary {icd9: "MONDO:id"} of the resolved codes only
+        """
+        icd9s = sorted(set(icd9s))
+        icd9_mondo = self.cache.get_many(icd9s) if self.cache is not None else {}
+        misses = [icd9 for icd9 in icd9s if icd9 not in icd9_mondo]
+        metrics.count("icd9_mondo.codes", len(icd9s))
+        metrics.count("icd9_mondo.requested", len(misses))
+
+        if misses:
+            if self.snapshot_file:
+                snapshot = read_mondo_xref_snapshot(self.snapshot_file)
+                resolved = {icd9: snapshot.get(icd9) for icd9 in misses}
+            else:
+                resolved = asyncio.run(self.query(misses))
+            if self.cache is not None:
+                self.cache.set_many(resolved)
+            icd9_mondo.update(resolved)
+
+        mapped = {icd9: mondo for icd9, mondo in icd9_mondo.items() if mondo}
+        metrics.count("icd9_mondo.mapped", len(mapped))
+        return mapped
+
+
+def resolve_icd9_mondo(file_path, icd9s, use_cache=CACHE_ENABLED):
+    """resolve icd9 codes with an IcdMondoCrosswalk backed by the data folder cache
+
+    :param file_path: directory stores the downloaded data files
+    :param icd9s: iterable of icd9 codes
+    :param use_cache: use the persistent mapping cache
+    :return: dictionary {icd9: "MONDO:id"}
+    """
+    if not use_cache:
+        return IcdMondoCrosswalk().resolve(icd9s)
+    with MappingCache(get_cache_path(file_path), "icd9_mondo") as cache:
+        return IcdMondoCrosswalk(cache=cache).resolve(icd9s)
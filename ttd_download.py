@@ -0,0 +1,434 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from ttd_http import RETRY_EXCEPTIONS, RETRY_STATUSES, AsyncHttpClient, HttpRequestError, parse_retry_after
+from ttd_metrics import metrics
+from ttd_reader import COMPRESSION_SUFFIXES, get_compression
+
+# checksum manifest of the downloaded files, written next to them in the data folder
+DOWNLOAD_MANIFEST = "ttd_download_manifest.json"
+# files downloaded at once over the pooled session
+DOWNLOAD_CONCURRENCY = int(os.environ.get("TTD_DOWNLOAD_CONCURRENCY", 4))
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# base url the data_url files are downloaded from instead of the TTD server, e.g. a local mirror
+DOWNLOAD_URL = os.environ.get("TTD_DOWNLOAD_URL", "").rstrip("/")
+# "gz", "zst" or "xz" stores the downloaded text files compressed, the parser decompresses them while reading
+DOWNLOAD_COMPRESS = os.environ.get("TTD_DOWNLOAD_COMPRESS", "")
+# formats that are already compressed and stored as downloaded
+COMPRESSED_FORMATS = (".xlsx", ".zip") + COMPRESSION_SUFFIXES
+# suffix of a file being downloaded, an interrupted download is resumed from it with a Range request
+PARTIAL_SUFFIX = ".part"
+# headers of the HEAD and GET requests of the files: a compressed transfer would make Content-Length
+# and the Range offsets count the encoded bytes instead of the bytes of the stored file
+IDENTITY_HEADERS = {"Accept-Encoding": "identity"}
+
+
+class DownloadError(Exception):
+    """raised when a downloaded or reused file does not match its size or checksum"""
+
+
+def get_file_name(url):
+    return os.path.basename(urlsplit(url).path)
+
+
+def get_validators(headers):
+    """
+    :param headers: response headers of a HEAD or GET request
+    :return: dictionary {"etag", "last_modified", "content_length"}, "" for a missing header
+    """
+    return {
+        "etag": headers.get("ETag", ""),
+        "last_modified": headers.get("Last-Modified", ""),
+        "content_length": headers.get("Content-Length", ""),
+    }
+
+
+def get_manifest_release(remote_files):
+    """release of a set of remote files, the date of the newest file and a hash of all validators,
+    so a new release is dumped as soon as one of the files changes, e.g. "2024-01-10-3fa2c1d0"
+
+    :param remote_files: dictionary {url: validators} in data_url order, see get_validators()
+    :return: str
+    """
+    dates = []
+    validators = hashlib.sha256()
+    for url, remote in remote_files.items():
+        if remote["last_modified"]:
+            dates.append(email.utils.parsedate_to_datetime(remote["last_modified"]))
+        for value in (url, remote["etag"], remote["last_modified"], remote["content_length"]):
+            validators.update(value.encode() + b"\t")
+    date = max(dates).strftime("%Y-%m-%d") if dates else "undated"
+    return f"{date}-{validators.hexdigest()[:8]}"
+
+
+def is_unchanged(entry, remote):
+    """True if a manifest entry was downloaded from the same remote file
+    the ETag decides when the server sends one, Last-Modified and Content-Length otherwise
+
+    :param entry: manifest entry of a downloaded file or None
+    :param remote: validators of the remote file
+    """
+    if not entry:
+        return False
+    if remote["etag"]:
+        return entry["etag"] == remote["etag"]
+    return bool(remote["last_modified"]) and (entry["last_modified"], entry["content_length"]) == (
+        remote["last_modified"],
+        remote["content_length"],
+    )
+
+
+def read_manifest(folder):
+    """
+    :param folder: data folder
+    :return: dictionary {"release": str, "files": {file name: entry}}, empty files if there is no manifest
+    """
+    try:
+        with open(os.path.join(folder, DOWNLOAD_MANIFEST)) as in_f:
+            return json.load(in_f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"release": None, "files": {}}
+
+
+def write_manifest(folder, manifest):
+    """replace the manifest atomically, a dump interrupted while writing keeps the previous one"""
+    manifest_file = os.path.join(folder, DOWNLOAD_MANIFEST)
+    with open(manifest_file + ".tmp", "w") as out_f:
+        json.dump(manifest, out_f, indent=2, sort_keys=True)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def get_sha256(file_name):
+    sha256 = hashlib.sha256()
+    with open(file_name, "rb") as in_f:
+        for block in iter(lambda: in_f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_stored_file(entry, file_name):
+    """name, size and sha256 of the file a manifest entry is stored in,
+    the size and sha256 of the download differ from the ones of a compressed copy
+
+    :return: (file name, size, sha256)
+    """
+    if "file" in entry:
+        return entry["file"], entry["file_size"], entry["file_sha256"]
+    return file_name, entry["size"], entry["sha256"]
+
+
+def verify_file(local_file, entry):
+    """check a stored file against its manifest entry
+
+    :raise DownloadError: the size or the sha256 differs
+    """
+    _, expected_size, expected_sha256 = get_stored_file(entry, None)
+    size = os.path.getsize(local_file)
+    if size != expected_size:
+        raise DownloadError(f"{local_file} has {size} bytes, the manifest lists {expected_size}")
+    sha256 = get_sha256(local_file)
+    if sha256 != expected_sha256:
+        raise DownloadError(f"{local_file} has sha256 {sha256}, the manifest lists {expected_sha256}")
+
+
+def compress_file(local_file, compression):
+    """replace a downloaded file by its compressed copy
+
+    :param local_file: path of the file
+    :param compression: "gz", "zst" or "xz"
+    :return: path of the compressed copy
+    """
+    import gzip
+    import lzma
+
+    stored_file = f"{local_file}.{compression}"
+    tmp_file = stored_file + ".tmp"
+    with open(local_file, "rb") as in_f, open(tmp_file, "wb") as out_f:
+        if compression == "gz":
+            with gzip.GzipFile(fileobj=out_f, mode="wb", compresslevel=6) as writer:
+                shutil.copyfileobj(in_f, writer, DOWNLOAD_CHUNK_SIZE)
+        elif compression == "xz":
+            with lzma.LZMAFile(out_f, "wb") as writer:
+                shutil.copyfileobj(in_f, writer, DOWNLOAD_CHUNK_SIZE)
+        elif compression == "zst":
+            import zstandard
+
+            # the content size in the frame header lets the parser shard the file without decompressing it
+            zstandard.ZstdCompressor(level=10).copy_stream(in_f, out_f, size=os.path.getsize(local_file))
+        else:
+            raise ValueError(f"Unknown TTD_DOWNLOAD_COMPRESS {compression}")
+    os.replace(tmp_file, stored_file)
+    os.remove(local_file)
+    return stored_file
+
+
+def store_file(local_file, entry, compression):
+    """store a downloaded file compressed if requested and add the stored file to its manifest entry
+
+    :return: manifest entry
+    """
+    if not compression or os.path.splitext(local_file)[1] in COMPRESSED_FORMATS:
+        return entry
+    stored_file = compress_file(local_file, compression)
+    return {
+        **entry,
+        "file": os.path.basename(stored_file),
+        "file_size": os.path.getsize(stored_file),
+        "file_sha256": get_sha256(stored_file),
+    }
+
+
+def remove_other_copies(folder, file_name, stored_name):
+    """remove the copies of a source file stored under another name, the parser would prefer an older raw file"""
+    for suffix in ("",) + COMPRESSION_SUFFIXES:
+        if file_name + suffix != stored_name and os.path.exists(os.path.join(folder, file_name + suffix)):
+            os.remove(os.path.join(folder, file_name + suffix))
+
+
+async def fetch_remote_files(client, urls):
+    """HEAD all urls concurrently
+
+    :param client: AsyncHttpClient
+    :param urls: list of urls
+    :return: dictionary {url: validators} in the order of urls
+    """
+    responses = await asyncio.gather(
+        *(client.request("HEAD", url, allow_redirects=True, headers=IDENTITY_HEADERS) for url in urls)
+    )
+    return {url: get_validators(response.headers) for url, response in zip(urls, responses)}
+
+
+def plan_downloads(urls, remote_files, folder, previous_folder=None, force=False):
+    """split the urls into the files to download and the unchanged files to reuse
+
+    :param urls: list of urls
+    :param remote_files: dictionary {url: validators}, see fetch_remote_files()
+    :param folder: data folder the files are dumped to
+    :param previous_folder: data folder of the previous release, its unchanged files are reused
+    :param force: download every file
+    :return: (list of urls to download, dictionary {url: (local file to reuse, manifest entry)})
+    """
+    manifests = [(folder, read_manifest(folder)["files"])]
+    if previous_folder and os.path.abspath(previous_folder) != os.path.abspath(folder):
+        manifests.append((previous_folder, read_manifest(previous_folder)["files"]))
+
+    downloads, reused = [], {}
+    for url in urls:
+        file_name = get_file_name(url)
+        for manifest_folder, entries in [] if force else manifests:
+            entry = entries.get(file_name)
+            if not is_unchanged(entry, remote_files[url]):
+                continue
+            stored_name, stored_size, _ = get_stored_file(entry, file_name)
+            local_file = os.path.join(manifest_folder, stored_name)
+            if os.path.exists(local_file) and os.path.getsize(local_file) == stored_size:
+                reused[url] = (local_file, entry)
+                break
+        else:
+            downloads.append(url)
+    return downloads, reused
+
+
+async def write_response(response, partial_file, offset, partial, remote):
+    """append a 206 response to the partial file or replace it by a 200 response,
+    the validators of a new partial file are kept next to it for the If-Range of a later resume
+
+    :param partial: validators the partial file was started from
+    :param remote: validators of the HEAD request
+    :return: validators of the downloaded file
+    """
+    encoding = response.headers.get("Content-Encoding", "identity")
+    if encoding != "identity":
+        raise DownloadError(f"{response.url} sent a {encoding} body although the identity encoding was requested")
+    validators = get_validators(response.headers)
+    if response.status == 206:
+        # a server ignoring If-Range would send the range of a changed file
+        changed = any(
+            validators[key] and partial[key] and validators[key] != partial[key] for key in ("etag", "last_modified")
+        )
+        if changed or not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            os.remove(partial_file)
+            raise DownloadError(f"{response.url} answered the range {offset}- of a different file or range")
+        metrics.count("download.resumed")
+        validators = partial
+    else:
+        validators = {key: validators[key] or remote[key] for key in remote}
+        with open(partial_file + ".json", "w") as out_f:
+            json.dump(validators, out_f)
+    with open(partial_file, "ab" if response.status == 206 else "wb") as out_f:
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            out_f.write(chunk)
+            metrics.count("download.bytes", len(chunk))
+    return validators
+
+
+def get_partial_validators(partial_file):
+    """validators of the response a partial file was started from, None if it cannot be resumed"""
+    try:
+        with open(partial_file + ".json") as in_f:
+            validators = json.load(in_f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        validators = None
+    if not os.path.exists(partial_file) or not validators or not (validators["etag"] or validators["last_modified"]):
+        # nothing tells if the partial file is still a prefix of the remote file
+        for stale_file in (partial_file, partial_file + ".json"):
+            if os.path.exists(stale_file):
+                os.remove(stale_file)
+        return None
+    return validators
+
+
+async def fetch_file(client, url, local_file, remote):
+    """download one file through a partial file, resumed with a Range request after a failed attempt
+    or an interrupted dump; If-Range makes the server send the whole file again if it changed meanwhile
+
+    :param client: AsyncHttpClient
+    :param url: file url
+    :param local_file: path the file is moved to once complete
+    :param remote: validators of the HEAD request, see get_validators()
+    :return: manifest entry of the file
+    """
+    partial_file = local_file + PARTIAL_SUFFIX
+    # a large file may take longer than the request timeout, only a stalled connection fails
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=client.timeout, sock_read=client.timeout)
+    attempt = 0
+    while True:
+        partial = get_partial_validators(partial_file)
+        offset = os.path.getsize(partial_file) if partial else 0
+        headers = dict(IDENTITY_HEADERS)
+        if offset:
+            headers.update({"Range": f"bytes={offset}-", "If-Range": partial["etag"] or partial["last_modified"]})
+        retry_after = None
+        metrics.count("download.requests")
+        try:
+            async with client.get_semaphore(url):
+                async with client.session.get(url, headers=headers, timeout=timeout) as response:
+                    status = response.status
+                    if status in (200, 206):
+                        validators = await write_response(response, partial_file, offset, partial, remote)
+                    elif status in RETRY_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    elif status == 416 and offset:
+                        # the partial file was complete when the previous attempt failed
+                        validators = partial
+                    else:
+                        raise HttpRequestError("GET", url, f"status {status}")
+            if status not in RETRY_STATUSES:
+                size = os.path.getsize(partial_file)
+                if validators["content_length"] and size != int(validators["content_length"]):
+                    os.remove(partial_file)
+                    raise DownloadError(f"{url} sent {size} bytes instead of {validators['content_length']}")
+                break
+            reason = f"status {status}"
+        except RETRY_EXCEPTIONS + (DownloadError,) as e:
+            # the partial file of a DownloadError was removed, the next attempt starts over
+            reason = repr(e)
+
+        if attempt >= client.max_retries:
+            metrics.count("download.failed")
+            raise HttpRequestError("GET", url, f"{reason} after {attempt + 1} attempts")
+        metrics.count("download.retries")
+        await asyncio.sleep(client.get_backoff(attempt, retry_after))
+        attempt += 1
+
+    os.remove(partial_file + ".json")
+    entry = {"url": url, **validators, "size": size, "sha256": get_sha256(partial_file), "downloaded": time.time()}
+    os.replace(partial_file, local_file)
+    return entry
+
+
+def reuse_file(previous_file, local_file, entry):
+    """hard link (or copy) an unchanged file of the previous release after checking its sha256,
+    a file already in the data folder was checked by plan_downloads() against its size only
+    """
+    if os.path.abspath(previous_file) == os.path.abspath(local_file):
+        return
+    verify_file(previous_file, entry)
+    if os.path.exists(local_file):
+        os.remove(local_file)
+    try:
+        os.link(previous_file, local_file)
+    except OSError:
+        shutil.copy2(previous_file, local_file)
+
+
+async def download_files(
+    urls, folder, previous_folder=None, force=False, client=None, remote_files=None, compression=DOWNLOAD_COMPRESS
+):
+    """download the changed files of urls into folder and write its checksum manifest
+
+    :param urls: list of urls
+    :param folder: data folder the files are dumped to
+    :param previous_folder: data folder of the previous release, its unchanged files are linked into folder
+    :param force: download every file
+    :param client: AsyncHttpClient, a new one is opened if None
+    :param remote_files: validators of the urls from fetch_remote_files(), requested if None
+    :param compression: TTD_DOWNLOAD_COMPRESS, "gz", "zst" or "xz" stores the downloaded text files compressed
+    :return: manifest dictionary
+    """
+    if client is None:
+        async with AsyncHttpClient(rate=0, record=False) as client:
+            return await download_files(urls, folder, previous_folder, force, client, remote_files, compression)
+
+    os.makedirs(folder, exist_ok=True)
+    if remote_files is None:
+        remote_files = await fetch_remote_files(client, urls)
+    downloads, reused = plan_downloads(urls, remote_files, folder, previous_folder, force)
+    manifest = {"release": get_manifest_release(remote_files), "files": {}}
+    for url, (previous_file, entry) in reused.items():
+        try:
+            reuse_file(previous_file, os.path.join(folder, os.path.basename(previous_file)), entry)
+        except DownloadError as e:
+            print(f"{e}, downloading it again")
+            downloads.append(url)
+            continue
+        remove_other_copies(folder, get_file_name(url), os.path.basename(previous_file))
+        manifest["files"][get_file_name(url)] = entry
+        metrics.count("download.reused")
+
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async def download(url):
+        local_file = os.path.join(folder, get_file_name(url))
+        async with semaphore:
+            entry = await fetch_file(client, url, local_file, remote_files[url])
+        # compressed in a thread, so the other downloads go on
+        entry = await asyncio.to_thread(store_file, local_file, entry, compression)
+        remove_other_copies(folder, get_file_name(url), entry.get("file", get_file_name(url)))
+        # completed files are kept by a dump interrupted later on
+        manifest["files"][get_file_name(url)] = entry
+        write_manifest(folder, manifest)
+        print(f"Downloaded {url} ({entry['size']} bytes)")
+
+    await asyncio.gather(*(download(url) for url in downloads))
+    write_manifest(folder, manifest)
+    return manifest
+
+
+def get_download_urls(urls, base_url=DOWNLOAD_URL):
+    """
+    :param urls: data_url list
+    :param base_url: TTD_DOWNLOAD_URL, the files are requested from it if set
+    :return: list of urls
+    """
+    return [f"{base_url}/{get_file_name(url)}" for url in urls] if base_url else list(urls)
+
+
+def get_manifest_urls():
+    """data_url list of the plugin manifest.json"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifest.json")) as in_f:
+        return json.load(in_f)["dumper"]["data_url"]
+
+
+if __name__ == "__main__":
+    # python ttd_download.py DATA_FOLDER [PREVIOUS_FOLDER] downloads the changed data_url files of manifest.json
+    dump_manifest = asyncio.run(download_files(get_download_urls(get_manifest_urls()), *sys.argv[1:3]))
+    print(f"Release {dump_manifest['release']}")
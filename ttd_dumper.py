@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from biothings.hub.dataload.dumper import HTTPDumper
+
+from ttd_download import download_files, fetch_remote_files, get_download_urls, get_file_name, plan_downloads
+from ttd_http import AsyncHttpClient
+
+
+class TTDDumper(HTTPDumper):
+    """
+    The TTDDumper object is the dumper class of the plugin, set as "class" of the manifest dumper section
+    A dump cycle first sends one HEAD request per data_url file over a pooled session, the release is
+    derived from their ETag/Last-Modified/Content-Length by get_release(), so a cycle without a changed file
+    stops there. Otherwise the changed files are downloaded concurrently, resumed with Range requests
+    after an interruption, and the unchanged files are linked from the current release after their sha256
+    was checked; the new data folder gets its own checksum manifest, see ttd_download
+    """
+
+    # validators of the data_url files of the running dump cycle, read by get_release()
+    remote_files = None
+    force_download = False
+
+    def get_urls(self):
+        return get_download_urls(self.__class__.SRC_URLS)
+
+    async def create_todump_list(self, force=False, **kwargs):
+        urls = self.get_urls()
+        async with AsyncHttpClient(rate=0, record=False) as client:
+            self.remote_files = await fetch_remote_files(client, urls)
+        self.set_release()
+        self.force_download = force
+
+        current_folder = self.current_data_folder
+        downloads, reused = plan_downloads(urls, self.remote_files, self.new_data_folder, current_folder, force)
+        linked = [url for url, (local_file, _) in reused.items() if os.path.dirname(local_file) != self.new_data_folder]
+        if downloads or linked:
+            self.logger.info(
+                "Release %s: %d file(s) to download, %d unchanged file(s) of %s",
+                self.release,
+                len(downloads),
+                len(linked),
+                current_folder,
+            )
+            self.to_dump = [
+                {"remote": url, "local": os.path.join(self.new_data_folder, get_file_name(url))} for url in urls
+            ]
+
+    def download_all(self):
+        return asyncio.run(
+            download_files(
+                self.get_urls(),
+                self.new_data_folder,
+                self.current_data_folder,
+                self.force_download,
+                remote_files=self.remote_files,
+            )
+        )
+
+    async def do_dump(self, job_manager=None):
+        self.logger.info("%d file(s) to check or download" % len(self.to_dump))
+        pinfo = self.get_pinfo()
+        pinfo["step"] = "dump"
+        pinfo["description"] = self.new_data_folder
+        job = await job_manager.defer_to_thread(pinfo, self.download_all)
+        manifest = await job
+        self.logger.info("%s successfully downloaded, release %s" % (self.SRC_NAME, manifest["release"]))
+        self.to_dump = []
@@ -0,0 +1,239 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import aiohttp.client_exceptions
+from ttd_cassette import get_recorder
+from ttd_metrics import metrics
+
+# defaults of the shared client, can be tuned per build host with environment variables
+HTTP_LIMIT = int(os.environ.get("TTD_HTTP_LIMIT", 100))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("TTD_HTTP_LIMIT_PER_HOST", 10))
+HTTP_RATE_LIMIT = float(os.environ.get("TTD_HTTP_RATE_LIMIT", 20))
+HTTP_MAX_RETRIES = int(os.environ.get("TTD_HTTP_MAX_RETRIES", 5))
+HTTP_TIMEOUT = float(os.environ.get("TTD_HTTP_TIMEOUT", 300))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (aiohttp.client_exceptions.ClientError, asyncio.TimeoutError)
+
+
+class HttpRequestError(Exception):
+    """raised when a request still fails after all retries"""
+
+    def __init__(self, method, url, reason):
+        super().__init__(f"{method} {url} failed: {reason}")
+        self.method = method
+        self.url = url
+        self.reason = reason
+
+
+class HttpResponse:
+    """
+    The HttpResponse object holds a fully read response
+    so it can be used after the connection is released to the pool
+
+    :param status: http status code
+    :param headers: response headers
+    :param links: parsed Link header
+    :param body: raw response body
+    """
+
+    def __init__(self, status, headers, links, body):
+        self.status = status
+        self.headers = headers
+        self.links = links
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def next_url(self):
+        """url of the next result page from the Link header, None on the last page"""
+        next_link = self.links.get("next")
+        return str(next_link["url"]) if next_link else None
+
+
+class TokenBucket:
+    """
+    The TokenBucket object limits the request rate of a client
+    up to capacity requests can be sent in a burst, then rate requests per second
+
+    :param rate: tokens added per second
+    :type rate: float
+    :param capacity: maximum number of stored tokens, defaults to rate
+    :type capacity: float
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_retry_after(value):
+    """convert a Retry-After header (delay-seconds or HTTP-date) to seconds
+
+    :param value: Retry-After header value
+    :return: seconds to wait or None if the header cannot be parsed
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class AsyncHttpClient:
+    """
+    The AsyncHttpClient object is the shared http layer of the plugin
+    One pooled connector is used for all requests, the in-flight requests per host are bounded,
+    the request rate is limited by a token bucket and failed requests are retried
+    with exponential backoff and jitter, honoring Retry-After on 429/503
+
+    Use it as an async context manager:
+        async with AsyncHttpClient() as client:
+            response = await client.request("GET", url)
+
+    :param limit: total number of pooled connections
+    :param limit_per_host: number of in-flight requests per host
+    :param rate: requests per second over all hosts, 0 or None disables rate limiting
+    :param burst: token bucket capacity
+    :param max_retries: number of retries before HttpRequestError is raised
+    :param backoff_base: first backoff delay in seconds
+    :param backoff_max: maximum backoff delay in seconds
+    :param timeout: default per-request timeout in seconds
+    :param verify_ssl: verify the ssl certificate of the server
+    :param record: record the responses to the cassettes of TTD_HTTP_RECORD, see ttd_cassette
+    """
+
+    def __init__(
+        self,
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        rate=HTTP_RATE_LIMIT,
+        burst=None,
+        max_retries=HTTP_MAX_RETRIES,
+        backoff_base=1,
+        backoff_max=60,
+        timeout=HTTP_TIMEOUT,
+        verify_ssl=True,
+        record=True,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+        self.record = record
+        self.recorder = None
+        self.session = None
+        self.host_semaphores = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ssl=self.verify_ssl)
+        self.session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        if self.record:
+            self.recorder = get_recorder()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def get_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.limit_per_host)
+        return self.host_semaphores[host]
+
+    def get_backoff(self, attempt, retry_after=None):
+        """delay before the next attempt, Retry-After wins over the exponential backoff
+
+        :param attempt: number of failed attempts so far
+        :param retry_after: seconds requested by the server
+        :return: seconds to wait
+        """
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # full jitter: uniform between 0 and the exponential delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def request(self, method, url, timeout=None, raise_for_status=True, **kwargs):
+        """send one request with retries
+
+        :param method: http method
+        :param url: request url
+        :param timeout: per-request timeout in seconds, defaults to the client timeout
+        :param raise_for_status: raise HttpRequestError on a non-retryable 4xx/5xx status
+        :param kwargs: passed to aiohttp.ClientSession.request (params, data, allow_redirects...)
+        :return: HttpResponse
+        """
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        semaphore = self.get_semaphore(url)
+        attempt = 0
+        while True:
+            retry_after = None
+            metrics.count("http.requests")
+            try:
+                async with semaphore:
+                    if self.bucket:
+                        await self.bucket.acquire()
+                    start = time.monotonic()
+                    async with self.session.request(method, url, timeout=client_timeout, **kwargs) as response:
+                        body = await response.read()
+                        result = HttpResponse(response.status, response.headers, response.links, body)
+                if result.status not in RETRY_STATUSES:
+                    if self.recorder is not None:
+                        self.recorder.record(
+                            method, url, kwargs.get("params"), kwargs.get("data"), result, time.monotonic() - start
+                        )
+                    if raise_for_status and result.status >= 400:
+                        raise HttpRequestError(method, url, f"status {result.status}")
+                    return result
+                reason = f"status {result.status}"
+                retry_after = parse_retry_after(result.headers.get("Retry-After"))
+            except RETRY_EXCEPTIONS as e:
+                reason = repr(e)
+
+            if attempt >= self.max_retries:
+                metrics.count("http.failed")
+                raise HttpRequestError(method, url, f"{reason} after {attempt + 1} attempts")
+            metrics.count("http.retries")
+            await asyncio.sleep(self.get_backoff(attempt, retry_after))
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
@@ -0,0 +1,225 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from ttd_columnar import get_file_signature
+from ttd_metrics import metrics
+
+# 1 reruns only the loaders whose inputs changed since the last build and reuses the stored documents of the others
+INCREMENTAL = os.environ.get("TTD_INCREMENTAL", "0") == "1"
+STORE_FILE = "ttd_build_store.sqlite"
+# added/removed/changed _ids of the last incremental build, written to the data folder
+DELTA_FILE = "ttd_build_delta.json"
+# documents inserted per executemany
+INSERT_BATCH_SIZE = 10000
+
+
+def get_store_path(file_path):
+    """location of the build store, next to the mapping cache
+
+    :param file_path: directory stores the downloaded data files
+    :return: path of the sqlite file
+    """
+    return os.path.join(os.environ.get("TTD_CACHE_DIR", file_path), STORE_FILE)
+
+
+def get_digest(value):
+    """short digest of a json serializable value, dictionaries are hashed independently of their key order"""
+    text = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def get_code_signature():
+    """digest of the parser modules, the stored documents of an older parser are never reused"""
+    sha256 = hashlib.sha256()
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    module_files = glob.glob(os.path.join(plugin_dir, "TTD_parser.py"))
+    module_files += glob.glob(os.path.join(plugin_dir, "ttd_*.py"))
+    for module_file in sorted(module_files):
+        sha256.update(os.path.basename(module_file).encode())
+        with open(module_file, "rb") as in_f:
+            sha256.update(in_f.read())
+    return sha256.hexdigest()
+
+
+class BuildStore:
+    """
+    The BuildStore object keeps the documents every loader emitted in the last build in a sqlite file,
+    together with the fingerprint of the inputs they were built from and the sha256 of the source files
+    A rebuilt loader writes its documents as a new generation in one transaction,
+    the previous generation is compared with it and dropped, so an interrupted build keeps the last complete one
+
+    :param db_path: path of the sqlite file
+    :type db_path: str
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS loaders"
+                " (loader TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, generation INTEGER NOT NULL, updated REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs (loader TEXT, generation INTEGER, seq INTEGER, id TEXT, digest TEXT,"
+                " doc TEXT, PRIMARY KEY (loader, generation, seq))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS docs_id ON docs (loader, generation, id)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_file_hash(self, source_file):
+        """sha256 of a source file, only rehashed when its size or mtime changed since it was last hashed
+
+        :param source_file: path of the file
+        :return: hex digest
+        """
+        name = os.path.basename(source_file)
+        current = get_file_signature(source_file, with_hash=False)
+        row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE name = ?", (name,)).fetchone()
+        if row and row[:2] == (current["size"], current["mtime_ns"]):
+            return row[2]
+
+        sha256 = get_file_signature(source_file)["sha256"]
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (name, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (name, current["size"], current["mtime_ns"], sha256),
+            )
+        return sha256
+
+    def get_fingerprint(self, loader):
+        """
+        :param loader: loader name
+        :return: input fingerprint of the stored documents of the loader, None if there are none
+        """
+        row = self.conn.execute("SELECT fingerprint FROM loaders WHERE loader = ?", (loader,)).fetchone()
+        return row[0] if row else None
+
+    def get_generation(self, loader):
+        row = self.conn.execute("SELECT generation FROM loaders WHERE loader = ?", (loader,)).fetchone()
+        return row[0] if row else None
+
+    def write_docs(self, fingerprints, loader_docs):
+        """store the documents of the rebuilt loaders and replace their previous generation
+
+        :param fingerprints: dictionary {loader: input fingerprint} of the rebuilt loaders
+        :param loader_docs: iterable of (loader, document), the documents of a loader in output order
+        :return: dictionary {loader: delta from get_delta() or None for a loader without stored documents}
+        """
+        previous = {loader: self.get_generation(loader) for loader in fingerprints}
+        generations = {loader: 0 if generation is None else generation + 1 for loader, generation in previous.items()}
+        sequences = dict.fromkeys(fingerprints, 0)
+        insert = "INSERT INTO docs (loader, generation, seq, id, digest, doc) VALUES (?, ?, ?, ?, ?, ?)"
+
+        with self.conn:
+            batch = []
+            for loader, doc in loader_docs:
+                text = json.dumps(doc, separators=(",", ":"))
+                digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+                batch.append((loader, generations[loader], sequences[loader], doc["_id"], digest, text))
+                sequences[loader] += 1
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self.conn.executemany(insert, batch)
+                    batch = []
+            self.conn.executemany(insert, batch)
+
+            deltas = {}
+            for loader, fingerprint in fingerprints.items():
+                if previous[loader] is None:
+                    deltas[loader] = None
+                else:
+                    deltas[loader] = self.get_delta(loader, previous[loader], generations[loader])
+                    self.conn.execute(
+                        "DELETE FROM docs WHERE loader = ? AND generation = ?", (loader, previous[loader])
+                    )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO loaders (loader, fingerprint, generation, updated) VALUES (?, ?, ?, ?)",
+                    (loader, fingerprint, generations[loader], time.time()),
+                )
+        return deltas
+
+    def get_delta(self, loader, old_generation, new_generation):
+        """_ids added, removed or changed between two generations of a loader
+
+        :return: dictionary {"added": [_id], "removed": [_id], "changed": [_id]}
+        """
+        # digests of all documents of an _id in output order, the biomarker loader can emit an _id twice
+        grouped = (
+            "SELECT id, group_concat(digest) AS digests FROM"
+            " (SELECT id, digest FROM docs WHERE loader = ? AND generation = ? ORDER BY id, seq) GROUP BY id"
+        )
+        added = self.conn.execute(
+            f"SELECT n.id FROM ({grouped}) n LEFT JOIN ({grouped}) o ON n.id = o.id WHERE o.id IS NULL ORDER BY n.id",
+            (loader, new_generation, loader, old_generation),
+        )
+        removed = self.conn.execute(
+            f"SELECT o.id FROM ({grouped}) o LEFT JOIN ({grouped}) n ON n.id = o.id WHERE n.id IS NULL ORDER BY o.id",
+            (loader, old_generation, loader, new_generation),
+        )
+        changed = self.conn.execute(
+            f"SELECT n.id FROM ({grouped}) n JOIN ({grouped}) o ON n.id = o.id"
+            " WHERE n.digests != o.digests ORDER BY n.id",
+            (loader, new_generation, loader, old_generation),
+        )
+        return {
+            "added": [row[0] for row in added],
+            "removed": [row[0] for row in removed],
+            "changed": [row[0] for row in changed],
+        }
+
+    def iter_docs(self, loader):
+        """stored documents of a loader in output order
+
+        :param loader: loader name
+        :return: generator of documents
+        """
+        rows = self.conn.execute(
+            "SELECT doc FROM docs WHERE loader = ? AND generation = ? ORDER BY seq",
+            (loader, self.get_generation(loader)),
+        )
+        for (text,) in rows:
+            yield json.loads(text)
+
+
+def write_delta(file_path, data_release, loaders, deltas):
+    """write the delta report of an incremental build
+
+    :param file_path: directory stores the downloaded data files
+    :param data_release: release derived from the source file hashes
+    :param loaders: names of all loaders of the build
+    :param deltas: dictionary {loader: delta or None} of the rebuilt loaders from BuildStore.write_docs()
+    :return: path of the report
+    """
+    report = {"data_release": data_release, "loaders": {}}
+    for loader in loaders:
+        if loader not in deltas:
+            report["loaders"][loader] = {"rebuilt": False}
+        elif deltas[loader] is None:
+            # first build of the loader, every document is new
+            report["loaders"][loader] = {"rebuilt": True, "previous": False}
+        else:
+            report["loaders"][loader] = {"rebuilt": True, "previous": True, **deltas[loader]}
+            for key, ids in deltas[loader].items():
+                metrics.count(f"incremental.{key}", len(ids))
+
+    delta_file = os.path.join(file_path, DELTA_FILE)
+    tmp_file = f"{delta_file}.tmp"
+    with open(tmp_file, "w") as out_f:
+        json.dump(report, out_f, indent=2)
+    os.replace(tmp_file, delta_file)
+    return delta_file
@@ -0,0 +1,273 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# json report of the build metrics, a relative path is written to the data folder, empty disables the report
+METRICS_REPORT = os.environ.get("TTD_METRICS_REPORT", "ttd_build_metrics.json")
+# seconds between two progress lines of the network phase, 0 disables the progress logging
+PROGRESS_INTERVAL = float(os.environ.get("TTD_PROGRESS_INTERVAL", 0))
+
+# identifier fields of the output nodes counted per predicate, the counts of the README output tables
+OUTPUT_ID_FIELDS = (
+    "chebi",
+    "pubchem_compound",
+    "ttd_drug_id",
+    "uniprotkb",
+    "ttd_target_id",
+    "ttd_biomarker_id",
+    "icd11",
+    "mondo",
+)
+
+
+def get_peak_rss_mb():
+    """peak RSS of this process in MiB"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class BuildMetrics:
+    """
+    The BuildMetrics object collects the stage timings and counters of one build
+    A stage records its wall and CPU time, the time of the stages nested in it is also reported
+    without them as self time, and the peak RSS of the process when the stage ended.
+    Counters are plain named integers, e.g. "http.retries" or "load_drug_dis_data.duplicates".
+    Each process has one instance, ttd_metrics.metrics, the worker processes send a snapshot of theirs
+    back to the parent process, which merges it
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.stages = {}
+        self.counters = defaultdict(int)
+        # child time frames of the running stages, innermost last
+        self.active = []
+        self.worker_peak_rss_mb = None
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record_stage(self, name, wall, child_wall, cpu=None, items=None):
+        """add one measurement to a stage
+
+        :param name: stage name
+        :param wall: wall seconds of the stage
+        :param child_wall: wall seconds of the stages nested in it
+        :param cpu: CPU seconds of the stage, None if not measured
+        :param items: number of items of an iterator stage
+        """
+        stage = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "self_seconds": 0.0})
+        stage["calls"] += 1
+        stage["wall_seconds"] += wall
+        stage["self_seconds"] += wall - child_wall
+        if cpu is not None:
+            stage["cpu_seconds"] = stage.get("cpu_seconds", 0.0) + cpu
+        if items is not None:
+            stage["items"] = stage.get("items", 0) + items
+        stage["peak_rss_mb"] = get_peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name):
+        """time the enclosed block as stage name"""
+        # child wall seconds of this stage, added by the nested stages
+        frame = [0.0]
+        self.active.append(frame)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            self.active.pop()
+            if self.active:
+                self.active[-1][0] += wall
+            self.record_stage(name, wall, frame[0], cpu=time.process_time() - start_cpu)
+
+    def iter_stage(self, name, iterable):
+        """yield the items of iterable, timing only the time spent producing them as stage name,
+        e.g. a loader chained into the final sort is timed without the sort
+        only the wall time is measured per item, an iterator stage has no CPU time
+
+        :param name: stage name
+        :param iterable: iterable timed item by item
+        :return: generator of the items
+        """
+        iterator = iter(iterable)
+        perf_counter = time.perf_counter
+        active = self.active
+        frame = [0.0]
+        wall = 0.0
+        items = 0
+        try:
+            while True:
+                active.append(frame)
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed = perf_counter() - start
+                    wall += elapsed
+                    active.pop()
+                    if active:
+                        active[-1][0] += elapsed
+                items += 1
+                yield item
+        finally:
+            self.record_stage(name, wall, frame[0], items=items)
+
+    def count_output(self, shapes):
+        """add the output counters, per predicate the number of documents
+        and the number of subject/object nodes with each of the OUTPUT_ID_FIELDS
+
+        :param shapes: dictionary {(predicate, subject fields, object fields): number of documents}
+        """
+        for (predicate, subject_fields, object_fields), n in shapes.items():
+            self.count(f"output.{predicate}.docs", n)
+            for role, fields in (("subject", subject_fields), ("object", object_fields)):
+                for field in OUTPUT_ID_FIELDS:
+                    if field in fields:
+                        self.count(f"output.{predicate}.{role}_{field}", n)
+
+    def snapshot(self):
+        """stages and counters of this process, e.g. to send them from a worker to the parent process"""
+        return {"stages": self.stages, "counters": dict(self.counters), "peak_rss_mb": get_peak_rss_mb()}
+
+    def merge(self, snapshot, prefix="workers."):
+        """add the stages and counters of a worker process snapshot
+        stage times and counters are summed, the stages are reported under prefix
+
+        :param snapshot: dictionary from snapshot()
+        :param prefix: prefix of the merged stage names
+        """
+        for name, worker_stage in snapshot["stages"].items():
+            stage = self.stages.setdefault(prefix + name, {})
+            for key, value in worker_stage.items():
+                if key == "peak_rss_mb":
+                    stage[key] = max(stage.get(key, 0.0), value)
+                else:
+                    stage[key] = stage.get(key, 0) + value
+        for name, value in snapshot["counters"].items():
+            self.counters[name] += value
+        self.worker_peak_rss_mb = max(self.worker_peak_rss_mb or 0.0, snapshot["peak_rss_mb"])
+
+    def to_dict(self):
+        stages = {
+            name: {key: round(value, 3) if isinstance(value, float) else value for key, value in stage.items()}
+            for name, stage in self.stages.items()
+        }
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.time() - self.started, 3),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "worker_peak_rss_mb": self.worker_peak_rss_mb,
+            "stages": stages,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def write_report(self, file_path, report_file=METRICS_REPORT):
+        """write the json report
+
+        :param file_path: directory stores the downloaded data files, base of a relative report_file
+        :param report_file: path of the report, empty to skip it
+        :return: path of the written report or None
+        """
+        if not report_file:
+            return None
+        report_file = os.path.join(file_path, report_file)
+        tmp_file = f"{report_file}.tmp"
+        with open(tmp_file, "w") as out_f:
+            json.dump(self.to_dict(), out_f, indent=2)
+        os.replace(tmp_file, report_file)
+        return report_file
+
+
+# metrics of the build running in this process
+metrics = BuildMetrics()
+
+
+class Progress:
+    """
+    The Progress object logs the progress, rate and ETA of a long network phase,
+    at most one line every interval seconds and a last line when it is closed
+
+    :param label: name of the phase, e.g. "uniprot idmapping"
+    :type label: str
+    :param total: number of units to process
+    :type total: int
+    :param unit: name of the units, e.g. "jobs"
+    :type unit: str
+    :param interval: seconds between two lines, 0 disables the logging
+    :type interval: float
+    """
+
+    def __init__(self, label, total, unit, interval=PROGRESS_INTERVAL):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.logged = None
+        self.start = self.last = time.monotonic()
+
+    def update(self, n=1):
+        self.done += n
+        if self.interval and time.monotonic() - self.last >= self.interval:
+            self.log()
+
+    def close(self):
+        if self.interval and self.logged != self.done:
+            self.log()
+
+    def log(self):
+        now = self.last = time.monotonic()
+        self.logged = self.done
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f"{self.label}: {self.done}/{self.total} {self.unit}, {rate:.1f} {self.unit}/s"
+        if rate and self.done < self.total:
+            line += f", eta {(self.total - self.done) / rate:.0f}s"
+        print(line, file=sys.stderr)
+
+
+def get_output_tables(report):
+    """markdown tables of the output counts of a report, the "Parser Output Counts" tables of the README
+
+    :param report: report dictionary of BuildMetrics.to_dict()
+    :return: markdown str
+    """
+    predicates = defaultdict(dict)
+    for name, value in report["counters"].items():
+        if name.startswith("output."):
+            predicate, _, key = name[len("output.") :].rpartition(".")
+            predicates[predicate][key] = value
+
+    lines = []
+    for predicate, counts in sorted(predicates.items()):
+        if "docs" not in counts:
+            continue
+        lines.append(f"| {predicate} | subject | Number of records | object | Number of records |")
+        lines.append("|:--:|:--:|:--:|:--:|:--:|")
+        subjects = [(field, counts[f"subject_{field}"]) for field in OUTPUT_ID_FIELDS if f"subject_{field}" in counts]
+        objects = [(field, counts[f"object_{field}"]) for field in OUTPUT_ID_FIELDS if f"object_{field}" in counts]
+        for i in range(max(len(subjects), len(objects), 1)):
+            cells = [f"{counts['docs']:,}" if i == 0 else ""]
+            for role_counts in (subjects, objects):
+                cells.extend((role_counts[i][0], f"{role_counts[i][1]:,}") if i < len(role_counts) else ("", ""))
+            lines.append(f"| {' | '.join(cells)} |")
+        lines.append("")
+    lines.append(f"Total records: {report['counters'].get('load_data.docs', 0):,}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python ttd_metrics.py ttd_build_metrics.json prints the README output tables of a build
+    with open(sys.argv[1]) as in_f:
+        print(get_output_tables(json.load(in_f)))
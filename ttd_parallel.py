@@ -0,0 +1,92 @@
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import TTD_parser
+from ttd_metrics import metrics
+from ttd_sort import ExternalSorter, merge_runs
+
+# BuildContext of the worker process, set once by the pool initializer
+worker_context = None
+
+
+def init_worker(context):
+    global worker_context
+    worker_context = context
+
+
+def run_loader(loader_name, kwargs):
+    """run one loader (or shard of a loader) in a worker process and sort its output by _id
+
+    :param loader_name: name of the loader function in TTD_parser
+    :param kwargs: extra keyword arguments of the loader
+    :return: (list of sorted run files, merged and removed by the parent process, metrics snapshot of the task)
+    """
+    # a worker runs several tasks, each task reports its own metrics
+    metrics.reset()
+    loader = getattr(TTD_parser, loader_name)
+    sorter = ExternalSorter(key="_id")
+    sorter.extend(metrics.iter_stage(loader_name, loader(worker_context.file_path, worker_context, **kwargs)))
+    return sorter.dump(), metrics.snapshot()
+
+
+def get_tasks(shards, loaders=None):
+    """loader tasks in the order load_data chains them
+    the P1-09 activity part of merge_drug_target is split in shards byte ranges,
+    tasks of the "drug_target" dedup group are deduplicated together like in merge_drug_target
+
+    :param shards: number of P1-09 shards
+    :param loaders: names of the load_data loaders to run, all if None
+    :return: list of (loader name, loader kwargs, dedup group or None, load_data loader)
+    """
+    tasks = [
+        ("load_drug_dis_data", {}, None, "load_drug_dis_data"),
+        ("load_target_dis_data", {}, None, "load_target_dis_data"),
+        ("load_biomarker_dis_data", {}, None, "load_biomarker_dis_data"),
+        ("load_drug_target", {}, "drug_target", "merge_drug_target"),
+    ]
+    for shard in range(shards):
+        tasks.append(("load_drug_target_act", {"shard": (shard, shards)}, "drug_target", "merge_drug_target"))
+    if loaders is not None:
+        tasks = [task for task in tasks if task[3] in loaders]
+    return tasks
+
+
+def label_run(run_files, group, output):
+    """sorted documents of one task with its dedup group and load_data loader"""
+    for doc in merge_runs(run_files, "_id"):
+        yield doc, group, output
+
+
+def parallel_load(context, workers, loaders=None):
+    """run the loaders in a process pool and merge their sorted outputs
+    the documents are yielded in the same order as sorted(chain(loaders), key=_id):
+    every worker output is sorted stably and heapq.merge keeps the task order for equal _ids,
+    so the first document of an _id within a dedup group is the one merge_drug_target keeps
+
+    :param context: BuildContext, its lookups are computed before the pool starts
+    :param workers: number of worker processes
+    :param loaders: names of the load_data loaders to run, all if None
+    :return: generator of (load_data loader, document) sorted by _id
+    """
+    context.load_all()
+    tasks = get_tasks(shards=workers, loaders=loaders)
+
+    with metrics.stage("parallel_load"):
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(context,)) as executor:
+            futures = [executor.submit(run_loader, loader_name, kwargs) for loader_name, kwargs, _, _ in tasks]
+            task_runs = []
+            for future in futures:
+                run_files, snapshot = future.result()
+                task_runs.append(run_files)
+                metrics.merge(snapshot)
+
+    streams = [label_run(run_files, group, output) for run_files, (_, _, group, output) in zip(task_runs, tasks)]
+    last_ids = {}
+    for doc, group, output in heapq.merge(*streams, key=lambda item: item[0]["_id"]):
+        if group:
+            if last_ids.get(group) == doc["_id"]:
+                metrics.count(f"{group}.duplicates")
+                continue
+            last_ids[group] = doc["_id"]
+        yield output, doc
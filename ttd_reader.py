@@ -0,0 +1,285 @@
+import csv
+import gzip
+import io
+import lzma
+import os
+import re
+
+# read buffer of the source files, compressed or not
+BLOCK_SIZE = 1 << 20
+# suffixes of the compressed copies of a source file, in the order they are looked for
+COMPRESSION_SUFFIXES = (".gz", ".zst", ".xz")
+
+
+def get_source_file(file_path, file_name):
+    """path of a source file or of its compressed copy, the uncompressed file wins
+
+    :param file_path: directory stores the downloaded data files
+    :param file_name: name of the source file, e.g. "P1-01-TTD_target_download.txt"
+    :return: path of the file, e.g. ".../P1-01-TTD_target_download.txt.gz"
+    """
+    for suffix in ("",) + COMPRESSION_SUFFIXES:
+        datafile = os.path.join(file_path, file_name + suffix)
+        if os.path.exists(datafile):
+            return datafile
+    raise FileNotFoundError(f"{file_name} or a compressed copy ({', '.join(COMPRESSION_SUFFIXES)}) in {file_path}")
+
+
+def get_compression(datafile):
+    """COMPRESSION_SUFFIXES suffix of a file or None if it is not compressed"""
+    suffix = os.path.splitext(datafile)[1]
+    return suffix if suffix in COMPRESSION_SUFFIXES else None
+
+
+class SourceReader(io.BufferedReader):
+    """
+    The SourceReader object buffers the decompressed stream of a compressed source file
+    and closes the compressed file together with the stream
+
+    :param stream: decompressing file object
+    :param compressed_file: file object of the compressed file
+    """
+
+    def __init__(self, stream, compressed_file):
+        super().__init__(stream, BLOCK_SIZE)
+        self.compressed_file = compressed_file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.compressed_file.close()
+
+
+def open_source(datafile, mode="rt"):
+    """open a source file, a compressed copy is decompressed while it is read
+    the file is read through BLOCK_SIZE buffers, so network storage sees few large reads
+
+    :param datafile: path of the file, see get_source_file()
+    :param mode: "rt" or "rb"
+    :return: file object
+    """
+    compression = get_compression(datafile)
+    in_f = open(datafile, "rb", buffering=BLOCK_SIZE)
+    if compression == ".gz":
+        in_f = SourceReader(gzip.GzipFile(fileobj=in_f, mode="rb"), in_f)
+    elif compression == ".xz":
+        in_f = SourceReader(lzma.LZMAFile(in_f), in_f)
+    elif compression == ".zst":
+        import zstandard
+
+        in_f = SourceReader(zstandard.ZstdDecompressor().stream_reader(in_f, read_size=BLOCK_SIZE), in_f)
+    return io.TextIOWrapper(in_f) if mode == "rt" else in_f
+
+
+def get_data_size(datafile):
+    """size of the content of a source file
+    the size of a compressed copy is read from the gzip trailer or the zstd frame header,
+    otherwise it is counted by decompressing the file once
+
+    :param datafile: path of the file, see get_source_file()
+    :return: bytes
+    """
+    compression = get_compression(datafile)
+    if compression is None:
+        return os.path.getsize(datafile)
+    with open(datafile, "rb") as in_f:
+        if compression == ".gz":
+            # ISIZE, the size modulo 2**32 of the last gzip member
+            in_f.seek(-4, os.SEEK_END)
+            return int.from_bytes(in_f.read(4), "little")
+        if compression == ".zst":
+            import zstandard
+
+            content_size = zstandard.frame_content_size(in_f.read(18))
+            if content_size >= 0:
+                return content_size
+    with open_source(datafile, "rb") as in_f:
+        return sum(len(block) for block in iter(lambda: in_f.read(BLOCK_SIZE), b""))
+
+
+def get_shard_range(datafile, shard, shards):
+    """byte range [start, end) of one shard of a file split in shards equal parts,
+    the last shard reaches to the end of the file
+
+    :param datafile: path of the file
+    :param shard: shard index, 0 <= shard < shards
+    :param shards: number of shards
+    :return: (start, end) byte offsets of the content, end is None for the last shard
+    """
+    size = get_data_size(datafile)
+    return size * shard // shards, size * (shard + 1) // shards if shard < shards - 1 else None
+
+
+def read_shard(datafile, shard, shards, header=1):
+    """read the complete rows of one shard of a file split in shards equal byte ranges
+    a row belongs to the shard its first byte lies in, the header rows are dropped from the first shard
+    a compressed file is decompressed up to the end of the shard
+
+    :param datafile: path of the file
+    :param shard: shard index, 0 <= shard < shards
+    :param shards: number of shards
+    :param header: number of header rows to skip
+    :return: io.BytesIO of the rows, e.g. for ttd_columnar.read_tab_columns()
+    """
+    start, end = get_shard_range(datafile, shard, shards)
+
+    with open_source(datafile, "rb") as in_f:
+        if start:
+            # skip the rest of the row started in the previous shard
+            if get_compression(datafile) is None:
+                in_f.seek(start - 1)
+            else:
+                for _ in range((start - 1) // BLOCK_SIZE):
+                    in_f.read(BLOCK_SIZE)
+                in_f.read((start - 1) % BLOCK_SIZE)
+            in_f.readline()
+        else:
+            for _ in range(header):
+                in_f.readline()
+        if end is None:
+            return io.BytesIO(in_f.read())
+        position = in_f.tell()
+        if position >= end:
+            return io.BytesIO()
+        rows = in_f.read(end - position)
+        if not rows.endswith(b"\n"):
+            # complete the last row, it started in this shard
+            rows += in_f.readline()
+    return io.BytesIO(rows)
+
+
+def iter_tab_rows(datafile, header=1, sep="\t"):
+    """rows of a tab separated source file split like biothings.utils.dataload.tabfile_feeder
+
+    :param datafile: path of the file, see get_source_file()
+    :param header: number of header rows to skip
+    :return: generator of lists of str
+    """
+    with open_source(datafile) as in_f:
+        reader = csv.reader(in_f, delimiter=sep)
+        for _ in range(header):
+            next(reader, None)
+        yield from reader
+
+
+# lines of dashes/underscores/equal signs closing the header of the TTD text files
+SEPARATOR_PATTERN = re.compile(r"^\s*[-_=~*]{10,}\s*$")
+
+
+def split_row(line, sep="\t"):
+    """split one row like csv.reader, rows without a quote take the str.split fast path"""
+    line = line.rstrip("\n")
+    if '"' in line:
+        return next(csv.reader([line], delimiter=sep))
+    return line.split(sep)
+
+
+class BlockRecordReader:
+    """
+    The BlockRecordReader object reads the TTD text files made of one block of rows per entity,
+    "ID / KEY / VALUE" rows (key_column=1) or "KEY / VALUE" rows (key_column=0), e.g.
+    T47101  TARGETID  T47101
+    T47101  TARGNAME  Vitamin D receptor (VDR)
+    The header is detected automatically: the data starts at the first row of start_key after
+    the last separator line of the first header_window rows, or at the first row of start_key.
+    The file is read through a large buffer and the rows are dispatched through a key table,
+    rows of other keys are skipped before their values are split.
+    Every entity is yielded as a list of (field, value) pairs in file order, starting with start_key,
+    so dict(record) keeps the last value of a repeated key
+
+    :param datafile: path of the file, gzip/zstd/xz copies are decompressed while they are read
+    :type datafile: str
+    :param start_key: key of the first row of every block, e.g. "TARGETID"
+    :type start_key: str
+    :param fields: dictionary {key: field name} of the rows to read, start_key included
+    :type fields: dict
+    :param key_column: column of the key
+    :type key_column: int
+    :param value_columns: number of value columns kept per row, 1 gives the value str, more a list of str
+    :type value_columns: int
+    :param header: number of header rows to skip instead of detecting them
+    :type header: int
+    :param header_window: number of leading rows searched for the header separator line
+    :type header_window: int
+    """
+
+    def __init__(
+        self, datafile, start_key, fields, key_column=1, value_columns=1, header=None, header_window=200, sep="\t"
+    ):
+        assert start_key in fields
+        self.datafile = datafile
+        self.start_key = start_key
+        self.key_table = dict(fields)
+        self.key_column = key_column
+        self.value_columns = value_columns
+        self.header = header
+        self.header_window = header_window
+        self.sep = sep
+
+    def get_key(self, line):
+        """key of a row without splitting the whole row"""
+        fields = line.split(self.sep, self.key_column + 1)
+        return fields[self.key_column].strip() if len(fields) > self.key_column else None
+
+    def get_data_start(self, lines):
+        """index of the first data row among the leading rows of the file
+
+        :param lines: list of the leading rows
+        :return: index or None if no data row was found
+        """
+        if self.header is not None:
+            return self.header
+        last_separator = -1
+        for index, line in enumerate(lines):
+            if SEPARATOR_PATTERN.match(line):
+                last_separator = index
+        for index in range(last_separator + 1, len(lines)):
+            if self.get_key(lines[index]) == self.start_key:
+                return index
+        return None
+
+    def iter_lines(self, in_f):
+        """rows of the file from the first data row on"""
+        head = []
+        for line in in_f:
+            head.append(line)
+            if len(head) >= max(self.header_window, self.header or 0):
+                break
+        start = self.get_data_start(head)
+        if start is not None:
+            yield from head[start:]
+            yield from in_f
+        else:
+            # the header is longer than the window: the data starts at the first start_key row
+            for line in in_f:
+                if self.get_key(line) == self.start_key:
+                    yield line
+                    break
+            yield from in_f
+
+    def __iter__(self):
+        key_table, key_column, value_columns, sep = self.key_table, self.key_column, self.value_columns, self.sep
+        start_field = key_table[self.start_key]
+        record = None
+
+        with open_source(self.datafile) as in_f:
+            for line in self.iter_lines(in_f):
+                fields = line.split(sep, key_column + 1)
+                if len(fields) <= key_column + 1:
+                    continue
+                field = key_table.get(fields[key_column].strip())
+                if field is None:
+                    continue
+
+                values = split_row(fields[key_column + 1], sep)
+                value = values[0] if value_columns == 1 else values[:value_columns]
+                if field == start_field:
+                    if record:
+                        yield record
+                    record = [(field, value)]
+                elif record is not None:
+                    record.append((field, value))
+
+        if record:
+            yield record
@@ -0,0 +1,127 @@
+import heapq
+import os
+import pickle
+import tempfile
+from operator import itemgetter
+
+# memory budget of the sorted runs kept in memory before they are spilled to temporary files
+SORT_MEMORY_MB = float(os.environ.get("TTD_SORT_MEMORY_MB", 256))
+SORT_TMP_DIR = os.environ.get("TTD_SORT_TMP_DIR")
+
+
+class ExternalSorter:
+    """
+    The ExternalSorter object sorts documents by key with a bounded memory footprint
+    Documents are kept pickled in memory, when the pickled size reaches the memory budget
+    the run is sorted and spilled to a temporary file, the runs are k-way merged on iteration
+    The sort is stable like sorted(): documents with the same key keep their insertion order
+
+    :param key: document key to sort on
+    :type key: str
+    :param memory_budget: bytes of pickled documents kept in memory
+    :type memory_budget: int
+    :param tmp_dir: directory of the spilled runs, defaults to the system temporary directory
+    :type tmp_dir: str
+    """
+
+    def __init__(self, key="_id", memory_budget=SORT_MEMORY_MB * 1024 * 1024, tmp_dir=SORT_TMP_DIR):
+        self.key = key
+        self.memory_budget = memory_budget
+        self.tmp_dir = tmp_dir
+        self.run = []
+        self.run_size = 0
+        self.run_files = []
+
+    def add(self, doc):
+        blob = pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL)
+        self.run.append((doc[self.key], blob))
+        self.run_size += len(blob)
+        if self.run_size >= self.memory_budget:
+            self.spill()
+
+    def extend(self, docs):
+        for doc in docs:
+            self.add(doc)
+
+    def spill(self):
+        """sort the in-memory run and write it to a temporary file as concatenated pickles"""
+        self.run.sort(key=itemgetter(0))
+        with tempfile.NamedTemporaryFile("wb", prefix="ttd_sort_", suffix=".run", dir=self.tmp_dir, delete=False) as f:
+            for _, blob in self.run:
+                f.write(blob)
+        self.run_files.append(f.name)
+        self.run = []
+        self.run_size = 0
+
+    def __iter__(self):
+        """yield the documents in key order and remove the spilled runs afterwards"""
+        self.run.sort(key=itemgetter(0))
+        memory_run = (pickle.loads(blob) for _, blob in self.run)
+        try:
+            if not self.run_files:
+                yield from memory_run
+            else:
+                yield from merge_runs(self.run_files, self.key, memory_run)
+        finally:
+            self.cleanup()
+
+    def dump(self):
+        """spill the remaining documents and hand the run files over,
+        e.g. from a worker process to the process merging them with merge_runs()
+
+        :return: list of run files in creation order
+        """
+        if self.run:
+            self.spill()
+        run_files, self.run_files = self.run_files, []
+        return run_files
+
+    def cleanup(self):
+        for run_file in self.run_files:
+            if os.path.exists(run_file):
+                os.remove(run_file)
+        self.run_files = []
+        self.run = []
+        self.run_size = 0
+
+
+def read_run(run_file):
+    with open(run_file, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def merge_runs(run_files, key="_id", *more_runs):
+    """k-way merge of sorted run files, the files are removed once the merge is done or closed
+    runs are merged in the given order, so heapq.merge keeps the sort stable
+
+    :param run_files: list of run files written by ExternalSorter
+    :param key: document key the runs are sorted on
+    :param more_runs: sorted iterables merged after the run files
+    :return: generator of the merged documents
+    """
+    runs = [read_run(run_file) for run_file in run_files]
+    try:
+        yield from heapq.merge(*runs, *more_runs, key=itemgetter(key))
+    finally:
+        for run in runs:
+            run.close()
+        for run_file in run_files:
+            if os.path.exists(run_file):
+                os.remove(run_file)
+
+
+def external_sort(docs, key="_id", memory_budget=SORT_MEMORY_MB * 1024 * 1024):
+    """stable sort of a document stream with a bounded memory footprint
+
+    :param docs: iterable of documents
+    :param key: document key to sort on
+    :param memory_budget: bytes of pickled documents kept in memory
+    :return: generator of the sorted documents
+    """
+    sorter = ExternalSorter(key=key, memory_budget=memory_budget)
+    sorter.extend(docs)
+    yield from sorter
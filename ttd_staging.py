@@ -0,0 +1,274 @@
+import json
+import os
+import sqlite3
+import time
+from collections.abc import Mapping
+from itertools import groupby
+from operator import itemgetter
+
+from ttd_metrics import metrics
+
+# 1 stages the parsed source files in sqlite tables and streams the loaders from sql joins
+STAGING = os.environ.get("TTD_STAGING", "0") == "1"
+STAGING_FILE = "ttd_staging.sqlite"
+# megabytes of P1-09-Target_compound_activity.txt parsed at once while it is staged
+STAGING_CHUNK_MB = float(os.environ.get("TTD_STAGING_CHUNK_MB", 64))
+# rows inserted per executemany
+INSERT_BATCH_SIZE = 10000
+
+# columns of the staged tables, every table also has the row number seq in source file order
+STAGED_TABLES = {
+    "targets": ("targ_id", "info"),
+    "drugs": ("drug_id", "info"),
+    "drug_indications": ("drug_id", "drug_name", "icd11", "status", "disease"),
+    "target_indications": ("targ_id", "targ_name", "icd11", "status", "disease"),
+    "biomarkers": ("biomarker_id", "disease_name", "icd11_line", "icd10_line", "icd9_line", "name", "symbol"),
+    "drug_targets": ("targ_id", "drug_id", "highest_status", "moa"),
+    "activities": ("targ_id", "drug_id", "pubchem_cid", "activity_type", "activity_value"),
+}
+# index of the join and lookup columns of every table
+STAGED_INDEXES = {
+    "targets": ("targ_id",),
+    "drugs": ("drug_id",),
+    "drug_indications": ("drug_id", "drug_name", "icd11"),
+    "target_indications": ("targ_id", "targ_name", "icd11"),
+    "drug_targets": ("targ_id", "drug_id"),
+    "activities": ("targ_id", "drug_id"),
+}
+
+
+def get_staging_path(file_path):
+    """location of the staging store, next to the mapping cache
+
+    :param file_path: directory stores the downloaded data files
+    :return: path of the sqlite file
+    """
+    return os.path.join(os.environ.get("TTD_CACHE_DIR", file_path), STAGING_FILE)
+
+
+class StagingStore:
+    """
+    The StagingStore object keeps the parsed source files in indexed sqlite tables,
+    so the loaders stream their edges from sql joins instead of joining python dictionaries in memory
+    Every table is bulk loaded in one transaction together with the signature of its source files,
+    a table whose signature did not change is reused by the next build.
+    The connection is opened per process, worker processes of load_data read the same file
+
+    :param db_path: path of the sqlite file
+    :type db_path: str
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._pid = None
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS staged (name TEXT PRIMARY KEY, signature TEXT, rows INTEGER, updated REAL)"
+            )
+
+    def __getstate__(self):
+        return {"db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.db_path = state["db_path"]
+        self._conn = None
+        self._pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def conn(self):
+        # a sqlite connection must not be shared with a forked process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path)
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def is_staged(self, table, signature):
+        """
+        :param table: name of a STAGED_TABLES table
+        :param signature: signature of the source files of the table, None is never reused
+        :return: True if the table was staged from the same source files
+        """
+        if signature is None:
+            return False
+        row = self.conn.execute("SELECT signature FROM staged WHERE name = ?", (table,)).fetchone()
+        return row is not None and row[0] == signature
+
+    def stage(self, table, rows, signature=None):
+        """replace a table by the rows of its source files in one transaction
+
+        :param table: name of a STAGED_TABLES table
+        :param rows: iterable of tuples with the STAGED_TABLES columns of the table
+        :param signature: signature of the source files, see is_staged()
+        :return: number of staged rows
+        """
+        columns = STAGED_TABLES[table]
+        insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        count = 0
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"CREATE TABLE {table} (seq INTEGER PRIMARY KEY, {', '.join(columns)})")
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self.conn.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+            self.conn.executemany(insert, batch)
+            count += len(batch)
+            if table in STAGED_INDEXES:
+                self.conn.execute(f"CREATE INDEX {table}_key ON {table} ({', '.join(STAGED_INDEXES[table])})")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO staged (name, signature, rows, updated) VALUES (?, ?, ?, ?)",
+                (table, signature, count, time.time()),
+            )
+        metrics.count(f"staging.{table}.rows", count)
+        return count
+
+    def get_info(self, table, key):
+        """info json of a "targets" or "drugs" key, the last row of a repeated key wins like in a dictionary
+
+        :return: dictionary or None if the key is not staged
+        """
+        key_column = STAGED_TABLES[table][0]
+        row = self.conn.execute(
+            f"SELECT info FROM {table} WHERE {key_column} = ? ORDER BY seq DESC LIMIT 1", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_keys(self, table):
+        """unique keys of a "targets" or "drugs" table in the order of their first row"""
+        key_column = STAGED_TABLES[table][0]
+        for (key,) in self.conn.execute(f"SELECT {key_column} FROM {table} GROUP BY {key_column} ORDER BY min(seq)"):
+            yield key
+
+    def count_keys(self, table):
+        key_column = STAGED_TABLES[table][0]
+        return self.conn.execute(f"SELECT count(DISTINCT {key_column}) FROM {table}").fetchone()[0]
+
+    def iter_trials(self, table):
+        """indications of a "drug_indications" or "target_indications" table grouped by (id, name, icd11)
+        the groups come in the order of their first row and keep their rows in file order.
+        The rows of an entity must be one block like for TTD_parser.iter_trial_groups(),
+        so a staged build fails on the same files as an in-memory one
+
+        :param table: table name
+        :return: generator of ((id, name, icd11), list of {"status": status, "disease": name})
+        :raise ValueError: the indications of an entity are split in several blocks
+        """
+        id_column, name_column = STAGED_TABLES[table][:2]
+        # the seq of the rows of an entity block are consecutive
+        split = self.conn.execute(
+            f"SELECT {id_column} FROM {table} GROUP BY {id_column}"
+            " HAVING max(seq) - min(seq) + 1 != count(*) ORDER BY min(seq) LIMIT 1"
+        ).fetchone()
+        if split is not None:
+            raise ValueError(f"{table}: the indications of {split[0]} are split in several blocks")
+
+        key = f"{id_column}, {name_column}, icd11"
+        rows = self.conn.execute(
+            f"SELECT i.{id_column}, i.{name_column}, i.icd11, i.status, i.disease FROM {table} i"
+            f" JOIN (SELECT {key}, min(seq) AS first_seq FROM {table} GROUP BY {key}) g USING ({key})"
+            " ORDER BY g.first_seq, i.seq"
+        )
+        for group_key, group_rows in groupby(rows, key=itemgetter(0, 1, 2)):
+            yield group_key, [{"status": row[3], "disease": row[4]} for row in group_rows]
+
+    def iter_biomarkers(self):
+        """
+        :return: generator of (biomarker_id, disease name, icd11 line, icd10 line, icd9 line, name, symbol)
+                 in file order
+        """
+        rows = self.conn.execute(
+            "SELECT biomarker_id, disease_name, icd11_line, icd10_line, icd9_line, name, symbol"
+            " FROM biomarkers ORDER BY seq"
+        )
+        for row in rows:
+            yield row[:5] + (json.loads(row[5]), json.loads(row[6]))
+
+    def get_shard_range(self, table, shard, shards):
+        """seq range [start, end) of one of shards equal parts of a table"""
+        first, last = self.conn.execute(f"SELECT min(seq), max(seq) FROM {table}").fetchone()
+        if first is None:
+            return 0, 0
+        size = last - first + 1
+        return first + size * shard // shards, first + size * (shard + 1) // shards
+
+    def iter_activity_rows(self, shard=None):
+        """activity rows left joined with the last drug_targets row of their (TargetID, DrugID) pair
+
+        :param shard: (index, count) to read only one of count consecutive parts of the rows
+        :return: generator of ((TargetID, DrugID, Pubchem_CID, activity type, activity value),
+                 {"trial_status": status, "moa": moa} or None)
+        """
+        start, end = self.get_shard_range("activities", *shard) if shard else (0, None)
+        query = (
+            "SELECT a.targ_id, a.drug_id, a.pubchem_cid, a.activity_type, a.activity_value,"
+            " p.seq IS NOT NULL, p.highest_status, p.moa FROM activities a"
+            " LEFT JOIN drug_targets p ON p.seq ="
+            " (SELECT max(seq) FROM drug_targets WHERE targ_id = a.targ_id AND drug_id = a.drug_id)"
+        )
+        if end is None:
+            rows = self.conn.execute(f"{query} ORDER BY a.seq")
+        else:
+            rows = self.conn.execute(f"{query} WHERE a.seq >= ? AND a.seq < ? ORDER BY a.seq", (start, end))
+        for row in rows:
+            pair = {"trial_status": row[6].lower(), "moa": row[7].lower()} if row[5] else None
+            yield row[:5], pair
+
+    def iter_drug_target_pairs(self):
+        """unique (TargetID, DrugID) pairs of the drug_targets rows"""
+        return self.conn.execute("SELECT DISTINCT targ_id, drug_id FROM drug_targets")
+
+    def iter_unpaired_drug_targets(self):
+        """anti-join: drug_targets rows whose pair has no activity row, in file order
+
+        :return: cursor of (TargetID, DrugID, Highest_status, MOA)
+        """
+        return self.conn.execute(
+            "SELECT d.targ_id, d.drug_id, d.highest_status, d.moa FROM drug_targets d WHERE NOT EXISTS"
+            " (SELECT 1 FROM activities a WHERE a.targ_id = d.targ_id AND a.drug_id = d.drug_id) ORDER BY d.seq"
+        )
+
+
+class StagedLookup(Mapping):
+    """
+    The StagedLookup object is a read-only dictionary {key: info} over the "targets" or "drugs" table,
+    used by the NodeRegistry in place of the in-memory target_info and drug_mapping_info
+
+    :param store: StagingStore
+    :type store: StagingStore
+    :param table: "targets" or "drugs"
+    :type table: str
+    """
+
+    def __init__(self, store, table):
+        self.store = store
+        self.table = table
+
+    def __getitem__(self, key):
+        info = self.store.get_info(self.table, key)
+        if info is None:
+            raise KeyError(key)
+        return info
+
+    def __contains__(self, key):
+        return self.store.get_info(self.table, key) is not None
+
+    def __iter__(self):
+        return self.store.iter_keys(self.table)
+
+    def __len__(self):
+        return self.store.count_keys(self.table)
@@ -1,4 +1,19 @@
 def get_release(self):
-    # hard-coded release version from TTD data file
-    return "8.1.01"
+    """release derived from the source files on the TTD server
+    the ETag/Last-Modified/Content-Length of every data_url file are hashed,
+    so a new release is dumped as soon as one of the files changes, e.g. "2024-01-10-3fa2c1d0"
+    TTDDumper passes the validators of its HEAD requests, they are also kept in the checksum manifest
+    of the data folder, see ttd_download
+    biothings copies this function into the dumper class, imports stay inside it
+    """
+    from ttd_download import IDENTITY_HEADERS, get_download_urls, get_manifest_release, get_validators
 
+    remote_files = getattr(self, "remote_files", None)
+    if remote_files is None:
+        remote_files = {
+            url: get_validators(
+                self.client.head(url, allow_redirects=True, timeout=60, headers=IDENTITY_HEADERS).headers
+            )
+            for url in get_download_urls(self.__class__.SRC_URLS)
+        }
+    return get_manifest_release(remote_files)